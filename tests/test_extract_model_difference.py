@@ -0,0 +1,109 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pytest
+
+torch = pytest.importorskip("torch")
+safetensors_torch = pytest.importorskip("safetensors.torch")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+from extract_model_difference import DELTA_FORMATS, encode_delta_tensor, decode_delta_tensor, delta_entry_plan, extract_model_differences
+from apply_model_difference import apply_model_difference
+
+
+class TestDeltaEncoding(unittest.TestCase):
+    SHAPES = [(64, 48), (32, 16, 3, 3), (40,)]
+
+    def test_entry_plan_matches_encoded_entries(self):
+        torch.manual_seed(0)
+        for delta_format in DELTA_FORMATS:
+            for shape in self.SHAPES:
+                for save_dtype in (torch.float32, torch.float16):
+                    delta = torch.randn(shape)
+                    entries = encode_delta_tensor("w", delta, delta_format, save_dtype, topk_ratio=0.05, delta_rank=4)
+                    plan = delta_entry_plan("w", shape, delta_format, save_dtype, topk_ratio=0.05, delta_rank=4)
+                    self.assertEqual([name for name, _, _ in plan], list(entries), (delta_format, shape))
+                    for name, dtype, planned_shape in plan:
+                        self.assertEqual(entries[name].dtype, dtype, (delta_format, shape, name))
+                        self.assertEqual(list(entries[name].shape), planned_shape, (delta_format, shape, name))
+
+    def test_round_trip(self):
+        torch.manual_seed(0)
+        delta = torch.randn(64, 48)
+        decode = lambda entries: decode_delta_tensor("w", entries.__getitem__, list(entries))
+
+        self.assertTrue(torch.equal(decode(encode_delta_tensor("w", delta, "float", torch.float32)), delta))
+        # keeping every element is exact
+        self.assertTrue(torch.equal(decode(encode_delta_tensor("w", delta, "topk", torch.float32, topk_ratio=1.0)), delta))
+        # int8 is off by at most half a quantization step per output channel
+        step = delta.abs().amax(dim=1, keepdim=True) / 127.0
+        self.assertTrue(bool(((decode(encode_delta_tensor("w", delta, "int8", torch.float32)) - delta).abs() <= step / 2 + 1e-6).all()))
+        # a full-rank factorization leaves (almost) nothing to the sparse residual
+        rebuilt = decode(encode_delta_tensor("w", delta, "lowrank_sparse", torch.float32, topk_ratio=0.01, delta_rank=48))
+        torch.testing.assert_close(rebuilt, delta, atol=1e-4, rtol=1e-4)
+        # a partial top-k keeps exactly the largest-magnitude elements
+        sparse = decode(encode_delta_tensor("w", delta, "topk", torch.float32, topk_ratio=0.1))
+        kept = sparse != 0
+        self.assertEqual(int(kept.sum()), 308)
+        self.assertGreaterEqual(float(delta[kept].abs().min()), float(delta[~kept].abs().max()))
+
+
+class TestExtractApplySmoke(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        torch.manual_seed(0)
+        base = {
+            "a.weight": torch.randn(64, 48),
+            "b.weight": torch.randn(16, 8, 3, 3).half(),
+            "b.bias": torch.randn(16),
+            "same.weight": torch.randn(8, 8),
+            "steps": torch.arange(4, dtype=torch.int64),
+        }
+        self.finetuned = {k: (v + 0.1 * torch.randn_like(v) if v.is_floating_point() else v) for k, v in base.items()}
+        self.finetuned["same.weight"] = base["same.weight"]
+        self.finetuned["new.weight"] = torch.randn(4, 4)
+        self.base_path = self.path("base.safetensors")
+        self.finetuned_path = self.path("finetuned.safetensors")
+        safetensors_torch.save_file(base, self.base_path)
+        safetensors_torch.save_file(self.finetuned, self.finetuned_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def test_float_delta_round_trip(self):
+        result = extract_model_differences(self.base_path, self.finetuned_path, self.path("delta.safetensors"), workers=2)
+        self.assertIsNotNone(result)
+        self.assertEqual(result["diffed"], 3)
+        self.assertEqual(result["identical"], 2)
+        self.assertEqual(result["unique_to_finetuned"], 1)
+        self.assertEqual(result["skipped"], 0)
+
+        apply_model_difference(self.base_path, self.path("delta.safetensors"), self.path("merged.safetensors"))
+        merged = safetensors_torch.load_file(self.path("merged.safetensors"))
+        self.assertEqual(set(merged), set(self.finetuned))
+        for key, tensor in self.finetuned.items():
+            self.assertEqual(merged[key].dtype, tensor.dtype, key)
+            torch.testing.assert_close(merged[key], tensor, atol=1e-5, rtol=1e-5, msg=key)
+
+    def test_compressed_formats_round_trip(self):
+        for delta_format in DELTA_FORMATS[1:]:
+            delta_path = self.path(f"delta_{delta_format}.safetensors")
+            result = extract_model_differences(self.base_path, self.finetuned_path, delta_path, delta_format=delta_format,
+                                               topk_ratio=0.5, delta_rank=4, workers=2)
+            self.assertIsNotNone(result, delta_format)
+            errors = apply_model_difference(self.base_path, delta_path, self.path("merged.safetensors"),
+                                            verify_model_path=self.finetuned_path)
+            self.assertEqual(set(errors), {"a.weight", "b.weight", "b.bias"}, delta_format)
+            for key, error in errors.items():
+                # the apply-side error matches what extraction reported (up to the cast to the base dtype)
+                self.assertAlmostEqual(error, result["errors"][key], delta=2e-3, msg=(delta_format, key))
+                self.assertLess(error, 0.75, (delta_format, key))
+
+
+if __name__ == '__main__':
+    unittest.main()
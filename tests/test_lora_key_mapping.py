@@ -0,0 +1,101 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+from lora_key_mapping import ldm_lora_name, unet_lora_targets, text_encoder_lora_targets
+
+U = "model.diffusion_model."
+
+# checkpoint key -> sd-scripts LoRA name
+SD1_UNET = {
+    U + "time_embed.0.weight": "lora_unet_time_embedding_linear_1",
+    U + "input_blocks.0.0.weight": "lora_unet_conv_in",
+    U + "input_blocks.1.0.in_layers.2.weight": "lora_unet_down_blocks_0_resnets_0_conv1",
+    U + "input_blocks.1.1.proj_in.weight": "lora_unet_down_blocks_0_attentions_0_proj_in",
+    U + "input_blocks.1.1.transformer_blocks.0.attn1.to_q.weight": "lora_unet_down_blocks_0_attentions_0_transformer_blocks_0_attn1_to_q",
+    U + "input_blocks.2.1.transformer_blocks.0.attn2.to_out.0.weight": "lora_unet_down_blocks_0_attentions_1_transformer_blocks_0_attn2_to_out_0",
+    U + "input_blocks.3.0.op.weight": "lora_unet_down_blocks_0_downsamplers_0_conv",
+    U + "input_blocks.4.0.skip_connection.weight": "lora_unet_down_blocks_1_resnets_0_conv_shortcut",
+    U + "middle_block.0.emb_layers.1.weight": "lora_unet_mid_block_resnets_0_time_emb_proj",
+    U + "middle_block.1.proj_out.weight": "lora_unet_mid_block_attentions_0_proj_out",
+    U + "middle_block.2.out_layers.3.weight": "lora_unet_mid_block_resnets_1_conv2",
+    U + "output_blocks.2.1.conv.weight": "lora_unet_up_blocks_0_upsamplers_0_conv",
+    U + "output_blocks.3.1.transformer_blocks.0.ff.net.2.weight": "lora_unet_up_blocks_1_attentions_0_transformer_blocks_0_ff_net_2",
+    U + "output_blocks.4.0.out_layers.3.weight": "lora_unet_up_blocks_1_resnets_1_conv2",
+    U + "output_blocks.5.2.conv.weight": "lora_unet_up_blocks_1_upsamplers_0_conv",
+    U + "out.2.weight": "lora_unet_conv_out",
+}
+SDXL_UNET = {
+    U + "label_emb.0.0.weight": "lora_unet_add_embedding_linear_1",
+    U + "input_blocks.4.1.transformer_blocks.1.attn1.to_out.0.weight": "lora_unet_down_blocks_1_attentions_0_transformer_blocks_1_attn1_to_out_0",
+    U + "input_blocks.8.1.transformer_blocks.9.ff.net.0.proj.weight": "lora_unet_down_blocks_2_attentions_1_transformer_blocks_9_ff_net_0_proj",
+    U + "middle_block.1.transformer_blocks.0.attn2.to_k.weight": "lora_unet_mid_block_attentions_0_transformer_blocks_0_attn2_to_k",
+    U + "output_blocks.2.2.conv.weight": "lora_unet_up_blocks_0_upsamplers_0_conv",
+    U + "output_blocks.5.1.proj_out.weight": "lora_unet_up_blocks_1_attentions_2_proj_out",
+}
+SD1_TE = {
+    "cond_stage_model.transformer.text_model.encoder.layers.0.self_attn.q_proj.weight": "lora_te_text_model_encoder_layers_0_self_attn_q_proj",
+    "cond_stage_model.transformer.text_model.encoder.layers.11.mlp.fc1.weight": "lora_te_text_model_encoder_layers_11_mlp_fc1",
+}
+
+
+def shape_of(key):
+    if key.endswith(("norm.weight", ".bias")):
+        return (320,)
+    if key.endswith(("conv.weight", "op.weight", "in_layers.2.weight", "out_layers.3.weight", "input_blocks.0.0.weight", "out.2.weight")):
+        return (320, 320, 3, 3)
+    if key.endswith("in_proj_weight"):
+        return (3 * 1280, 1280)
+    return (320, 320)
+
+
+def targets(generator):
+    return {key: (lora_name, rows, transpose) for lora_name, key, rows, transpose in generator}
+
+
+class TestLoraKeyMapping(unittest.TestCase):
+    def test_unet_names(self):
+        for expected in (SD1_UNET, SDXL_UNET):
+            keys = list(expected) + [U + "input_blocks.1.1.norm.weight", U + "input_blocks.1.1.proj_in.bias"]
+            found = targets(unet_lora_targets(keys, shape_of))
+            self.assertEqual({key: name for key, (name, _, _) in found.items()}, expected)
+
+    def test_unet_without_conv(self):
+        found = targets(unet_lora_targets(list(SD1_UNET), shape_of, include_conv=False))
+        self.assertEqual(set(found), {key for key in SD1_UNET if len(shape_of(key)) == 2})
+
+    def test_sd1_text_encoder(self):
+        keys = list(SD1_TE) + ["cond_stage_model.transformer.text_model.embeddings.token_embedding.weight"]
+        found = targets(text_encoder_lora_targets(keys, shape_of, is_v2=False, is_sdxl=False))
+        self.assertEqual({key: name for key, (name, _, _) in found.items()}, SD1_TE)
+
+    def test_sdxl_text_encoders(self):
+        te2 = "conditioner.embedders.1.model."
+        keys = [
+            "conditioner.embedders.0.transformer.text_model.encoder.layers.0.mlp.fc2.weight",
+            te2 + "transformer.resblocks.0.attn.in_proj_weight",
+            te2 + "transformer.resblocks.0.attn.out_proj.weight",
+            te2 + "transformer.resblocks.31.mlp.c_fc.weight",
+            te2 + "text_projection",
+        ]
+        found = [(name, key, rows, transpose) for name, key, rows, transpose in text_encoder_lora_targets(keys, shape_of, is_v2=False, is_sdxl=True)]
+        self.assertEqual(found, [
+            ("lora_te1_text_model_encoder_layers_0_mlp_fc2", keys[0], None, False),
+            ("lora_te2_text_model_encoder_layers_0_self_attn_q_proj", keys[1], (0, 1280), False),
+            ("lora_te2_text_model_encoder_layers_0_self_attn_k_proj", keys[1], (1280, 2560), False),
+            ("lora_te2_text_model_encoder_layers_0_self_attn_v_proj", keys[1], (2560, 3840), False),
+            ("lora_te2_text_model_encoder_layers_0_self_attn_out_proj", keys[2], None, False),
+            ("lora_te2_text_model_encoder_layers_31_mlp_fc1", keys[3], None, False),
+            ("lora_te2_text_projection", keys[4], None, True),
+        ])
+
+    def test_checkpoint_style_names(self):
+        self.assertEqual(ldm_lora_name(U + "input_blocks.1.1.proj_in"), "lora_unet_input_blocks_1_1_proj_in")
+        self.assertEqual(ldm_lora_name("first_stage_model.encoder.conv_in"), "lora_vae_encoder_conv_in")
+        self.assertEqual(ldm_lora_name("cond_stage_model.transformer.text_model.final_layer_norm"),
+                         "lora_cond_stage_model_transformer_text_model_final_layer_norm")
+
+
+if __name__ == '__main__':
+    unittest.main()
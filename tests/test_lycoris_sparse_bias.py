@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("tqdm")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+from lycoris_utils import make_sparse, encode_sparse_bias, get_sparse_bias, apply_sparse_bias, convert_sparse_bias
+
+
+def rebuild(state_dict, rows, cols):
+    return apply_sparse_bias(torch.zeros(rows, cols), get_sparse_bias(state_dict, "lora"))
+
+
+class TestSparseBias(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+
+    def test_csr_round_trip_wider_than_int16(self):
+        diff = torch.randn(4, 40000)
+        encoded = encode_sparse_bias("lora", diff, 0.98, bias_format="csr")
+        self.assertIn("lora.bias_crow", encoded)
+        self.assertEqual(encoded["lora.bias_col"].dtype, torch.int32)
+        self.assertTrue(torch.equal(rebuild(encoded, 4, 40000), make_sparse(diff, 0.98).half().float()))
+
+    def test_mask_round_trip_wider_than_int16(self):
+        diff = torch.randn(4, 40000)
+        encoded = encode_sparse_bias("lora", diff, 0.5, bias_format="csr")
+        self.assertIn("lora.bias_mask", encoded)
+        self.assertNotIn("lora.bias_col", encoded)
+        self.assertTrue(torch.equal(rebuild(encoded, 4, 40000), make_sparse(diff, 0.5).half().float()))
+
+    def test_row_offsets_count_towards_csr_size(self):
+        # ~400 nonzeros in 1000 x 8: 400 int8 columns alone are smaller than the 1000-byte mask,
+        # but with 1001 int16 row offsets CSR is not
+        encoded = encode_sparse_bias("lora", torch.randn(1000, 8), 0.95, bias_format="csr")
+        self.assertIn("lora.bias_mask", encoded)
+
+    def test_coo_refuses_shapes_int16_cannot_index(self):
+        with self.assertRaises(ValueError):
+            encode_sparse_bias("lora", torch.randn(4, 40000), 0.98, bias_format="coo")
+
+    def test_convert_coo_to_csr_keeps_values(self):
+        diff = torch.randn(64, 300)
+        coo = encode_sparse_bias("lora", diff, 0.98, bias_format="coo")
+        expected = rebuild(coo, 64, 300)
+        converted = convert_sparse_bias(dict(coo), "csr")
+        self.assertNotIn("lora.bias_indices", converted)
+        self.assertIn("lora.bias_crow", converted)
+        self.assertTrue(torch.equal(rebuild(converted, 64, 300), expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+from quantile_utils import fast_quantile, quantile_rank_error
+
+
+class TestFastQuantile(unittest.TestCase):
+    def test_exact_matches_torch_quantile(self):
+        torch.manual_seed(0)
+        t = torch.randn(10001)
+        for q in (0.0, 0.5, 0.98, 0.999, 1.0):
+            # torch.quantile interpolates at a float32 q, hence the tolerance
+            self.assertAlmostEqual(fast_quantile(t, q), float(torch.quantile(t, q)), delta=1e-4, msg=q)
+
+    def test_sampled_estimate_is_deterministic_and_within_bound(self):
+        torch.manual_seed(0)
+        t = torch.randn(100000)
+        # force the sampled path on a small tensor
+        estimates = [fast_quantile(t, 0.98, max_exact_numel=1000, sample_size=20000) for _ in range(2)]
+        self.assertEqual(estimates[0], estimates[1])
+        rank = float((t <= estimates[0]).float().mean())
+        self.assertLessEqual(abs(rank - 0.98), quantile_rank_error(20000))
+
+    def test_explicit_generator_is_used(self):
+        t = torch.randn(100000)
+        sample = lambda seed: fast_quantile(t, 0.5, max_exact_numel=1000, sample_size=1000, generator=torch.Generator().manual_seed(seed))
+        self.assertEqual(sample(1), sample(1))
+        self.assertNotEqual(sample(1), sample(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("tqdm")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "tools"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "sd-scripts"))
+pytest.importorskip("library.model_util")  # resize_lora.py imports it from sd-scripts
+from resize_lora import decompose_lora, rank_resize, extract_factored, extract_linear, extract_conv, merge_linear, merge_conv
+
+DYNAMIC_METHODS = [(None, None), ("sv_ratio", 8.0), ("sv_cumulative", 0.7), ("sv_fro", 0.9)]
+
+
+class TestFactoredSVD(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        # decaying spectrum so the dynamic methods pick different ranks
+        decay = torch.logspace(0, -2, 16)
+        self.pairs = {
+            "linear": (torch.randn(16, 96) * decay[:, None], torch.randn(128, 16)),
+            "conv": (torch.randn(16, 32, 3, 3) * decay[:, None, None, None], torch.randn(64, 16, 1, 1)),
+        }
+
+    def test_spectrum_matches_full_svd(self):
+        for name, (down, up) in self.pairs.items():
+            _, S_full, _ = decompose_lora(down, up, "cpu", svd_mode="full")
+            _, S_factored, _ = decompose_lora(down, up, "cpu", svd_mode="factored")
+            self.assertEqual(S_factored.shape, S_full.shape, name)
+            torch.testing.assert_close(S_factored, S_full, atol=1e-3, rtol=1e-4, msg=name)
+
+    def test_rank_resize_matches_full_svd(self):
+        for name, (down, up) in self.pairs.items():
+            _, S_full, _ = decompose_lora(down, up, "cpu", svd_mode="full")
+            _, S_factored, _ = decompose_lora(down, up, "cpu", svd_mode="factored")
+            for dynamic_method, dynamic_param in DYNAMIC_METHODS:
+                full = rank_resize(S_full, 8, dynamic_method, dynamic_param)
+                factored = rank_resize(S_factored, 8, dynamic_method, dynamic_param)
+                msg = (name, dynamic_method)
+                self.assertEqual(factored["new_rank"], full["new_rank"], msg)
+                self.assertEqual(factored["new_alpha"], full["new_alpha"], msg)
+                self.assertAlmostEqual(float(factored["sum_retained"]), float(full["sum_retained"]), places=5, msg=msg)
+                self.assertAlmostEqual(factored["fro_retained"], full["fro_retained"], places=5, msg=msg)
+
+    def test_resized_weights_match_full_svd(self):
+        for name, (down, up) in self.pairs.items():
+            if name == "linear":
+                full = extract_linear(merge_linear(down, up, "cpu"), 8, None, None, "cpu")
+                rebuild = lambda p: merge_linear(p["lora_down"], p["lora_up"], "cpu")
+            else:
+                full = extract_conv(merge_conv(down, up, "cpu"), 8, None, None, "cpu")
+                rebuild = lambda p: merge_conv(p["lora_down"], p["lora_up"], "cpu")
+            factored = extract_factored(down, up, 8, None, None, "cpu")
+            self.assertEqual(factored["lora_down"].shape, full["lora_down"].shape, name)
+            self.assertEqual(factored["lora_up"].shape, full["lora_up"].shape, name)
+            torch.testing.assert_close(rebuild(factored), rebuild(full), atol=1e-3, rtol=1e-3, msg=name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pytest
+
+torch = pytest.importorskip("torch")
+safetensors_torch = pytest.importorskip("safetensors.torch")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "tools"))
+from safetensors_io import SafetensorsWriter, safetensors_order, verify_sshs_hashes
+
+
+def generated_lora():
+    torch.manual_seed(0)
+    # > 1.1 MB of tensor data, so the legacy hash window (file bytes 0x100000-0x110000) lies inside the data
+    tensors = {
+        "lora_unet_a.lora_down.weight": torch.randn(8, 320),
+        "lora_unet_a.lora_up.weight": torch.randn(320, 8),
+        "lora_unet_b.lora_down.weight": torch.randn(32, 4096).half(),
+        "lora_unet_b.lora_up.weight": torch.randn(4096, 32).half(),
+        "lora_unet_a.alpha": torch.tensor(4.0),
+        "lora_unet_b.alpha": torch.tensor(16.0).half(),
+    }
+    metadata = {"ss_network_dim": "32", "ss_output_name": "日本語の名前", "modelspec.title": "not hashed"}
+    return tensors, metadata
+
+
+def write_with_hashes(path, tensors, metadata):
+    plan = safetensors_order([(name, t.dtype, t.shape) for name, t in tensors.items()])
+    with SafetensorsWriter(path, plan, metadata, sshs_hashes=True) as writer:
+        for name, _, _ in plan:
+            writer.write(name, tensors[name])
+    return writer.hashes
+
+
+class TestSSHSHashes(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "lora.safetensors")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_hashes_match_sd_scripts(self):
+        sys.path.insert(0, os.path.join(REPO_ROOT, "sd-scripts"))
+        train_util = pytest.importorskip("library.train_util")
+        tensors, metadata = generated_lora()
+        hashes = write_with_hashes(self.path, tensors, metadata)
+        model_hash, legacy_hash = train_util.precalculate_safetensors_hashes(tensors, metadata)
+        self.assertEqual(hashes, {"sshs_model_hash": model_hash, "sshs_legacy_hash": legacy_hash})
+
+    def test_written_file_verifies(self):
+        tensors, metadata = generated_lora()
+        hashes = write_with_hashes(self.path, tensors, metadata)
+        results = verify_sshs_hashes(self.path)
+        self.assertEqual({k: stored for k, (stored, _) in results.items()}, hashes)
+        self.assertTrue(all(stored == computed for stored, computed in results.values()))
+        # the hashes are filled into the header; the tensors are unchanged
+        loaded = safetensors_torch.load_file(self.path)
+        for name, tensor in tensors.items():
+            self.assertTrue(torch.equal(loaded[name], tensor), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,159 +1,139 @@
-import safetensors.torch
+import os
+import sys
 import json
-from collections import OrderedDict
-import sys # To redirect stdout
-import traceback
+import glob
+import struct
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from safetensors_io import read_safetensors_header
 
-class Logger(object):
-    def __init__(self, filename="loha_analysis_output.txt"):
-        self.terminal = sys.stdout
-        self.log = open(filename, "w", encoding='utf-8')
+# Little-endian scalar decoders for the stored bytes of .alpha/.dim tensors
+_SCALAR_FORMATS = {"F64": "<d", "F32": "<f", "F16": "<e", "I64": "<q", "I32": "<i", "I16": "<h", "I8": "<b", "U8": "<B", "BOOL": "<?"}
+# Parameter names that identify the network type of a module
+_NETWORK_TYPES = (("hada_w1_a", "loha"), ("lokr_w1", "lokr"), ("lora_down.weight", "lora"))
 
-    def write(self, message):
-        self.terminal.write(message)
-        self.log.write(message)
 
-    def flush(self):
-        # This flush method is needed for python 3 compatibility.
-        # This handles the flush command, which shutil.copytree or os.system uses.
-        self.terminal.flush()
-        self.log.flush()
+def _decode_scalar(dtype, raw):
+    if dtype == "BF16":  # upper half of a float32
+        return struct.unpack("<f", b"\x00\x00" + raw)[0]
+    fmt = _SCALAR_FORMATS.get(dtype)
+    return struct.unpack(fmt, raw)[0] if fmt else None
 
-    def close(self):
-        self.log.close()
 
-def analyze_safetensors_file(filepath, output_filename="loha_analysis_output.txt"):
+def _module_rank(params):
+    """The rank of a LoHA/LoKr/LoRA module from its factor shapes, or None."""
+    if "hada_w1_a" in params:
+        return params["hada_w1_a"]["shape"][-1]
+    if "lokr_w2_a" in params:
+        return params["lokr_w2_a"]["shape"][-1]
+    if "lora_down.weight" in params:
+        return params["lora_down.weight"]["shape"][0]
+    return None
+
+
+def analyze_safetensors_file(filepath, include_modules=True):
     """
-    Analyzes a .safetensors file to extract and print its metadata
-    and tensor information (keys, shapes, dtypes) to a file.
+    Analyzes a .safetensors LoHA/LoRA file from its JSON header: keys are grouped per module in one pass, and
+    tensor data is only read for the scalar .alpha/.dim values. Returns a JSON-serializable report; a file that
+    cannot be read gives a report with an "error" entry.
     """
-    original_stdout = sys.stdout
-    logger = Logger(filename=output_filename)
-    sys.stdout = logger
-
+    report = {"file": filepath}
     try:
-        print(f"--- Analyzing: {filepath} ---\n")
-        print(f"--- Output will be saved to: {output_filename} ---\n")
+        header, data_start = read_safetensors_header(filepath)
+        metadata = header.pop("__metadata__", None) or {}
+        report["size_bytes"] = os.path.getsize(filepath)
+
+        modules, other_keys, dtypes, total_params, scalars = {}, {}, {}, 0, []
+        for key, info in header.items():
+            entry = {"shape": info["shape"], "dtype": info["dtype"]}
+            numel = 1
+            for d in info["shape"]:
+                numel *= d
+            total_params += numel
+            dtypes[info["dtype"]] = dtypes.get(info["dtype"], 0) + 1
+            module, sep, param = key.partition(".")
+            if sep:
+                modules.setdefault(module, {})[param] = entry
+            else:
+                other_keys[key] = entry
+            if param in ("alpha", "dim") and numel == 1:
+                scalars.append((info["data_offsets"], entry))
+
+        # Read the scalars in file order
+        with open(filepath, "rb") as f:
+            for (begin, end), entry in sorted(scalars, key=lambda s: s[0][0]):
+                f.seek(data_start + begin)
+                entry["value"] = _decode_scalar(entry["dtype"], f.read(end - begin))
+
+        network_types, ranks, alphas = {}, {}, {}
+        for module, params in modules.items():
+            network_type = next((name for param, name in _NETWORK_TYPES if param in params), None)
+            rank = _module_rank(params)
+            alpha = params.get("alpha", {}).get("value")
+            network_types[network_type or "other"] = network_types.get(network_type or "other", 0) + 1
+            if rank is not None:
+                ranks[str(rank)] = ranks.get(str(rank), 0) + 1
+            if alpha is not None:
+                alphas[str(alpha)] = alphas.get(str(alpha), 0) + 1
+
+        report["summary"] = {
+            "tensors": len(header), "modules": len(modules), "parameters": total_params, "dtypes": dtypes,
+            "network_types": network_types, "ranks": ranks, "alphas": alphas,
+        }
+        report["metadata"] = metadata
+        if "ss_network_args" in metadata:
+            try:
+                report["network_args"] = json.loads(metadata["ss_network_args"])
+            except json.JSONDecodeError:
+                report["network_args"] = None  # not a valid JSON string
+        if include_modules:
+            report["modules"] = dict(sorted(modules.items()))
+            report["other_keys"] = other_keys
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+    return report
 
-        # Load the tensors to get their structure
-        state_dict = safetensors.torch.load_file(filepath, device="cpu") # Load to CPU to avoid potential CUDA issues
 
-        print("--- Tensor Information ---")
-        if not state_dict:
-            print("No tensors found in the state dictionary.")
+def collect_files(paths, recursive=False):
+    """The .safetensors files among `paths`, with directories expanded."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, "**", "*.safetensors") if recursive else os.path.join(path, "*.safetensors")
+            files.extend(glob.glob(pattern, recursive=recursive))
         else:
-            # Sort keys for consistent output
-            sorted_keys = sorted(state_dict.keys())
-            current_module_prefix = ""
-            
-            # First, identify all unique module prefixes for better grouping
-            module_prefixes = sorted(list(set([".".join(key.split(".")[:-1]) for key in sorted_keys if "." in key])))
-
-            for prefix in module_prefixes:
-                if not prefix: # Skip keys that don't seem to be part of a module (e.g. global metadata tensors if any)
-                    continue
-                print(f"\nModule: {prefix}")
-                for key in sorted_keys:
-                    if key.startswith(prefix + "."):
-                        tensor = state_dict[key]
-                        print(f"  - Key: {key}")
-                        print(f"    Shape: {list(tensor.shape)}, Dtype: {tensor.dtype}") # Output shape as list for clarity
-                        if key.endswith((".alpha", ".dim")):
-                            try:
-                                value = tensor.item()
-                                # Check if value is float and format if it is
-                                if isinstance(value, float):
-                                     print(f"    Value: {value:.8f}") # Format float to a certain precision
-                                else:
-                                    print(f"    Value: {value}")
-                            except Exception as e:
-                                print(f"    Value: Could not extract scalar value ({tensor}, error: {e})")
-                        elif tensor.numel() < 10: # Print small tensors' values
-                            print(f"    Values (first few): {tensor.flatten()[:10].tolist()}")
-
-
-            # Print keys that might not fit the module pattern (e.g., older formats or single tensors)
-            print("\n--- Other Tensor Keys (if any, not fitting typical module.parameter pattern) ---")
-            other_keys_found = False
-            for key in sorted_keys:
-                if not any(key.startswith(p + ".") for p in module_prefixes if p):
-                    other_keys_found = True
-                    tensor = state_dict[key]
-                    print(f"  - Key: {key}")
-                    print(f"    Shape: {list(tensor.shape)}, Dtype: {tensor.dtype}")
-                    if key.endswith((".alpha", ".dim")) or tensor.numel() == 1:
-                         try:
-                            value = tensor.item()
-                            if isinstance(value, float):
-                                print(f"    Value: {value:.8f}")
-                            else:
-                                print(f"    Value: {value}")
-                         except Exception as e:
-                            print(f"    Value: Could not extract scalar value ({tensor}, error: {e})")
-
-            if not other_keys_found:
-                print("No other keys found.")
-
-            print(f"\nTotal tensor keys found: {len(state_dict)}")
-
-        print("\n--- Metadata (from safetensors header) ---")
-        metadata_content = OrderedDict()
-        malformed_metadata_keys = []
-        try:
-            # Use safe_open to access the metadata separately
-            with safetensors.safe_open(filepath, framework="pt", device="cpu") as f:
-                metadata_keys = f.metadata()
-                if metadata_keys is None:
-                    print("No metadata dictionary found in the file header (f.metadata() returned None).")
-                else:
-                    for k in metadata_keys.keys():
-                        try:
-                            metadata_content[k] = metadata_keys.get(k)
-                        except Exception as e:
-                            malformed_metadata_keys.append((k, str(e)))
-                            metadata_content[k] = f"[Error reading value: {e}]"
-        except Exception as e:
-            print(f"Could not open or read metadata using safe_open: {e}")
-            traceback.print_exc(file=sys.stdout)
-
-        if not metadata_content and not malformed_metadata_keys:
-            print("No metadata content extracted.")
-        else:
-            for key, value in metadata_content.items():
-                print(f"- {key}: {value}")
-                if key == "ss_network_args" and value and not value.startswith("[Error"):
-                    try:
-                        parsed_args = json.loads(value)
-                        print("  Parsed ss_network_args:")
-                        for arg_key, arg_value in parsed_args.items():
-                            print(f"    - {arg_key}: {arg_value}")
-                    except json.JSONDecodeError:
-                        print("    (ss_network_args is not a valid JSON string)")
-            if malformed_metadata_keys:
-                print("\n--- Malformed Metadata Keys (could not be read) ---")
-                for key, error_msg in malformed_metadata_keys:
-                    print(f"- {key}: Error: {error_msg}")
-
-        print("\n--- End of Analysis ---")
+            files.append(path)
+    return sorted(set(files))
 
-    except Exception as e:
-        print(f"\n!!! An error occurred during analysis !!!")
-        print(str(e))
-        traceback.print_exc(file=sys.stdout) # Print full traceback to the log file
-    finally:
-        sys.stdout = original_stdout # Restore standard output
-        logger.close()
-        print(f"\nAnalysis complete. Output saved to: {output_filename}")
+
+def analyze_files(files, workers=None, include_modules=True):
+    """Reports for `files`, in order; headers are read by a thread pool."""
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda path: analyze_safetensors_file(path, include_modules), files))
 
 
 if __name__ == "__main__":
-    input_file_path = input("Enter the path to your working LoHA .safetensors file: ")
-    output_file_name = "loha_analysis_results.txt" # You can change this default
-    
-    # Suggest a default output name based on input file if desired
-    # import os
-    # base_name = os.path.splitext(os.path.basename(input_file_path))[0]
-    # output_file_name = f"{base_name}_analysis.txt"
-    
-    print(f"The analysis will be saved to: {output_file_name}")
-    analyze_safetensors_file(input_file_path, output_filename=output_file_name)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Analyze LoHA/LoRA .safetensors files from their headers and print a JSON report.")
+    parser.add_argument("paths", nargs="+", help=".safetensors files and/or directories containing them")
+    parser.add_argument("--recursive", action="store_true", help="Also search subdirectories of directory arguments.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report to this file instead of stdout.")
+    parser.add_argument("--workers", type=int, default=None, help="Files analyzed in parallel. Defaults to 4x the CPU count (at most 32).")
+    parser.add_argument("--summary_only", action="store_true", help="Leave out the per-module tensor listing (summary and metadata only).")
+    args = parser.parse_args()
+
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        print("No .safetensors files found.", file=sys.stderr)
+        sys.exit(1)
+    reports = analyze_files(files, args.workers, include_modules=not args.summary_only)
+    result = reports[0] if len(args.paths) == 1 and not os.path.isdir(args.paths[0]) else reports
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1, ensure_ascii=False)
+        print(f"Analyzed {len(reports)} file(s), {sum('error' in r for r in reports)} failed. Report saved to: {args.output}", file=sys.stderr)
+    else:
+        json.dump(result, sys.stdout, indent=1, ensure_ascii=False)
+        print()
+    sys.exit(1 if any("error" in r for r in reports) else 0)
@@ -0,0 +1,99 @@
+import torch
+import os
+import argparse
+from contextlib import nullcontext
+from safetensors_io import SafetensorsReader, write_safetensors_streamed
+from extract_model_difference import delta_entry_keys, decode_delta_tensor
+
+_SAVE_PRECISIONS = {"float": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+def apply_model_difference(base_model_path, delta_path, output_path, scale=1.0, save_precision="same", verify_model_path=None):
+    """
+    Streams a delta written by extract_model_difference.py (any --format) onto a base checkpoint:
+    output = base + scale * delta for shared keys, new tensors from the delta are inserted as is.
+    Only one tensor at a time is held in memory; the output header is planned from the input headers.
+
+    Args:
+        base_model_path (str): Base model .safetensors file.
+        delta_path (str): Delta .safetensors file.
+        output_path (str): Output .safetensors file.
+        scale (float, optional): Multiplier for the delta. Defaults to 1.0.
+        save_precision (str, optional): 'same' keeps each base tensor's dtype; 'float', 'fp16' or 'bf16'
+                                        cast floating-point tensors. Defaults to 'same'.
+        verify_model_path (str, optional): The fine-tuned model the delta came from; if given, the relative
+                                           error ||output - ft|| / ||ft - base|| is reported per key.
+    Returns:
+        dict: Per-key relative errors when verify_model_path is given, else an empty dict.
+    """
+    base = SafetensorsReader(base_model_path)
+    delta = SafetensorsReader(delta_path)
+    delta_metadata = delta.metadata or {}
+    delta_groups = delta_entry_keys(delta.keys())
+    print(f"Delta format: {delta_metadata.get('delta_format', 'float')}, {len(delta_groups)} keys")
+
+    # Plan every output tensor (name, dtype, shape) up front so the header can be written first
+    cast_dtype = _SAVE_PRECISIONS.get(save_precision)
+    plan = []
+    for key in base.keys():
+        dtype, shape = base.info(key)
+        if cast_dtype is not None and dtype.is_floating_point:
+            dtype = cast_dtype
+        plan.append((key, dtype, shape))
+    new_keys = [k for k in delta_groups if k not in base]
+    for key in new_keys:
+        if delta_groups[key] != [key]:
+            print(f"Warning: '{key}' is not in the base model and is stored compressed; skipping it.")
+            continue
+        plan.append((key, *delta.info(key)))
+    print(f"{len(plan)} output tensors ({sum(1 for k in delta_groups if k in base)} with deltas, {len(new_keys)} new)")
+
+    key_errors = {}
+    with base, delta, (SafetensorsReader(verify_model_path) if verify_model_path else nullcontext()) as verify:
+        verify_keys = set(verify.keys()) if verify is not None else set()
+
+        def produce(key, dtype):
+            if key not in base:
+                return delta[key].to(dtype)
+            tensor = base[key]
+            if key in delta_groups and tensor.is_floating_point():
+                base_fp32 = tensor.to(torch.float32)
+                merged = base_fp32 + scale * decode_delta_tensor(key, delta.__getitem__, delta_groups[key]).reshape(tensor.shape)
+                if key in verify_keys:
+                    ft = verify[key].to(torch.float32)
+                    reference = float((ft - base_fp32).norm())
+                    key_errors[key] = float((merged.to(dtype).to(torch.float32) - ft).norm()) / reference if reference > 0 else 0.0
+                return merged.to(dtype)
+            return tensor.to(dtype)
+
+        write_safetensors_streamed(output_path, plan, produce, base.metadata)
+
+    if key_errors:
+        worst = sorted(key_errors.items(), key=lambda kv: kv[1], reverse=True)
+        print(f"Reconstruction error vs {verify_model_path}: mean {sum(key_errors.values()) / len(key_errors):.3e}, max {worst[0][1]:.3e} (relative to the true delta)")
+        for k, err in worst[:10]:
+            print(f"  {err:.3e}  {k}")
+    print(f"Merged model saved to: {output_path}")
+    return key_errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply a delta from extract_model_difference.py onto a base model (.safetensors), streaming one tensor at a time.")
+    parser.add_argument("base_model_path", type=str, help="File path for the BASE model (.safetensors).")
+    parser.add_argument("delta_path", type=str, help="File path for the delta (.safetensors) from extract_model_difference.py.")
+    parser.add_argument("output_path", type=str, help="File path for the merged model (.safetensors).")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the delta. Defaults to 1.0.")
+    parser.add_argument("--save_precision", type=str, default="same", choices=["same", "float", "fp16", "bf16"],
+                        help="'same' keeps each base tensor's dtype; otherwise floating-point tensors are cast.")
+    parser.add_argument("--verify", type=str, default=None,
+                        help="Optional: the fine-tuned model the delta was extracted from, to report the per-key reconstruction error.")
+    args = parser.parse_args()
+
+    for path in (args.base_model_path, args.delta_path, args.verify):
+        if path and not os.path.exists(path):
+            print(f"Error: file not found at {path}")
+            exit(1)
+    if os.path.dirname(args.output_path):
+        os.makedirs(os.path.dirname(args.output_path), exist_ok=True)
+
+    apply_model_difference(args.base_model_path, args.delta_path, args.output_path, args.scale, args.save_precision, args.verify)
@@ -111,6 +111,14 @@ def get_args():
     parser.add_argument(
         "--sparsity", help="sparsity for sparse bias", default=0.98, type=float
     )
+    parser.add_argument(
+        "--bias_format",
+        help="layout of the sparse bias: 'coo' (default) is the original LyCORIS layout that other LyCORIS "
+        "loaders read, but its int16 indices wrap for dimensions above 32767; 'csr' is smaller and exact for "
+        "any size, but only tools/merge_lycoris.py in this repo can read it",
+        default="coo",
+        choices=["coo", "csr"],
+    )
     parser.add_argument(
         "--disable_cp",
         help="don't use cp decomposition",
@@ -124,6 +132,7 @@ ARGS = get_args()
 
 
 from lycoris.utils import extract_diff
+from lycoris_utils import convert_sparse_bias
 from lycoris.kohya.model_utils import load_models_from_stable_diffusion_checkpoint
 from lycoris.kohya.sdxl_model_util import load_models_from_sdxl_checkpoint
 
@@ -179,6 +188,8 @@ def main():
         args.sparsity,
         not args.disable_cp,
     )
+    if args.use_sparse_bias and args.bias_format != "coo":
+        state_dict = convert_sparse_bias(state_dict, args.bias_format)
 
     if args.safetensors:
         save_file(state_dict, args.output_name)
@@ -3,18 +3,23 @@ import os
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from safetensors.torch import save_file, load_file
-import safetensors
 from tqdm import tqdm
 import math
 import json
 from collections import OrderedDict
+from collections.abc import Mapping
 import signal
 import sys
 import glob
+import shutil
 import traceback
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from enum import Enum, auto
+from tensor_fingerprint import identical_tensor_keys
+from lora_key_mapping import ldm_lora_name
+from safetensors_io import SafetensorsReader, SafetensorsWriter, open_state_dict, read_safetensors_header, safetensors_order, save_safetensors
 
 # --- Global variables ---
 extracted_loha_state_dict_global = OrderedDict()
@@ -32,6 +37,12 @@ outer_pbar_global = None
 main_loop_completed_scan_flag_global = False
 params_to_seed_optimizer_global = {}
 skipped_vae_layers_count = 0 # Ensure this is a global if accessed in main and other places
+pending_layer_groups_global = OrderedDict() # (out, in, k_h, k_w, rank, alpha) -> layers waiting for batched optimization
+last_periodic_save_count_global = 0
+worker_pool_global = None # ProcessPoolExecutor while --workers jobs are running
+journal_pending_keys_global = set() # keys written since the last journal shard
+journal_reset_pending_global = True # start a fresh journal on first append unless we resumed from it
+layer_budget_global = None # --time_budget/--iteration_budget state: unit, total, remaining, per-key importance scores
 
 # --- Logging Helper ---
 class LogType(Enum):
@@ -39,6 +50,7 @@ class LogType(Enum):
     RANK_INCREASED_INFO = auto()
     INITIAL_PARAMS_LOADED = auto()
     INITIAL_PARAMS_KAIMING_NORMAL = auto()
+    INITIAL_PARAMS_SVD = auto()
     INSUFFICIENT_PROGRESS_STOP = auto()
     PROJECTION_STOP = auto()
     INSUFFICIENT_PROGRESS_LOG_ONLY = auto()
@@ -58,7 +70,7 @@ def log_layer_optimization_event(log_type: LogType, layer_name: str, **kwargs):
         return
     if not args_global.verbose_layer_debug:
         if log_type in [
-            LogType.INITIAL_PARAMS_LOADED, LogType.INITIAL_PARAMS_KAIMING_NORMAL,
+            LogType.INITIAL_PARAMS_LOADED, LogType.INITIAL_PARAMS_KAIMING_NORMAL, LogType.INITIAL_PARAMS_SVD,
             LogType.EMA_PROJECTION_SKIPPED_HISTORY, LogType.EMA_PROJECTION_INCONCLUSIVE_FALLBACK_RAW
         ]:
             return
@@ -78,6 +90,8 @@ def log_layer_optimization_event(log_type: LogType, layer_name: str, **kwargs):
         msg = f"    R:{kwargs['rank']} Initialized from existing LoHA."
     elif log_type == LogType.INITIAL_PARAMS_KAIMING_NORMAL:
         msg = f"    R:{kwargs['rank']} Initialized Kaiming/Normal (Attempt {kwargs.get('attempt', 1)})."
+    elif log_type == LogType.INITIAL_PARAMS_SVD:
+        msg = f"    R:{kwargs['rank']} Initialized from truncated SVD (Attempt {kwargs.get('attempt', 1)}, SVD rank {kwargs['svd_rank']})."
     elif log_type == LogType.INSUFFICIENT_PROGRESS_STOP:
         msg = f"Att {kwargs['attempt']}(R:{kwargs['rank']}): Stop - RawProg Low (Imprv: {kwargs['rel_imprv']:.1e} < {kwargs['min_ratio']:.1e}; Loss: {kwargs['current_loss']:.2e})."
     elif log_type == LogType.PROJECTION_STOP:
@@ -134,13 +148,38 @@ def _get_closest_ema_value_before_iter(target_iter: int, ema_history: list[tuple
             if best_match_iter is not None and target_iter - hist_iter > getattr(args_global, 'projection_sample_interval', 20) * 2: break
     return (best_match_iter, best_match_loss) if best_match_iter is not None else (ema_history[0] if ema_history else (None, None))
 
+def svd_seed_loha_parameters(
+    delta_W_target: torch.Tensor, current_rank: int, alpha: float,
+    hada_w1_a: torch.Tensor, hada_w1_b: torch.Tensor, hada_w2_a: torch.Tensor, hada_w2_b: torch.Tensor
+) -> int:
+    # (alpha/rank) * (w1a@w1b) * (w2a@w2b) should start at the rank-r SVD approximation L of the delta.
+    # w1 carries L / c and w2 the constant matrix c (a rank-1 outer product); c = sqrt(rms(L)) splits the
+    # magnitude evenly between the two Hadamard factors. Unused components keep one side zero so
+    # gradients can still flow into them, as in LoRA's zero-init.
+    out_dim = hada_w1_a.shape[0]
+    target_2d = delta_W_target.reshape(out_dim, -1).to(hada_w1_a.device, dtype=torch.float32)
+    U, S, Vh = torch.linalg.svd(target_2d, full_matrices=False)
+    svd_rank = min(current_rank, S.shape[0])
+    U, S, Vh = U[:, :svd_rank], S[:svd_rank] * (current_rank / alpha), Vh[:svd_rank, :]
+    approx_rms = torch.sqrt(torch.sum(S.pow(2)) / target_2d.numel())
+    c = max(float(torch.sqrt(approx_rms)), 1e-8)
+    s_sqrt = torch.sqrt(S / c)
+    hada_w1_a.zero_(); nn.init.normal_(hada_w1_b, std=0.02)
+    hada_w1_a[:, :svd_rank] = (U * s_sqrt.unsqueeze(0)).to(hada_w1_a.dtype)
+    hada_w1_b[:svd_rank, :] = (Vh * s_sqrt.unsqueeze(1)).to(hada_w1_b.dtype)
+    nn.init.kaiming_uniform_(hada_w2_a, a=math.sqrt(5)); hada_w2_b.zero_()
+    hada_w2_a[:, 0] = math.sqrt(c); hada_w2_b[0, :] = math.sqrt(c)
+    return svd_rank
+
 def initialize_loha_parameters(
     out_dim: int, current_rank: int, in_dim_effective_k_ops: int,
     device: str, dtype: torch.dtype, layer_name: str, attempt_idx: int,
     is_continuation_attempt: bool,
     existing_params_to_load: dict | None = None,
     warm_start_status: str | None = None,
-    prev_rank_for_warm_start: int | None = None
+    prev_rank_for_warm_start: int | None = None,
+    delta_W_target: torch.Tensor | None = None,
+    alpha: float | None = None
 ):
     hada_w1_a_p = nn.Parameter(torch.empty(out_dim, current_rank, device=device, dtype=dtype))
     hada_w1_b_p = nn.Parameter(torch.empty(current_rank, in_dim_effective_k_ops, device=device, dtype=dtype))
@@ -172,6 +211,10 @@ def initialize_loha_parameters(
                 for p_slice in [hada_w1_b_p.data[prev_rank_for_warm_start:, :], hada_w2_b_p.data[prev_rank_for_warm_start:, :]]:
                     nn.init.normal_(p_slice, std=0.02)
             initialized_from_external_or_warm_start = True
+        if not initialized_from_external_or_warm_start and getattr(args_global, 'init', 'kaiming') == 'svd' and delta_W_target is not None and alpha:
+            svd_rank = svd_seed_loha_parameters(delta_W_target, current_rank, alpha, hada_w1_a_p.data, hada_w1_b_p.data, hada_w2_a_p.data, hada_w2_b_p.data)
+            log_layer_optimization_event(LogType.INITIAL_PARAMS_SVD, layer_name, rank=current_rank, attempt=attempt_idx + 1, svd_rank=svd_rank)
+            initialized_from_external_or_warm_start = True
         if not initialized_from_external_or_warm_start:
             log_layer_optimization_event(LogType.INITIAL_PARAMS_KAIMING_NORMAL, layer_name, rank=current_rank, attempt=attempt_idx + 1)
             for p in [hada_w1_a_p, hada_w2_a_p]: nn.init.kaiming_uniform_(p.data, a=math.sqrt(5))
@@ -293,14 +336,68 @@ def check_loss_projection(
             return True, log_details
     return False, log_details if proj_type_at_check != "none" else None
 
-def get_module_shape_info_from_weight(weight_tensor: torch.Tensor):
-    if len(weight_tensor.shape) == 4: is_conv = True; out_dim, in_dim_effective, k_h, k_w = weight_tensor.shape; return out_dim, in_dim_effective, k_h, k_w, True
-    elif len(weight_tensor.shape) == 2: is_conv = False; out_dim, in_dim = weight_tensor.shape; return out_dim, in_dim, None, None, False
+def get_module_shape_info(shape: tuple):
+    if len(shape) == 4: out_dim, in_dim_effective, k_h, k_w = shape; return out_dim, in_dim_effective, k_h, k_w, True
+    elif len(shape) == 2: out_dim, in_dim = shape; return out_dim, in_dim, None, None, False
     return None
 
-def generate_intermediate_filename(base_save_path: str, num_total_completed_layers: int) -> str:
-    base, ext = os.path.splitext(base_save_path)
-    return f"{base}_resume_L{num_total_completed_layers}{ext}"
+def get_module_shape_info_from_weight(weight_tensor: torch.Tensor):
+    return get_module_shape_info(tuple(weight_tensor.shape))
+
+def defers_layer_to_worker(loha_key_prefix: str) -> bool:
+    """--workers layers are queued from their header shape; their weights are read once, when the job is submitted."""
+    is_reopt_target = args_global.continue_training_from_loha and loha_key_prefix in params_to_seed_optimizer_global
+    # LoKr is closed-form and sequential; a re-opt target with --target_loss needs its delta for the pre-check
+    return args_global.workers > 1 and args_global.algo != 'lokr' and not (is_reopt_target and args_global.target_loss is not None)
+
+def get_loha_key_prefix(original_module_path: str) -> str:
+    return ldm_lora_name(original_module_path)
+
+def is_vae_module(original_module_path: str) -> bool:
+    return any(vp in original_module_path for vp in [".encoder.", ".decoder.", ".quant_conv."]) and any(tp in original_module_path for tp in ["first_stage_model.", "autoencoder."])
+
+BUDGET_SAMPLE_ROWS = 64 # rows per layer (in up to 4 evenly spaced blocks) read to score it for --time_budget/--iteration_budget
+
+def estimate_delta_norm(base_model_sd: Mapping, ft_model_sd: Mapping, key_name: str) -> float:
+    """Frobenius norm of ft - base, extrapolated from a few evenly spaced row blocks; only those rows are read."""
+    rows = base_model_sd.get_shape(key_name)[0]
+    blocks = min(4, rows)
+    block_rows = max(1, min(rows, BUDGET_SAMPLE_ROWS) // blocks)
+    sum_sq, sampled_rows = 0.0, 0
+    for i in range(blocks):
+        start = (i * rows) // blocks
+        end = min(rows, start + block_rows)
+        delta = ft_model_sd.get_rows(key_name, start, end).to(torch.float32) - base_model_sd.get_rows(key_name, start, end).to(torch.float32)
+        sum_sq += delta.pow(2).sum().item(); sampled_rows += end - start
+    return math.sqrt(sum_sq * rows / sampled_rows)
+
+def plan_layer_budget(base_model_sd: Mapping, ft_model_sd: Mapping, candidate_keys: list[str]) -> dict:
+    """
+    Score layers still to optimize by their estimated delta Frobenius norm; each layer later takes
+    budget * score / remaining score. Scoring reads only sampled rows, and its time is charged to --time_budget.
+    """
+    scoring_start = time.monotonic()
+    scores = OrderedDict()
+    for key_name in tqdm(candidate_keys, desc="Scoring layers for budget", leave=False, dynamic_ncols=True):
+        original_module_path = key_name[:-len(".weight")]
+        loha_key_prefix = get_loha_key_prefix(original_module_path)
+        if is_vae_module(original_module_path): continue
+        if loha_key_prefix in all_completed_module_prefixes_ever_global and loha_key_prefix not in params_to_seed_optimizer_global: continue
+        scores[key_name] = estimate_delta_norm(base_model_sd, ft_model_sd, key_name)
+        if args_global.max_layers and len(scores) >= args_global.max_layers: break
+    scoring_time = time.monotonic() - scoring_start
+    unit, total = ("seconds", args_global.time_budget - scoring_time) if args_global.time_budget else ("iterations", float(args_global.iteration_budget))
+    print(f"Budget: {total:g} {unit} over {len(scores)} layers, weighted by delta Frobenius norm (scored from sampled rows in {scoring_time:.1f}s"
+          + (", charged to the time budget)." if unit == "seconds" else ")."))
+    return {'unit': unit, 'total': total, 'remaining': total, 'scores': scores, 'remaining_score': sum(scores.values())}
+
+def take_layer_budget(key_name: str) -> float | None:
+    if layer_budget_global is None or key_name not in layer_budget_global['scores']: return None
+    score = layer_budget_global['scores'].pop(key_name)
+    share = score / layer_budget_global['remaining_score'] if layer_budget_global['remaining_score'] > 0 else 1.0
+    layer_budget_global['remaining_score'] = max(0.0, layer_budget_global['remaining_score'] - score)
+    # underspent budget flows to later layers, overspent budget is taken from them
+    return max(0.0, layer_budget_global['remaining']) * min(1.0, share)
 
 def prepare_save_metadata(
     script_args: argparse.Namespace,
@@ -323,11 +420,13 @@ def prepare_save_metadata(
         "conv_dim": str(script_args.conv_rank or script_args.rank), "conv_alpha": conv_alpha_str,
         **{k: str(getattr(script_args, k)) for k in ["dropout", "rank_dropout", "module_dropout"]}
     }
+    if script_args.algo == "lokr":
+        network_args_data.update({"algo": "lokr", "factor": str(script_args.lokr_factor), "full_matrix": "True"})
     sf_meta = {
         "ss_network_module": "lycoris.kohya", "ss_network_rank": str(script_args.rank),
-        "ss_network_alpha": net_alpha_str, "ss_network_algo": "loha",
+        "ss_network_alpha": net_alpha_str, "ss_network_algo": script_args.algo,
         "ss_network_args": json.dumps(network_args_data),
-        "ss_comment": f"Extracted LoHA (Int: {is_interrupted_save}). OptPrec: {script_args.precision}. SaveDtype: {script_args.save_weights_dtype}. Layers: {total_completed_modules}.",
+        "ss_comment": f"Extracted {'LoKr (closed-form)' if script_args.algo == 'lokr' else 'LoHA'} (Int: {is_interrupted_save}). OptPrec: {script_args.precision}. SaveDtype: {script_args.save_weights_dtype}. Layers: {total_completed_modules}.",
         "ss_base_model_name": os.path.splitext(os.path.basename(script_args.base_model_path))[0],
         "ss_ft_model_name": os.path.splitext(os.path.basename(script_args.ft_model_path))[0],
         "ss_save_weights_dtype": script_args.save_weights_dtype,
@@ -344,7 +443,7 @@ def prepare_save_metadata(
         "skipped_good_initial": skipped_good_initial_this_run, "scanned_keys": scanned_keys_this_run
     }
     json_meta = {
-        "comfyui_lora_type": "LyCORIS_LoHa", "model_name": os.path.splitext(output_filename)[0],
+        "comfyui_lora_type": "LyCORIS_LoKr" if script_args.algo == "lokr" else "LyCORIS_LoHa", "model_name": os.path.splitext(output_filename)[0],
         "base_model_path": script_args.base_model_path, "ft_model_path": script_args.ft_model_path,
         "loha_extraction_settings": serializable_script_args,
         "extraction_summary": extraction_summary_data,
@@ -368,10 +467,8 @@ def perform_graceful_save(output_path_to_save: str):
         return False
 
     save_dtype = {"fp16": torch.float16, "bf16": torch.bfloat16}.get(args_global.save_weights_dtype, torch.bfloat16)
-    final_sd = OrderedDict(
-        (k, v.to(save_dtype) if hasattr(v, 'is_floating_point') and v.is_floating_point() else v)
-        for k, v in extracted_loha_state_dict_global.items()
-    )
+    is_float = lambda v: hasattr(v, 'is_floating_point') and v.is_floating_point()
+    cast = lambda v: v.to(save_dtype) if is_float(v) else v
     print(f"\nSaving LoHA for {total_processed_ever} modules ({processed_layers_this_session_count_global} this session) to {output_path_to_save}")
     sf_meta, json_meta = prepare_save_metadata(
         script_args=args_global, output_filename=os.path.basename(output_path_to_save),
@@ -391,12 +488,16 @@ def perform_graceful_save(output_path_to_save: str):
             temp_sf_path = output_path_to_save + ".part"
             final_json_path = os.path.splitext(output_path_to_save)[0] + "_extraction_metadata.json"
             temp_json_path = final_json_path + ".part"
-            save_file(final_sd, temp_sf_path, metadata=sf_meta)
-            with open(temp_json_path, 'w') as f: json.dump(json_meta, f, indent=4)
-            os.replace(temp_sf_path, output_path_to_save)
+            # Streamed one tensor at a time, cast on the way out, with sshs_* hashes computed from the written bytes;
+            # the .safetensors is renamed into place when the writer closes
+            plan = safetensors_order([(k, save_dtype if is_float(v) else v.dtype, v.shape) for k, v in extracted_loha_state_dict_global.items()])
+            with SafetensorsWriter(output_path_to_save, plan, sf_meta, sshs_hashes=True) as writer:
+                for k, _, _ in writer.plan: writer.write(k, cast(extracted_loha_state_dict_global[k]))
+                with open(temp_json_path, 'w') as f: json.dump(json_meta, f, indent=4)
             os.replace(temp_json_path, final_json_path)
             print(f"Saved: {output_path_to_save} and {final_json_path}")
         else:
+            final_sd = OrderedDict((k, cast(v)) for k, v in extracted_loha_state_dict_global.items())
             torch.save({'state_dict': final_sd, '__metadata__': sf_meta, '__extended_metadata__': json_meta}, output_path_to_save)
             print(f"Saved (basic .pt): {output_path_to_save}")
         return True
@@ -435,6 +536,60 @@ def cleanup_intermediate_files(final_intended_path: str, for_resume_management:
         except OSError as e: print(f"    Warning: Could not clean {file_info['path']}: {e}")
     if cleaned_count > 0: print(f"  Cleaned {cleaned_count} file(s).")
 
+def get_journal_dir(base_save_path: str) -> str:
+    return f"{os.path.splitext(base_save_path)[0]}_journal"
+
+def read_journal_manifest(journal_dir: str) -> dict | None:
+    manifest_path = os.path.join(journal_dir, "manifest.json")
+    if not os.path.exists(manifest_path): return None
+    try:
+        with open(manifest_path) as f: return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"    Warning: Could not read journal manifest {manifest_path}: {e}")
+        return None
+
+def load_journal(journal_dir: str) -> tuple[OrderedDict, set]:
+    """Replay journal shards in order. Modules of unreadable shards are dropped from the completed set so they get redone."""
+    manifest = read_journal_manifest(journal_dir) or {}
+    loaded_sd = OrderedDict(); completed = set(manifest.get("completed_modules", []))
+    for shard in manifest.get("shards", []):
+        try:
+            with SafetensorsReader(os.path.join(journal_dir, shard["file"])) as shard_sd: loaded_sd.update(dict(shard_sd.iter_tensors()))
+        except Exception as e:
+            print(f"    Warning: Journal shard {shard['file']} unreadable ({e}); its modules will be redone.")
+            completed.difference_update(shard.get("modules", []))
+    return loaded_sd, completed
+
+def append_journal_shard(base_save_path: str) -> bool:
+    """Write tensors produced since the last call as a new shard and update the manifest. Earlier shards are never rewritten."""
+    global journal_pending_keys_global, journal_reset_pending_global
+    journal_dir = get_journal_dir(base_save_path)
+    if journal_reset_pending_global and os.path.isdir(journal_dir):
+        if args_global and args_global.verbose: print(f"  Starting a new journal (discarding {journal_dir}).")
+        shutil.rmtree(journal_dir, ignore_errors=True)
+    journal_reset_pending_global = False
+    manifest = read_journal_manifest(journal_dir) or {"format": "loha_extraction_journal", "version": 1, "target": os.path.basename(base_save_path), "shards": [], "completed_modules": []}
+    new_keys = [k for k in extracted_loha_state_dict_global if k in journal_pending_keys_global]
+    try:
+        os.makedirs(journal_dir, exist_ok=True)
+        if new_keys:
+            shard_name = f"shard_{len(manifest['shards']) + 1:06d}.safetensors"
+            shard_path = os.path.join(journal_dir, shard_name)
+            save_safetensors({k: extracted_loha_state_dict_global[k] for k in new_keys}, shard_path)
+            manifest["shards"].append({"file": shard_name, "keys": len(new_keys), "modules": sorted({".".join(k.split('.')[:-1]) for k in new_keys})})
+        manifest["completed_modules"] = sorted(all_completed_module_prefixes_ever_global)
+        manifest["interrupted"] = save_attempted_on_interrupt
+        manifest_path = os.path.join(journal_dir, "manifest.json")
+        with open(manifest_path + ".part", 'w') as f: json.dump(manifest, f, indent=1)
+        os.replace(manifest_path + ".part", manifest_path)
+    except Exception as e:
+        print(f"Error appending to journal {journal_dir}: {e}"); traceback.print_exc()
+        return False
+    journal_pending_keys_global.difference_update(new_keys)
+    if args_global and args_global.keep_n_resume_files > 0: cleanup_intermediate_files(base_save_path, True, args_global.keep_n_resume_files)
+    print(f"\nJournal: +{len(new_keys)} tensors (shard {len(manifest['shards'])}), {len(manifest['completed_modules'])} modules completed -> {journal_dir}")
+    return True
+
 def find_best_resume_file(intended_final_path: str) -> tuple[str | None, int]:
     output_dir = os.path.dirname(intended_final_path)
     if not output_dir: output_dir = "."
@@ -448,7 +603,7 @@ def find_best_resume_file(intended_final_path: str) -> tuple[str | None, int]:
     for file_path in sorted(potential_files):
         try:
             if not os.path.exists(file_path): continue
-            with safetensors.safe_open(file_path, framework="pt", device="cpu") as f: metadata = f.metadata()
+            metadata = read_safetensors_header(file_path)[0].get("__metadata__")
             if metadata and "ss_completed_loha_modules" in metadata:
                 num_completed = len(json.loads(metadata["ss_completed_loha_modules"]))
                 if num_completed > max_completed_modules: max_completed_modules, best_file_path = num_completed, file_path
@@ -461,6 +616,10 @@ def find_best_resume_file(intended_final_path: str) -> tuple[str | None, int]:
         except Exception as e:
             print(f"    Warning: Could not read metadata from {file_path}: {e}")
             if best_file_path is None and file_path == intended_final_path and max_completed_modules == -1 : best_file_path, max_completed_modules = file_path, 0
+    journal_dir = get_journal_dir(intended_final_path)
+    journal_manifest = read_journal_manifest(journal_dir)
+    if journal_manifest is not None and len(journal_manifest.get("completed_modules", [])) > max_completed_modules:
+        best_file_path, max_completed_modules = journal_dir, len(journal_manifest["completed_modules"])
     if best_file_path: print(f"  Selected '{os.path.basename(best_file_path)}' for resume (est. {max_completed_modules} modules).")
     return best_file_path, max_completed_modules
 
@@ -471,12 +630,13 @@ def handle_resume_or_continue_loha(
     prev_completed_prefixes_ref: set,
     all_completed_prefixes_ref: set
 ):
+    global journal_reset_pending_global
     if current_args.continue_training_from_loha:
         print(f"\nMode: Continue/Refine from LoHA: {current_args.continue_training_from_loha}")
         if not os.path.exists(current_args.continue_training_from_loha):
             print(f"  Error: LoHA not found: {current_args.continue_training_from_loha}"); sys.exit(1)
         try:
-            loaded_sd = load_file(current_args.continue_training_from_loha, device='cpu')
+            with open_state_dict(current_args.continue_training_from_loha) as loha_sd: loaded_sd = dict(loha_sd.iter_tensors())
             extracted_sd_ref.update(loaded_sd) 
             module_prefixes = {".".join(k.split('.')[:-1]) for k in loaded_sd if ".hada_w1_a" in k}
             loaded_count = 0
@@ -501,32 +661,39 @@ def handle_resume_or_continue_loha(
         resume_file, num_modules_resume = find_best_resume_file(current_args.save_to) 
         if resume_file:
             print(f"  Attempting resume from: {resume_file} (est. {num_modules_resume} modules).")
+            if os.path.isdir(resume_file):
+                loaded_journal_sd, completed_in_journal = load_journal(resume_file)
+                extracted_sd_ref.update(loaded_journal_sd)
+                prev_completed_prefixes_ref.update(completed_in_journal); all_completed_prefixes_ref.update(completed_in_journal)
+                journal_reset_pending_global = False
+                print(f"  Loaded {len(completed_in_journal)} module prefixes, {len(loaded_journal_sd)} tensors from journal.")
+                return
             try:
                 completed_in_file = set()
-                with safetensors.safe_open(resume_file, framework="pt", device="cpu") as f:
-                    meta = f.metadata()
-                    if meta and "ss_completed_loha_modules" in meta:
-                        completed_in_file = set(json.loads(meta["ss_completed_loha_modules"]))
-                loaded_sd_resume = load_file(resume_file, device='cpu')
+                # Lazy reader: only the tensors of completed modules are read
+                loaded_sd_resume = SafetensorsReader(resume_file)
+                meta = loaded_sd_resume.metadata
+                if meta and "ss_completed_loha_modules" in meta:
+                    completed_in_file = set(json.loads(meta["ss_completed_loha_modules"]))
                 if not completed_in_file and loaded_sd_resume: 
-                    completed_in_file = {".".join(k.split('.')[:-1]) for k in loaded_sd_resume if k.endswith(".hada_w1_a")}
+                    completed_in_file = {".".join(k.split('.')[:-1]) for k in loaded_sd_resume if k.endswith((".hada_w1_a", ".lokr_w1"))}
                 res_tensor_count = 0
                 if completed_in_file:
-                    for k, v in loaded_sd_resume.items():
+                    for k in loaded_sd_resume:
                         module_prefix_of_key = ".".join(k.split('.')[:-1])
                         if module_prefix_of_key in completed_in_file or k.endswith(".bias"): 
-                            extracted_sd_ref[k] = v
+                            extracted_sd_ref[k] = loaded_sd_resume[k]
                             res_tensor_count += 1
                     prev_completed_prefixes_ref.update(completed_in_file)
                     all_completed_prefixes_ref.update(completed_in_file) 
                     print(f"  Loaded {len(prev_completed_prefixes_ref)} module prefixes, {res_tensor_count} tensors for resume.")
                 elif loaded_sd_resume: 
                     extracted_sd_ref.update(loaded_sd_resume)
-                    inferred_completed = {".".join(k.split('.')[:-1]) for k in loaded_sd_resume if k.endswith(".hada_w1_a")}
+                    inferred_completed = {".".join(k.split('.')[:-1]) for k in loaded_sd_resume if k.endswith((".hada_w1_a", ".lokr_w1"))}
                     prev_completed_prefixes_ref.update(inferred_completed)
                     all_completed_prefixes_ref.update(inferred_completed)
                     print(f"  Loaded all {len(loaded_sd_resume)} tensors from resume file (metadata for completed modules missing/empty, inferred {len(inferred_completed)}).")
-                del loaded_sd_resume
+                loaded_sd_resume.close()
             except Exception as e:
                 print(f"  Error loading resume file '{resume_file}': {e}. Starting fresh.")
                 extracted_sd_ref.clear()
@@ -564,8 +731,10 @@ def print_script_summary(
             stop_info = f", Stop:Proj({stat.get('projection_type_used','?')})" + proj_loss_info
         elif stat.get('stopped_by_insufficient_progress', False):
             stop_info = ", Stop:RawProg"
+        elif stat.get('stopped_by_budget', False): stop_info = ", Stop:Budget"
         alpha_str = f", Alpha: {stat.get('alpha_final', 'N/A'):.2f}" if 'alpha_final' in stat else ""
-        print(f"Layer: {stat['name']}, {rank_info}{alpha_str}, Loss: {stat['final_loss']:.4e}, Iters: {stat['iterations_done']}{stop_info}")
+        budget_str = f", Budget: {stat['budget_spent']:.1f}/{stat['budget_allotted']:.1f}{layer_budget_global['unit'][0]}" if 'budget_allotted' in stat and layer_budget_global else ""
+        print(f"Layer: {stat['name']}, {rank_info}{alpha_str}, Loss: {stat['final_loss']:.4e}, Iters: {stat['iterations_done']}{budget_str}{stop_info}")
 
     print(f"\n--- Overall Summary ---")
     print(f"Total unique LoHA modules in final state (processed, skipped, errored): {len(all_completed_prefixes)}")
@@ -574,6 +743,9 @@ def print_script_summary(
     print(f"  Skipped re-opt due to good initial loss (this session): {skipped_good_initial_session}")
     print(f"  Skipped other reasons (this session, VAE, opt error): {skipped_other_session} (incl. {skipped_vae_session} VAE)")
     print(f"  Total candidate keys scanned (this session): {keys_scanned_session}/{total_candidates}")
+    if layer_budget_global:
+        budget_stats = [st for st in layer_stats if 'budget_allotted' in st]
+        print(f"  Budget ({layer_budget_global['unit']}): spent {sum(st['budget_spent'] for st in budget_stats):.1f} of {layer_budget_global['total']:.1f} over {len(budget_stats)} layers ({sum(st.get('stopped_by_budget', False) for st in budget_stats)} cut short by their share).")
 
 def setup_and_print_configuration(current_args: argparse.Namespace):
     if current_args.progress_check_start_iter is None:
@@ -586,9 +758,16 @@ def setup_and_print_configuration(current_args: argparse.Namespace):
     print(f"Device: {current_args.device}, Opt Dtype: {target_opt_dtype}, Save Dtype: {final_save_dtype_torch}")
     if current_args.target_loss: print(f"Target Loss: {current_args.target_loss:.2e} (min iters: {current_args.min_iterations} for target check)")
     else: print(f"No Target Loss. Min iters for any early stop: {current_args.min_iterations}.")
+    if current_args.algo == "lokr": print(f"Algo: LoKr (closed-form nearest Kronecker product, factor {current_args.lokr_factor}). Optimization settings below are unused.")
+    print(f"Init: {current_args.init}")
     print(f"Max Iters/Layer: {current_args.max_iterations}, Max Rank Retries: {current_args.max_rank_retries}, Rank Incr Factor: {current_args.rank_increase_factor}")
     if current_args.save_every_n_layers > 0: print(f"Save every {current_args.save_every_n_layers} processed layers enabled.")
-    if current_args.keep_n_resume_files > 0: print(f"Keeping the {current_args.keep_n_resume_files} most recent resume files.")
+    print(f"Progress journal: {get_journal_dir(current_args.save_to)} (compacted into the final file when all layers are done).")
+    if current_args.keep_n_resume_files > 0: print(f"Keeping the {current_args.keep_n_resume_files} most recent legacy resume files.")
+    if current_args.time_budget: print(f"Time budget: {current_args.time_budget:g}s (including layer scoring), weighted by delta Frobenius norm.")
+    elif current_args.iteration_budget: print(f"Iteration budget: {current_args.iteration_budget}, weighted by delta Frobenius norm.")
+    if current_args.workers > 1: print(f"Parallel optimization: {current_args.workers} worker processes.")
+    if current_args.layer_batch_size > 1: print(f"Batched optimization: up to {current_args.layer_batch_size} same-shape layers per group, at most {current_args.layer_batch_max_mb} MB of deltas queued.")
     if current_args.progress_check_interval > 0:
         first_eval_iter = current_args.progress_check_start_iter + current_args.progress_check_interval
         print(f"Progress Check: Enabled. Interval: {current_args.progress_check_interval} iters, Min Rel. Loss Decrease: {current_args.min_progress_loss_ratio:.1e}.")
@@ -598,21 +777,38 @@ def setup_and_print_configuration(current_args: argparse.Namespace):
     else: print("Progress Check: Disabled (and Projection Check disabled).")
     return current_args
 
-def load_models(base_model_path: str, ft_model_path: str) -> tuple[OrderedDict, OrderedDict]:
-    print(f"\nLoading base model: {base_model_path}")
-    try:
-        base_sd_raw = load_file(base_model_path, device='cpu') if base_model_path.endswith(".safetensors") else torch.load(base_model_path, map_location='cpu')
-        base_model_sd = base_sd_raw.get('state_dict', base_sd_raw) if not isinstance(base_sd_raw, OrderedDict) and hasattr(base_sd_raw, 'get') else base_sd_raw
+def load_state_dict_lazy(model_path: str) -> Mapping:
+    return open_state_dict(model_path)
+
+def load_models(base_model_path: str, ft_model_path: str) -> tuple[Mapping, Mapping]:
+    print(f"\nOpening base model: {base_model_path}")
+    try: base_model_sd = load_state_dict_lazy(base_model_path)
     except Exception as e:
         print(f"Error loading base model: {e}"); traceback.print_exc(); sys.exit(1)
-    print(f"Loading fine-tuned model: {ft_model_path}")
-    try:
-        ft_sd_raw = load_file(ft_model_path, device='cpu') if ft_model_path.endswith(".safetensors") else torch.load(ft_model_path, map_location='cpu')
-        ft_model_sd = ft_sd_raw.get('state_dict', ft_sd_raw) if not isinstance(ft_sd_raw, OrderedDict) and hasattr(ft_sd_raw, 'get') else ft_sd_raw
+    print(f"Opening fine-tuned model: {ft_model_path}")
+    try: ft_model_sd = load_state_dict_lazy(ft_model_path)
     except Exception as e:
         print(f"Error loading fine-tuned model: {e}"); traceback.print_exc(); sys.exit(1)
     return base_model_sd, ft_model_sd
 
+class WeightPairPrefetcher:
+    """Returns fp32 (base, ft) weight pairs and reads the next needed pair on a background thread while the current layer is optimized."""
+    def __init__(self, base_model_sd: Mapping, ft_model_sd: Mapping, keys_in_order: list[str]):
+        self.base_model_sd, self.ft_model_sd = base_model_sd, ft_model_sd
+        self.next_key = dict(zip(keys_in_order, keys_in_order[1:]))
+        self.executor = ThreadPoolExecutor(max_workers=1); self.pending = {}
+    def _load(self, key: str) -> tuple[torch.Tensor, torch.Tensor]:
+        return self.base_model_sd[key].to(dtype=torch.float32), self.ft_model_sd[key].to(dtype=torch.float32)
+    def get(self, key: str) -> tuple[torch.Tensor, torch.Tensor]:
+        future = self.pending.pop(key, None)
+        pair = future.result() if future is not None else self._load(key)
+        for stale in self.pending.values(): stale.cancel()
+        self.pending.clear()
+        if (next_key := self.next_key.get(key)) is not None: self.pending[next_key] = self.executor.submit(self._load, next_key)
+        return pair
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True); self.pending.clear()
+
 def optimize_loha_for_layer(
     layer_name: str, delta_W_target: torch.Tensor, out_dim: int, in_dim_effective: int,
     k_h: int, k_w: int, initial_rank_for_layer: int, initial_alpha_for_layer: float,
@@ -622,7 +818,8 @@ def optimize_loha_for_layer(
     is_conv: bool = True, verbose_layer_debug: bool = False,
     max_rank_retries: int = 0,
     rank_increase_factor: float = 1.25,
-    existing_loha_layer_parameters: dict | None = None
+    existing_loha_layer_parameters: dict | None = None,
+    deadline: float | None = None
 ):
     delta_W_target = delta_W_target.to(device, dtype=dtype)
     is_initial_call_with_existing_params = existing_loha_layer_parameters is not None
@@ -634,6 +831,7 @@ def optimize_loha_for_layer(
     current_rank_for_this_attempt = initial_rank_for_layer
     alpha_init_for_this_attempt = initial_alpha_for_layer
     rank_base_for_next_increase = initial_rank_for_layer
+    iterations_all_attempts = 0; stopped_by_budget = False
 
     prog_check_interval_val = args_global.progress_check_interval
     min_prog_ratio_val = args_global.min_progress_loss_ratio
@@ -674,7 +872,8 @@ def optimize_loha_for_layer(
             out_dim, current_rank_for_this_attempt, (in_dim_effective * k_ops), device, dtype, layer_name, attempt_idx,
             (attempt_idx == 0 and is_initial_call_with_existing_params),
             params_for_initialization, current_warm_start_status,
-            prev_rank_for_warm_start_log if current_warm_start_status == 'applied' else None
+            prev_rank_for_warm_start_log if current_warm_start_status == 'applied' else None,
+            delta_W_target, alpha_init_for_this_attempt
         )
         alpha_param = nn.Parameter(torch.tensor(alpha_init_for_this_attempt, device=device, dtype=dtype))
         params_to_optimize = [hada_w1_a_p, hada_w1_b_p, hada_w2_a_p, hada_w2_b_p, alpha_param]
@@ -694,6 +893,8 @@ def optimize_loha_for_layer(
 
         for i in iter_pbar:
             current_attempt_iterations_done = i + 1
+            if deadline is not None and i > 0 and time.monotonic() >= deadline:
+                current_attempt_iterations_done = i; stopped_by_budget = True; break
             if save_attempted_on_interrupt:
                 iter_pbar.close()
                 best_result_so_far.update({'interrupted_mid_layer': True, 'projection_type_used': 'interrupted', 'iterations_done': i})
@@ -756,6 +957,7 @@ def optimize_loha_for_layer(
                 
                 loss_at_start_of_current_window = current_attempt_final_loss 
         iter_pbar.close()
+        iterations_all_attempts += current_attempt_iterations_done
         
         if current_attempt_final_loss < best_result_so_far['final_loss'] or \
            (current_attempt_final_loss == best_result_so_far['final_loss'] and current_rank_for_this_attempt < best_result_so_far['final_rank_used']):
@@ -777,6 +979,9 @@ def optimize_loha_for_layer(
         if current_attempt_stopped_early_by_loss:
             log_layer_optimization_event(LogType.TARGET_LOSS_MET_STOP_ALL_RETRIES, layer_name)
             break 
+        if stopped_by_budget:
+            if args_global.verbose: tqdm.write(f"    Layer {layer_name}: time budget used up after {iterations_all_attempts} iterations (attempt {attempt_idx+1}, R:{current_rank_for_this_attempt}).")
+            break
 
         if current_attempt_iterations_done < max_iterations and not any([current_attempt_insufficient_progress, current_attempt_stopped_by_projection, current_attempt_stopped_early_by_loss]):
             if not is_last_rank_attempt:
@@ -822,9 +1027,494 @@ def optimize_loha_for_layer(
                              ('interrupted_mid_layer', False), ('final_projected_loss_on_stop', None),
                              ('final_rank_used', initial_rank_for_layer)]:
         best_result_so_far.setdefault(key, default_val)
+    best_result_so_far.update({'stopped_by_budget': stopped_by_budget, 'iterations_total': iterations_all_attempts})
     return best_result_so_far
 
 
+def _batched_adamw_step(params: list[torch.Tensor], state: dict, lr: torch.Tensor, weight_decay: float,
+                        betas: tuple[float, float] = (0.9, 0.999), eps: float = 1e-8):
+    # Same update as torch.optim.AdamW, but with one learning rate per layer along dim 0
+    # so each member of a batched group can follow its own ReduceLROnPlateau schedule.
+    state['step'] = state.get('step', 0) + 1
+    beta1, beta2 = betas
+    bias_correction1 = 1 - beta1 ** state['step']
+    bias_correction2_sqrt = math.sqrt(1 - beta2 ** state['step'])
+    with torch.no_grad():
+        for idx, p in enumerate(params):
+            if p.grad is None: continue
+            lr_b = lr.view(-1, *([1] * (p.dim() - 1)))
+            exp_avg, exp_avg_sq = state.setdefault(idx, (torch.zeros_like(p), torch.zeros_like(p)))
+            p.mul_(1 - lr_b * weight_decay)
+            exp_avg.lerp_(p.grad, 1 - beta1)
+            exp_avg_sq.mul_(beta2).addcmul_(p.grad, p.grad, value=1 - beta2)
+            denom = (exp_avg_sq.sqrt() / bias_correction2_sqrt).add_(eps)
+            p.sub_((lr_b / bias_correction1) * exp_avg / denom)
+
+def _plateau_step(sched: dict, loss: float) -> float:
+    # Per-layer equivalent of ReduceLROnPlateau('min', threshold=1e-4, threshold_mode='rel').
+    if loss < sched['best'] * (1 - 1e-4):
+        sched['best'] = loss; sched['num_bad'] = 0
+    else:
+        sched['num_bad'] += 1
+    if sched['num_bad'] > sched['patience']:
+        new_lr = max(sched['lr'] * sched['factor'], sched['min_lr'])
+        if sched['lr'] - new_lr > 1e-8: sched['lr'] = new_lr
+        sched['num_bad'] = 0
+    return sched['lr']
+
+def optimize_loha_group(
+    layer_names: list[str], delta_W_targets: list[torch.Tensor], out_dim: int, in_dim_effective: int,
+    k_h: int, k_w: int, initial_rank_for_layer: int, initial_alpha_for_layer: float,
+    lr: float = 1e-3, max_iterations: int = 1000, min_iterations: int = 100,
+    target_loss: float = None, weight_decay: float = 1e-4,
+    device: str = 'cuda', dtype: torch.dtype = torch.float32,
+    is_conv: bool = True, max_rank_retries: int = 0, rank_increase_factor: float = 1.25
+) -> list[dict]:
+    """
+    Batched counterpart of optimize_loha_for_layer for layers sharing (out_dim, in_dim, k_h, k_w, rank).
+    The factors of the whole group are stacked and optimized with bmm, while loss, LR schedule,
+    early stopping and rank retries are tracked separately for every layer. Returns one result
+    dict per layer in the same format as optimize_loha_for_layer.
+    """
+    num_layers = len(layer_names)
+    k_ops = k_h * k_w if is_conv else 1
+    in_dim_flat = in_dim_effective * k_ops
+    targets_all = torch.stack([t.reshape(out_dim, in_dim_flat) for t in delta_W_targets]).to(device, dtype=dtype)
+    best_results = [{
+        'final_loss': float('inf'), 'stopped_early_by_loss': False, 'stopped_by_insufficient_progress': False,
+        'stopped_by_projection': False, 'projection_type_used': 'none', 'iterations_done': 0,
+        'final_rank_used': initial_rank_for_layer, 'interrupted_mid_layer': False, 'final_projected_loss_on_stop': None
+    } for _ in range(num_layers)]
+
+    prog_check_interval_val = args_global.progress_check_interval
+    min_prog_ratio_val = args_global.min_progress_loss_ratio
+    iter_to_begin_first_progress_window = args_global.progress_check_start_iter
+    adv_proj_decay_cap_min_val = getattr(args_global, 'advanced_projection_decay_cap_min', 0.5)
+    adv_proj_decay_cap_max_val = getattr(args_global, 'advanced_projection_decay_cap_max', 1.05)
+    proj_sample_interval_val = getattr(args_global, 'projection_sample_interval', 20)
+    proj_ema_alpha_val = getattr(args_global, 'projection_ema_alpha', 0.1)
+    proj_min_ema_hist_val = getattr(args_global, 'projection_min_ema_history', 5)
+
+    members = list(range(num_layers))  # layers still taking part in the current attempt
+    current_rank_for_this_attempt = initial_rank_for_layer
+    alpha_init_for_this_attempt = initial_alpha_for_layer
+
+    for attempt_idx in range(max_rank_retries + 1):
+        is_last_rank_attempt = (attempt_idx == max_rank_retries)
+        if save_attempted_on_interrupt:
+            for b in members: best_results[b].update({'interrupted_mid_layer': True, 'projection_type_used': 'interrupted'})
+            break
+        if not members: break
+
+        warm_start_statuses = {}
+        if attempt_idx > 0:
+            prev_rank = current_rank_for_this_attempt
+            current_rank_for_this_attempt = max(prev_rank + 1, math.ceil(prev_rank * rank_increase_factor))
+            original_alpha_to_rank_ratio = initial_alpha_for_layer / float(initial_rank_for_layer) if initial_rank_for_layer > 0 else 1.0
+            alpha_init_for_this_attempt = original_alpha_to_rank_ratio * float(current_rank_for_this_attempt)
+            for b in members:
+                best = best_results[b]
+                log_layer_optimization_event(LogType.RANK_RETRY_STARTING, layer_names[b], prev_rank=prev_rank, prev_best_loss=best.get('final_loss', float('inf')))
+                if 'hada_w1_a' in best and not args_global.no_warm_start:
+                    warm_start_statuses[b] = 'applied' if best['final_rank_used'] < current_rank_for_this_attempt else 'skipped_cannot_warm_start'
+                elif args_global.no_warm_start and 'hada_w1_a' in best: warm_start_statuses[b] = 'skipped_no_warm_start_arg'
+                else: warm_start_statuses[b] = 'no_prior_params_for_warm_start'
+                log_layer_optimization_event(LogType.RANK_INCREASED_INFO, layer_names[b], new_rank=current_rank_for_this_attempt, new_alpha=alpha_init_for_this_attempt, warm_start_status=warm_start_statuses[b], prev_rank_for_warm_start=best.get('final_rank_used'))
+
+        init_params = []
+        for b in members:
+            status = warm_start_statuses.get(b)
+            init_params.append(initialize_loha_parameters(
+                out_dim, current_rank_for_this_attempt, in_dim_flat, device, dtype, layer_names[b], attempt_idx, False,
+                best_results[b] if status == 'applied' else None, status,
+                best_results[b]['final_rank_used'] if status == 'applied' else None,
+                targets_all[b], alpha_init_for_this_attempt
+            ))
+        hada_w1_a, hada_w1_b, hada_w2_a, hada_w2_b = (torch.stack([p[i].data for p in init_params]).requires_grad_(True) for i in range(4))
+        alpha_param = torch.full((len(members),), alpha_init_for_this_attempt, device=device, dtype=dtype, requires_grad=True)
+        params_to_optimize = [hada_w1_a, hada_w1_b, hada_w2_a, hada_w2_b, alpha_param]
+        del init_params
+        targets = targets_all[members]
+        adam_state = {}
+        schedulers = [{'lr': lr, 'best': float('inf'), 'num_bad': 0, 'patience': max(10, int(max_iterations * 0.05)), 'factor': 0.5, 'min_lr': max(1e-7, lr * 0.001)} for _ in members]
+        lr_tensor = torch.full((len(members),), lr, device=device, dtype=dtype)
+
+        # per-member bookkeeping, indexed by position in `members`
+        n = len(members)
+        final_loss = [float('inf')] * n; iterations_done = [0] * n
+        stopped_by_loss = [False] * n; insufficient_progress = [False] * n; stopped_by_projection = [False] * n
+        projection_type = ["none"] * n; projected_loss_if_failed = [None] * n
+        loss_at_window_start = [float('inf')] * n; window_started = [False] * n
+        rel_imprv_history = [[] for _ in range(n)]; ema_history = [[] for _ in range(n)]; ema_value = [None] * n
+        active = [True] * n; snapshots = [None] * n
+        active_mask = torch.ones(n, device=device, dtype=dtype)
+
+        def snapshot(j):
+            snapshots[j] = {
+                'hada_w1_a': hada_w1_a.data[j].cpu().contiguous(), 'hada_w1_b': hada_w1_b.data[j].cpu().contiguous(),
+                'hada_w2_a': hada_w2_a.data[j].cpu().contiguous(), 'hada_w2_b': hada_w2_b.data[j].cpu().contiguous(),
+                'alpha': alpha_param.data[j].cpu().contiguous()
+            }
+
+        iter_pbar = tqdm(range(max_iterations), desc=f"Opt Att {attempt_idx+1}/{max_rank_retries+1} (R:{current_rank_for_this_attempt}){' [LastRank]' if is_last_rank_attempt else ''}: group of {n} [{out_dim}x{in_dim_flat}]", leave=False, dynamic_ncols=True, position=1, mininterval=0.5)
+        for i in iter_pbar:
+            if save_attempted_on_interrupt:
+                iter_pbar.close()
+                for b in members: best_results[b].update({'interrupted_mid_layer': True, 'projection_type_used': 'interrupted'})
+                members = []
+                break
+            cur_iter = i + 1
+            for j in range(n):
+                if active[j] and prog_check_interval_val > 0 and not window_started[j] and cur_iter >= iter_to_begin_first_progress_window:
+                    loss_at_window_start[j] = final_loss[j]; window_started[j] = True
+
+            for p in params_to_optimize: p.grad = None
+            eff_alpha_scale = (alpha_param / current_rank_for_this_attempt).view(n, 1, 1)
+            delta_W_loha = eff_alpha_scale * torch.bmm(hada_w1_a, hada_w1_b) * torch.bmm(hada_w2_a, hada_w2_b)
+            per_layer_loss = (delta_W_loha - targets).pow(2).mean(dim=(1, 2))
+            # summing keeps each layer's gradient identical to its own mse_loss; stopped layers are masked out
+            (per_layer_loss * active_mask).sum().backward()
+            _batched_adamw_step(params_to_optimize, adam_state, lr_tensor, weight_decay)
+            losses = per_layer_loss.detach().tolist()  # one host sync for the whole group
+
+            newly_stopped = []
+            for j in range(n):
+                if not active[j]: continue
+                b = members[j]; layer_name = layer_names[b]; loss_j = losses[j]
+                if i == 0 and window_started[j] and loss_at_window_start[j] == float('inf'): loss_at_window_start[j] = loss_j
+                final_loss[j] = loss_j; iterations_done[j] = cur_iter
+                prev_lr = schedulers[j]['lr']
+                if _plateau_step(schedulers[j], loss_j) != prev_lr: lr_tensor[j] = schedulers[j]['lr']
+
+                if target_loss is not None and prog_check_interval_val > 0 and cur_iter % proj_sample_interval_val == 0:
+                    ema_value[j] = proj_ema_alpha_val * loss_j + (1 - proj_ema_alpha_val) * ema_value[j] if ema_value[j] is not None else loss_j
+                    ema_history[j].append((cur_iter, ema_value[j]))
+
+                if target_loss is not None and cur_iter >= min_iterations and loss_j <= target_loss:
+                    log_layer_optimization_event(LogType.TARGET_LOSS_REACHED_IN_ATTEMPT, layer_name, attempt=attempt_idx+1, rank=current_rank_for_this_attempt, target_loss=target_loss, iter=cur_iter)
+                    stopped_by_loss[j] = True; newly_stopped.append(j); continue
+
+                if prog_check_interval_val > 0 and window_started[j] and \
+                   (cur_iter >= iter_to_begin_first_progress_window + prog_check_interval_val) and \
+                   (((cur_iter - iter_to_begin_first_progress_window) % prog_check_interval_val) == 0):
+                    perform_early_stop_checks = not is_last_rank_attempt
+                    stop_insufficient_prog, _ = check_insufficient_progress(
+                        loss_j, loss_at_window_start[j], min_prog_ratio_val, target_loss,
+                        perform_early_stop_checks, layer_name, attempt_idx, current_rank_for_this_attempt
+                    )
+                    if stop_insufficient_prog:
+                        insufficient_progress[j] = True; newly_stopped.append(j); continue
+                    if target_loss is not None and loss_j > target_loss:
+                        raw_rel_imprv = (loss_at_window_start[j] - loss_j) / loss_at_window_start[j] if loss_at_window_start[j] > 1e-12 and loss_at_window_start[j] > loss_j else 0.0
+                        stop_projection, proj_details = check_loss_projection(
+                            ema_history[j], loss_j, raw_rel_imprv, target_loss,
+                            max_iterations, cur_iter, prog_check_interval_val,
+                            proj_min_ema_hist_val, adv_proj_decay_cap_min_val, adv_proj_decay_cap_max_val,
+                            perform_early_stop_checks, layer_name, attempt_idx, current_rank_for_this_attempt,
+                            rel_imprv_history[j]
+                        )
+                        if proj_details:
+                            projection_type[j] = proj_details.get('proj_type', 'none')
+                            if stop_projection: projected_loss_if_failed[j] = proj_details.get('proj_final_loss')
+                        if stop_projection:
+                            stopped_by_projection[j] = True; newly_stopped.append(j); continue
+                    loss_at_window_start[j] = loss_j
+
+            for j in newly_stopped:
+                active[j] = False; active_mask[j] = 0; snapshot(j)
+            num_active = sum(active)
+            iter_pbar.set_postfix_str(f"Active={num_active}/{n}, MinLoss={min(final_loss):.3e}, MaxLoss={max(final_loss):.3e}", refresh=False)
+            if num_active == 0: break
+        iter_pbar.close()
+        if not members: break
+
+        for j in range(n):
+            if snapshots[j] is None: snapshot(j)
+
+        next_members = []
+        for j, b in enumerate(members):
+            layer_name = layer_names[b]; best = best_results[b]
+            if final_loss[j] < best['final_loss'] or (final_loss[j] == best['final_loss'] and current_rank_for_this_attempt < best['final_rank_used']):
+                log_layer_optimization_event(LogType.NEW_BEST_RESULT_FOR_LAYER, layer_name, attempt=attempt_idx+1, rank=current_rank_for_this_attempt, loss=final_loss[j])
+                best.update(snapshots[j])
+                best.update({
+                    'final_loss': final_loss[j], 'stopped_early_by_loss': stopped_by_loss[j],
+                    'stopped_by_insufficient_progress': insufficient_progress[j],
+                    'stopped_by_projection': stopped_by_projection[j], 'projection_type_used': projection_type[j],
+                    'iterations_done': iterations_done[j], 'final_rank_used': current_rank_for_this_attempt,
+                    'interrupted_mid_layer': False,
+                    'final_projected_loss_on_stop': projected_loss_if_failed[j] if stopped_by_projection[j] else None
+                })
+            if stopped_by_loss[j]:
+                log_layer_optimization_event(LogType.TARGET_LOSS_MET_STOP_ALL_RETRIES, layer_name)
+                continue
+            if iterations_done[j] < max_iterations and not (insufficient_progress[j] or stopped_by_projection[j]) and not is_last_rank_attempt:
+                log_layer_optimization_event(LogType.ATTEMPT_EARLY_FINISH_NO_STOP_FLAG, layer_name, attempt=attempt_idx+1, rank=current_rank_for_this_attempt, iters_done=iterations_done[j], max_iters=max_iterations)
+            if is_last_rank_attempt:
+                if not (insufficient_progress[j] or stopped_by_projection[j]):
+                    check_insufficient_progress(final_loss[j], loss_at_window_start[j], min_prog_ratio_val, target_loss, False, layer_name, attempt_idx, current_rank_for_this_attempt)
+                    if target_loss and final_loss[j] > target_loss and prog_check_interval_val > 0:
+                        raw_rel_imprv_last = (loss_at_window_start[j] - final_loss[j]) / loss_at_window_start[j] if loss_at_window_start[j] > 1e-12 and loss_at_window_start[j] > final_loss[j] else 0.0
+                        _, proj_log_details_last = check_loss_projection(
+                            ema_history[j], final_loss[j], raw_rel_imprv_last, target_loss,
+                            max_iterations, iterations_done[j], prog_check_interval_val,
+                            proj_min_ema_hist_val, adv_proj_decay_cap_min_val, adv_proj_decay_cap_max_val,
+                            False, layer_name, attempt_idx, current_rank_for_this_attempt, rel_imprv_history[j]
+                        )
+                        if proj_log_details_last:
+                            best['projection_type_used'] = proj_log_details_last.get('proj_type', best['projection_type_used'])
+                            best['final_projected_loss_on_stop'] = proj_log_details_last.get('proj_final_loss', best['final_projected_loss_on_stop'])
+                log_layer_optimization_event(LogType.LAST_RANK_ATTEMPT_SUMMARY, layer_name, target_loss=target_loss,
+                                             final_loss_for_layer=best['final_loss'], final_rank_for_layer=best['final_rank_used'])
+                continue
+            reason_kwargs = {'attempt': attempt_idx + 1, 'rank': current_rank_for_this_attempt, 'is_last_rank_attempt': is_last_rank_attempt}
+            if stopped_by_projection[j]:
+                reason_kwargs.update({'reason_type': 'projection_unreachable', 'target_loss': target_loss, 'proj_final_loss': projected_loss_if_failed[j], 'proj_type': projection_type[j]})
+            elif insufficient_progress[j]:
+                reason_kwargs.update({'reason_type': 'insufficient_progress'})
+            elif iterations_done[j] >= max_iterations:
+                reason_kwargs.update({'reason_type': 'max_iterations_no_target' if target_loss else 'max_iterations_no_target_set', 'current_loss': final_loss[j]})
+            if 'reason_type' in reason_kwargs:
+                log_layer_optimization_event(LogType.ATTEMPT_ENDED_WILL_RETRY, layer_name, **reason_kwargs)
+            next_members.append(b)
+        members = next_members
+        del hada_w1_a, hada_w1_b, hada_w2_a, hada_w2_b, alpha_param, params_to_optimize, adam_state, targets
+
+    results = []
+    for b, best in enumerate(best_results):
+        if 'hada_w1_a' not in best:
+            log_layer_optimization_event(LogType.NO_VALID_OPTIMIZATION_RESULT, layer_names[b])
+            results.append({'final_loss': float('inf'), 'interrupted_mid_layer': True, 'final_rank_used': initial_rank_for_layer, 'iterations_done': 0})
+            continue
+        results.append(best)
+    return results
+
+
+def factorization(dimension: int, factor: int = -1) -> tuple[int, int]:
+    """Split `dimension` into (m, n) with m <= n and m * n == dimension, matching LyCORIS' LoKr factorization."""
+    if factor > 0 and dimension % factor == 0:
+        m, n = factor, dimension // factor
+        return (n, m) if m > n else (m, n)
+    if factor < 0: factor = dimension
+    m, n = 1, dimension
+    length = m + n
+    while m < n:
+        new_m = m + 1
+        while dimension % new_m != 0: new_m += 1
+        new_n = dimension // new_m
+        if new_m + new_n > length or new_m > factor: break
+        m, n = new_m, new_n
+    return (n, m) if m > n else (m, n)
+
+@torch.no_grad()
+def extract_lokr_for_layer(layer_name: str, delta_W: torch.Tensor, factor: int, device: str) -> dict:
+    """Nearest Kronecker product kron(lokr_w1, lokr_w2) ~ delta_W via the Van Loan rearrangement and a rank-1 SVD."""
+    out_dim, in_dim = delta_W.shape[0], delta_W.shape[1]
+    out_l, out_k = factorization(out_dim, factor); in_m, in_n = factorization(in_dim, factor)
+    kernel = tuple(delta_W.shape[2:])
+    W = delta_W.to(device, dtype=torch.float32)
+    # Rearrange so that every (out_l, in_m) block of W becomes one row; kron(A, B) then maps to vec(A) vec(B)^T.
+    R = W.reshape(out_l, out_k, in_m, in_n, *kernel).transpose(1, 2).reshape(out_l * in_m, -1)
+    try:
+        U, S, Vh = torch.linalg.svd(R, full_matrices=False)
+    except Exception as e:
+        tqdm.write(f"  Warn: LoKr SVD failed for {layer_name}: {e}")
+        return {'final_loss': float('inf'), 'interrupted_mid_layer': False}
+    s_sqrt = S[0].sqrt()
+    w1 = (U[:, 0] * s_sqrt).reshape(out_l, in_m)
+    w2 = (Vh[0] * s_sqrt).reshape(out_k, in_n, *kernel)
+    rebuilt = torch.kron(w1[(...,) + (None,) * len(kernel)] if kernel else w1, w2)
+    final_loss = F.mse_loss(rebuilt, W).item()
+    return {
+        'lokr_w1': w1.cpu().contiguous(), 'lokr_w2': w2.cpu().contiguous(),
+        'final_loss': final_loss, 'stopped_early_by_loss': False, 'stopped_by_insufficient_progress': False,
+        'stopped_by_projection': False, 'projection_type_used': 'closed_form', 'iterations_done': 0,
+        'final_rank_used': 1, 'interrupted_mid_layer': False, 'final_projected_loss_on_stop': None
+    }
+
+
+def record_optimized_layer(
+    loha_key_prefix: str, original_module_path: str, initial_rank_opt: int, opt_results: dict,
+    base_model_sd: dict, ft_model_sd: dict, final_save_dtype_torch: torch.dtype
+) -> bool:
+    global processed_layers_this_session_count_global, skipped_other_reason_count_global
+    has_params = 'hada_w1_a' in opt_results or 'lokr_w1' in opt_results
+    if not opt_results.get('interrupted_mid_layer') and has_params :
+        for p_name, p_val in opt_results.items():
+            if p_name not in ['final_loss', 'stopped_early_by_loss', 'stopped_by_insufficient_progress', 'stopped_by_projection', 'projection_type_used', 'iterations_done', 'final_rank_used', 'interrupted_mid_layer', 'final_projected_loss_on_stop']:
+                if torch.is_tensor(p_val):
+                    extracted_loha_state_dict_global[f'{loha_key_prefix}.{p_name}'] = p_val.to(final_save_dtype_torch)
+                    journal_pending_keys_global.add(f'{loha_key_prefix}.{p_name}')
+        final_rank_used = opt_results['final_rank_used']
+        stat_entry = {"name": str(loha_key_prefix),"original_name": str(original_module_path),"initial_rank_attempted": int(initial_rank_opt),"final_rank_used": int(final_rank_used),"rank_was_increased": bool(final_rank_used > initial_rank_opt),"final_loss": float(opt_results['final_loss']),"alpha_final": float(opt_results['alpha'].item()) if isinstance(opt_results.get('alpha'), torch.Tensor) else float(opt_results.get('alpha', 0.0)),"iterations_done": int(opt_results['iterations_done']),"stopped_early_by_loss_target": bool(opt_results['stopped_early_by_loss']),"stopped_by_insufficient_progress": bool(opt_results.get('stopped_by_insufficient_progress', False)),"stopped_by_projection": bool(opt_results.get('stopped_by_projection', False)),"projection_type_used": str(opt_results.get('projection_type_used', 'none')),"final_projected_loss_on_stop": float(l_val) if (l_val := opt_results.get('final_projected_loss_on_stop')) is not None else None,"skipped_reopt_due_to_initial_good_loss": False,"interrupted_mid_layer": bool(opt_results.get('interrupted_mid_layer', False))}
+        if 'budget_allotted' in opt_results:
+            stat_entry.update({"budget_allotted": float(opt_results['budget_allotted']), "budget_spent": float(opt_results['budget_spent']), "stopped_by_budget": bool(opt_results.get('stopped_by_budget', False))})
+        layer_optimization_stats_global.append(stat_entry)
+        all_completed_module_prefixes_ever_global.add(loha_key_prefix)
+        stop_reason_short = ""
+        if opt_results['stopped_early_by_loss']: stop_reason_short = ", Stop:LossTarget"
+        elif opt_results.get('stopped_by_projection', False): stop_reason_short = f", Stop:Proj({opt_results.get('projection_type_used','?')})"
+        elif opt_results['stopped_by_insufficient_progress']: stop_reason_short = ", Stop:RawProg"
+        elif opt_results.get('stopped_by_budget', False): stop_reason_short = ", Stop:Budget"
+        tqdm.write(f"  Layer {loha_key_prefix} Opt. Done. R_used: {final_rank_used}, FinalLoss: {opt_results['final_loss']:.4e}, Iters: {opt_results['iterations_done']}{stop_reason_short}")
+        if args_global.use_bias:
+            bias_key = f"{original_module_path}.bias"
+            if bias_key in ft_model_sd and (bias_key not in base_model_sd or not torch.allclose(base_model_sd[bias_key], ft_model_sd[bias_key], atol=args_global.atol_fp32_check)):
+                extracted_loha_state_dict_global[bias_key] = ft_model_sd[bias_key].cpu().to(final_save_dtype_torch)
+                journal_pending_keys_global.add(bias_key)
+                if args_global.verbose: tqdm.write(f"    Saved differing/new bias for {bias_key}")
+        processed_layers_this_session_count_global += 1
+        return True
+    tqdm.write(f"  Optimization for {loha_key_prefix} did not yield saveable results (Interrupt: {opt_results.get('interrupted_mid_layer', 'N/A')}, Loss: {opt_results.get('final_loss', 'N/A')})")
+    if not opt_results.get('interrupted_mid_layer', False) and not has_params :
+        skipped_other_reason_count_global += 1
+        all_completed_module_prefixes_ever_global.add(loha_key_prefix)
+    return False
+
+def maybe_periodic_save(keys_scanned: int, total_candidates: int):
+    global last_periodic_save_count_global
+    n = args_global.save_every_n_layers
+    processed = processed_layers_this_session_count_global
+    # batched groups can complete several layers at once, so compare buckets instead of an exact modulo
+    if n > 0 and processed > 0 and processed // n > last_periodic_save_count_global // n and keys_scanned < total_candidates:
+        last_periodic_save_count_global = processed
+        tqdm.write(f"\n--- Periodic Save: Processed {processed} layers this session. Appending to journal ---")
+        append_journal_shard(args_global.save_to)
+
+def flush_layer_group(group_key: tuple, base_model_sd: dict, ft_model_sd: dict, target_opt_dtype: torch.dtype, final_save_dtype_torch: torch.dtype):
+    group = pending_layer_groups_global.pop(group_key, [])
+    if not group: return
+    out_dim, in_dim_effective, k_h, k_w, initial_rank_opt, initial_alpha_opt = group_key
+    is_conv = k_h is not None
+    if len(group) == 1:
+        entry = group[0]
+        results = [optimize_loha_for_layer(entry['loha_key_prefix'], entry['delta'], out_dim, in_dim_effective, k_h, k_w, initial_rank_opt, initial_alpha_opt, args_global.lr, args_global.max_iterations, args_global.min_iterations, args_global.target_loss, args_global.weight_decay, args_global.device, target_opt_dtype, is_conv, args_global.verbose_layer_debug, args_global.max_rank_retries, args_global.rank_increase_factor, None)]
+    else:
+        if args_global.verbose: tqdm.write(f"\n--- Batched group: {len(group)} layers of shape {out_dim}x{in_dim_effective}{f'x{k_h}x{k_w}' if is_conv else ''}, R:{initial_rank_opt} ---")
+        results = optimize_loha_group([e['loha_key_prefix'] for e in group], [e['delta'] for e in group], out_dim, in_dim_effective, k_h, k_w, initial_rank_opt, initial_alpha_opt, args_global.lr, args_global.max_iterations, args_global.min_iterations, args_global.target_loss, args_global.weight_decay, args_global.device, target_opt_dtype, is_conv, args_global.max_rank_retries, args_global.rank_increase_factor)
+    for entry, opt_results in zip(group, results):
+        record_optimized_layer(entry['loha_key_prefix'], entry['original_module_path'], initial_rank_opt, opt_results, base_model_sd, ft_model_sd, final_save_dtype_torch)
+
+def pending_group_bytes(group: list) -> int:
+    return sum(e['delta'].numel() * e['delta'].element_size() for e in group)
+
+def flush_oversized_layer_groups(base_model_sd: dict, ft_model_sd: dict, target_opt_dtype: torch.dtype, final_save_dtype_torch: torch.dtype) -> bool:
+    """While the queued fp32 deltas exceed --layer_batch_max_mb, flush the largest group even if it is not full. Returns True if any group was flushed."""
+    cap_bytes, flushed = args_global.layer_batch_max_mb * 2**20, False
+    while pending_layer_groups_global:
+        group_bytes = {k: pending_group_bytes(g) for k, g in pending_layer_groups_global.items()}
+        if sum(group_bytes.values()) <= cap_bytes: break
+        group_key = max(group_bytes, key=group_bytes.get)
+        if args_global.verbose: tqdm.write(f"  Queued deltas exceed {args_global.layer_batch_max_mb} MB; flushing partial group of {len(pending_layer_groups_global[group_key])} layers ({group_bytes[group_key] / 2**20:.0f} MB).")
+        flush_layer_group(group_key, base_model_sd, ft_model_sd, target_opt_dtype, final_save_dtype_torch)
+        flushed = True
+    return flushed
+
+
+def _init_extraction_worker(worker_args: argparse.Namespace, num_threads: int):
+    global args_global
+    args_global = worker_args
+    torch.set_num_threads(num_threads)
+    signal.signal(signal.SIGINT, _handle_worker_interrupt)
+
+def _handle_worker_interrupt(signum, frame):
+    # The parent process owns the graceful save; workers only stop their current layer early.
+    global save_attempted_on_interrupt
+    save_attempted_on_interrupt = True
+
+def _optimize_layer_in_worker(job: dict, delta_W: torch.Tensor, target_opt_dtype: torch.dtype) -> dict:
+    return optimize_loha_for_layer(job['loha_key_prefix'], delta_W, job['out_dim'], job['in_dim_effective'], job['k_h'], job['k_w'], job['initial_rank'], job['initial_alpha'], args_global.lr, args_global.max_iterations, args_global.min_iterations, args_global.target_loss, args_global.weight_decay, args_global.device, target_opt_dtype, job['k_h'] is not None, args_global.verbose_layer_debug, job['max_retries'], args_global.rank_increase_factor, job['existing_params'])
+
+def run_parallel_layer_jobs(jobs: list[dict], base_model_sd: dict, ft_model_sd: dict, target_opt_dtype: torch.dtype, final_save_dtype_torch: torch.dtype):
+    """Optimize queued layers on --workers processes, largest first. Results are recorded and saved by this (single writer) process."""
+    global worker_pool_global
+    if not jobs: return
+    jobs = sorted(jobs, key=lambda j: j['numel'], reverse=True)
+    n_workers = args_global.workers
+    threads_per_worker = args_global.worker_threads or max(1, (os.cpu_count() or 1) // n_workers)
+    print(f"\nOptimizing {len(jobs)} layers on {n_workers} worker processes ({threads_per_worker} torch threads each).")
+    job_iter = iter(jobs); in_flight = {}; completed = 0
+    pbar = tqdm(total=len(jobs), desc=f"Workers x{n_workers}", dynamic_ncols=True, position=0)
+    worker_pool_global = ProcessPoolExecutor(max_workers=n_workers, mp_context=torch.multiprocessing.get_context("spawn"), initializer=_init_extraction_worker, initargs=(args_global, threads_per_worker))
+    def submit_next() -> bool:
+        global skipped_identical_count_global
+        nonlocal completed
+        while (job := next(job_iter, None)) is not None:
+            # deltas are read and built on submission only, so ~2 per worker are held in memory at a time
+            delta_W = ft_model_sd[job['key_name']].to(dtype=torch.float32) - base_model_sd[job['key_name']].to(dtype=torch.float32)
+            if torch.allclose(delta_W, torch.zeros_like(delta_W), atol=args_global.atol_fp32_check):
+                if args_global.verbose_layer_debug: tqdm.write(f"  Skipping {job['loha_key_prefix']} (weights identical atol={args_global.atol_fp32_check:.1e}).")
+                skipped_identical_count_global += 1
+                all_completed_module_prefixes_ever_global.add(job['loha_key_prefix'])
+                completed += 1; pbar.update(1)
+                continue
+            in_flight[worker_pool_global.submit(_optimize_layer_in_worker, job, delta_W, target_opt_dtype)] = job
+            return True
+        return False
+    try:
+        for _ in range(2 * n_workers):
+            if not submit_next(): break
+        while in_flight and not save_attempted_on_interrupt:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                try: opt_results = future.result()
+                except Exception as e:
+                    tqdm.write(f"  Worker failed on {job['loha_key_prefix']}: {e}")
+                    opt_results = {'final_loss': float('inf'), 'interrupted_mid_layer': False}
+                record_optimized_layer(job['loha_key_prefix'], job['original_module_path'], job['initial_rank'], opt_results, base_model_sd, ft_model_sd, final_save_dtype_torch)
+                completed += 1; pbar.update(1)
+                maybe_periodic_save(completed, len(jobs))
+                if not save_attempted_on_interrupt: submit_next()
+    finally:
+        pbar.close()
+        worker_pool_global.shutdown(wait=not save_attempted_on_interrupt, cancel_futures=True)
+        worker_pool_global = None
+
+
+def run_init_benchmark(base_model_sd: dict, ft_model_sd: dict, all_candidate_keys: list[str], num_layers: int, target_opt_dtype: torch.dtype):
+    """Optimize the first `num_layers` differing layers with each initializer and compare iterations/time to --target_loss."""
+    selected = []
+    for key_name in all_candidate_keys:
+        if len(selected) >= num_layers: break
+        original_module_path = key_name[:-len(".weight")]
+        if any(vp in original_module_path for vp in [".encoder.", ".decoder.", ".quant_conv."]) and any(tp in original_module_path for tp in ["first_stage_model.", "autoencoder."]): continue
+        delta_W = ft_model_sd[key_name].to(dtype=torch.float32) - base_model_sd[key_name].to(dtype=torch.float32)
+        if torch.allclose(delta_W, torch.zeros_like(delta_W), atol=args_global.atol_fp32_check): continue
+        selected.append((original_module_path, delta_W))
+    if not selected:
+        print("No differing layers found to benchmark."); return
+    target_desc = f"{args_global.target_loss:.2e}" if args_global.target_loss is not None else "none (runs to --max_iterations)"
+    print(f"\n--- Init Benchmark: {len(selected)} layers, target loss {target_desc}, max iters {args_global.max_iterations} ---")
+    original_init = args_global.init
+    totals = {name: {'iters': 0, 'time': 0.0, 'reached': 0} for name in ['kaiming', 'svd']}
+    try:
+        for original_module_path, delta_W in selected:
+            out_dim, in_dim_effective, k_h, k_w, is_conv = get_module_shape_info_from_weight(delta_W)
+            rank = args_global.conv_rank if is_conv and args_global.conv_rank is not None else args_global.rank
+            alpha = args_global.initial_conv_alpha if is_conv else args_global.initial_alpha
+            row = []
+            for init_name in ['kaiming', 'svd']:
+                args_global.init = init_name
+                if str(args_global.device).startswith("cuda"): torch.cuda.synchronize()
+                t_start = time.perf_counter()
+                res = optimize_loha_for_layer(original_module_path, delta_W, out_dim, in_dim_effective, k_h, k_w, rank, alpha, args_global.lr, args_global.max_iterations, args_global.min_iterations, args_global.target_loss, args_global.weight_decay, args_global.device, target_opt_dtype, is_conv, args_global.verbose_layer_debug, 0, args_global.rank_increase_factor, None)
+                if str(args_global.device).startswith("cuda"): torch.cuda.synchronize()
+                elapsed = time.perf_counter() - t_start
+                reached = args_global.target_loss is not None and res['final_loss'] <= args_global.target_loss
+                totals[init_name]['iters'] += res['iterations_done']; totals[init_name]['time'] += elapsed; totals[init_name]['reached'] += int(reached)
+                row.append(f"{init_name}: {res['iterations_done']:>5} it, {elapsed:7.2f}s, loss {res['final_loss']:.3e}{' (target)' if reached else ''}")
+                if save_attempted_on_interrupt: return
+            print(f"{original_module_path:60} | " + " | ".join(row))
+    finally:
+        args_global.init = original_init
+    print("\n--- Init Benchmark Summary ---")
+    for init_name, t in totals.items():
+        print(f"  {init_name:8}: total iters {t['iters']}, total time {t['time']:.2f}s, reached target {t['reached']}/{len(selected)}")
+    if totals['kaiming']['iters'] > 0 and totals['kaiming']['time'] > 0:
+        print(f"  svd vs kaiming: {totals['svd']['iters'] / totals['kaiming']['iters']:.2f}x iterations, {totals['svd']['time'] / totals['kaiming']['time']:.2f}x wall-clock")
+
+
 def handle_interrupt(signum, frame):
     # ... (remains the same) ...
     global save_attempted_on_interrupt, outer_pbar_global, args_global, all_completed_module_prefixes_ever_global
@@ -833,10 +1523,8 @@ def handle_interrupt(signum, frame):
     save_attempted_on_interrupt = True
     if outer_pbar_global: outer_pbar_global.close()
     if args_global and args_global.save_to:
-        save_path = generate_intermediate_filename(args_global.save_to, len(all_completed_module_prefixes_ever_global))
-        print(f"Attempting interrupt save to: {save_path}")
-        if perform_graceful_save(save_path) and args_global.keep_n_resume_files > 0:
-            cleanup_intermediate_files(args_global.save_to, True, args_global.keep_n_resume_files)
+        print(f"Attempting interrupt save to journal: {get_journal_dir(args_global.save_to)}")
+        append_journal_shard(args_global.save_to)
     else: print("Cannot perform interrupt save: args not defined.")
     print("Exiting.")
     sys.exit(0)
@@ -848,7 +1536,7 @@ def main(cli_args):
            skipped_identical_count_global, skipped_other_reason_count_global, keys_scanned_this_run_global, \
            previously_completed_module_prefixes_global, all_completed_module_prefixes_ever_global, \
            main_loop_completed_scan_flag_global, params_to_seed_optimizer_global, skipped_good_initial_loss_count_global, \
-           skipped_vae_layers_count 
+           skipped_vae_layers_count, last_periodic_save_count_global, journal_reset_pending_global, layer_budget_global
 
     args_global = cli_args
     signal.signal(signal.SIGINT, handle_interrupt) 
@@ -858,6 +1546,9 @@ def main(cli_args):
     processed_layers_this_session_count_global = skipped_identical_count_global = skipped_other_reason_count_global = 0
     skipped_good_initial_loss_count_global = keys_scanned_this_run_global = skipped_vae_layers_count = 0 
     main_loop_completed_scan_flag_global = False; save_attempted_on_interrupt = False
+    pending_layer_groups_global.clear(); last_periodic_save_count_global = 0
+    parallel_layer_jobs = []
+    journal_pending_keys_global.clear(); journal_reset_pending_global = True; layer_budget_global = None
 
     args_global = setup_and_print_configuration(args_global)
     target_opt_dtype = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}.get(args_global.precision, torch.float32)
@@ -866,21 +1557,30 @@ def main(cli_args):
         args_global, extracted_loha_state_dict_global, params_to_seed_optimizer_global,
         previously_completed_module_prefixes_global, all_completed_module_prefixes_ever_global
     )
+    if journal_reset_pending_global: journal_pending_keys_global.update(extracted_loha_state_dict_global.keys())
     base_model_sd, ft_model_sd = load_models(args_global.base_model_path, args_global.ft_model_path)
-    all_candidate_keys = sorted([k for k in base_model_sd if k.endswith('.weight') and k in ft_model_sd and base_model_sd[k].shape == ft_model_sd[k].shape and (len(base_model_sd[k].shape) in [2,4])])
+    all_candidate_keys = sorted([k for k in base_model_sd if k.endswith('.weight') and k in ft_model_sd and (shape := base_model_sd.get_shape(k)) == ft_model_sd.get_shape(k) and len(shape) in [2,4]])
     total_candidates_to_scan = len(all_candidate_keys) 
+    # Byte-identical layers are known from (cached) raw-byte fingerprints without reading or converting either tensor
+    identical_weight_keys = set() if args_global.no_fingerprint_skip else identical_tensor_keys(args_global.base_model_path, args_global.ft_model_path, all_candidate_keys)
+    if identical_weight_keys: print(f"Fingerprints: {len(identical_weight_keys)} of {total_candidates_to_scan} candidate layers are byte-identical and will be skipped.")
+    if args_global.benchmark_init > 0:
+        run_init_benchmark(base_model_sd, ft_model_sd, all_candidate_keys, args_global.benchmark_init, target_opt_dtype)
+        return
+    if args_global.time_budget or args_global.iteration_budget:
+        layer_budget_global = plan_layer_budget(base_model_sd, ft_model_sd, [k for k in all_candidate_keys if k not in identical_weight_keys])
     print(f"Found {total_candidates_to_scan} candidate '.weight' keys for LoHA extraction.")
     outer_pbar_global = tqdm(total=total_candidates_to_scan, desc="Scanning Layers", dynamic_ncols=True, position=0)
+    keys_to_fetch = [k for k in all_candidate_keys if k not in identical_weight_keys and not is_vae_module(k[:-len(".weight")]) and ((prefix := get_loha_key_prefix(k[:-len(".weight")])) not in all_completed_module_prefixes_ever_global or prefix in params_to_seed_optimizer_global) and not defers_layer_to_worker(prefix)]
+    weight_prefetcher = WeightPairPrefetcher(base_model_sd, ft_model_sd, keys_to_fetch)
     
     try:
         for key_name in all_candidate_keys:
             if save_attempted_on_interrupt: break
             keys_scanned_this_run_global += 1; outer_pbar_global.update(1)
             original_module_path = key_name[:-len(".weight")]
-            loha_key_prefix = "lora_" + original_module_path.replace(".", "_")
-            if "model.diffusion_model." in original_module_path: loha_key_prefix = "lora_unet_" + original_module_path.split("model.diffusion_model.")[-1].replace(".", "_")
-            elif "first_stage_model." in original_module_path: loha_key_prefix = "lora_vae_" + original_module_path.split("first_stage_model.")[-1].replace(".", "_")
-            if any(vp in original_module_path for vp in [".encoder.", ".decoder.", ".quant_conv."]) and any(tp in original_module_path for tp in ["first_stage_model.", "autoencoder."]):
+            loha_key_prefix = get_loha_key_prefix(original_module_path)
+            if is_vae_module(original_module_path):
                 if args_global.verbose_layer_debug: tqdm.write(f"  Skipping VAE layer: {original_module_path}")
                 skipped_vae_layers_count += 1; skipped_other_reason_count_global += 1
                 all_completed_module_prefixes_ever_global.add(loha_key_prefix)
@@ -889,19 +1589,36 @@ def main(cli_args):
             if loha_key_prefix in all_completed_module_prefixes_ever_global and not is_reopt_target:
                 if args_global.verbose_layer_debug: tqdm.write(f"  Skipping {loha_key_prefix} (already processed/resumed, not re-opt target).")
                 continue
-            if args_global.max_layers is not None and args_global.max_layers > 0 and processed_layers_this_session_count_global >= args_global.max_layers:
+            pending_layer_count = sum(len(g) for g in pending_layer_groups_global.values()) + len(parallel_layer_jobs)
+            if args_global.max_layers is not None and args_global.max_layers > 0 and processed_layers_this_session_count_global + pending_layer_count >= args_global.max_layers:
                 if args_global.verbose and processed_layers_this_session_count_global == args_global.max_layers:
                     tqdm.write(f"\nMax_layers ({args_global.max_layers}) for new/re-optimized hit. Scan continues to find all identical/skipped layers.")
                 outer_pbar_global.set_description_str(f"Scan {keys_scanned_this_run_global}/{total_candidates_to_scan} (Max Layers Reached)")
                 continue
-            base_W = base_model_sd[key_name].to(dtype=torch.float32)
-            ft_W = ft_model_sd[key_name].to(dtype=torch.float32)
-            out_dim, in_dim_effective, k_h, k_w, is_conv = get_module_shape_info_from_weight(base_W)
-            delta_W_fp32 = (ft_W - base_W)
-            if torch.allclose(delta_W_fp32, torch.zeros_like(delta_W_fp32), atol=args_global.atol_fp32_check):
+            if key_name in identical_weight_keys:
+                if args_global.verbose_layer_debug: tqdm.write(f"  Skipping {loha_key_prefix} (byte-identical fingerprint).")
+                skipped_identical_count_global += 1
+                all_completed_module_prefixes_ever_global.add(loha_key_prefix)
+                continue
+            if defers_layer_to_worker(loha_key_prefix):
+                # read, diffed and checked for (near-)identical weights once, when its worker job is submitted
+                out_dim, in_dim_effective, k_h, k_w, is_conv = get_module_shape_info(base_model_sd.get_shape(key_name))
+                delta_W_fp32 = None
+            else:
+                base_W, ft_W = weight_prefetcher.get(key_name)
+                out_dim, in_dim_effective, k_h, k_w, is_conv = get_module_shape_info_from_weight(base_W)
+                delta_W_fp32 = (ft_W - base_W)
+            if delta_W_fp32 is not None and torch.allclose(delta_W_fp32, torch.zeros_like(delta_W_fp32), atol=args_global.atol_fp32_check):
                 if args_global.verbose_layer_debug: tqdm.write(f"  Skipping {loha_key_prefix} (weights identical atol={args_global.atol_fp32_check:.1e}).")
                 skipped_identical_count_global += 1
                 all_completed_module_prefixes_ever_global.add(loha_key_prefix)
+                take_layer_budget(key_name) # its (sampled) score no longer dilutes the shares of later layers
+                continue
+            if args_global.algo == 'lokr':
+                outer_pbar_global.set_description_str(f"LoKr L{processed_layers_this_session_count_global + 1} (Scan {keys_scanned_this_run_global}/{total_candidates_to_scan})")
+                opt_results = extract_lokr_for_layer(loha_key_prefix, delta_W_fp32, args_global.lokr_factor, args_global.device)
+                if record_optimized_layer(loha_key_prefix, original_module_path, 1, opt_results, base_model_sd, ft_model_sd, final_save_dtype_torch):
+                    maybe_periodic_save(keys_scanned_this_run_global, total_candidates_to_scan)
                 continue
             current_key_processed_or_skipped_good = False 
             should_skip_due_to_pre_existing_good_loss = False
@@ -923,6 +1640,7 @@ def main(cli_args):
                                 all_completed_module_prefixes_ever_global.add(loha_key_prefix)
                                 processed_layers_this_session_count_global += 1; skipped_good_initial_loss_count_global += 1
                                 should_skip_due_to_pre_existing_good_loss = True; current_key_processed_or_skipped_good = True
+                                take_layer_budget(key_name)
                                 outer_pbar_global.set_description_str(f"Scan {keys_scanned_this_run_global}/{total_candidates_to_scan} (New/ReOpt: {processed_layers_this_session_count_global - skipped_good_initial_loss_count_global}, SkipGood:{skipped_good_initial_loss_count_global})")
                             elif args_global.verbose_layer_debug: tqdm.write(f"    Initial loss for loaded {loha_key_prefix}: {init_loss_c:.4e}. Re-optimizing.")
                     except Exception as e_c: tqdm.write(f"    Warn: Pre-opt loss check failed for {loha_key_prefix}: {e_c}. Optimizing.");
@@ -944,42 +1662,50 @@ def main(cli_args):
                             cur_sim_rank = max(math.ceil(cur_sim_rank * args_global.rank_increase_factor), cur_sim_rank + 1); est_retries_used += 1
                         max_retries_layer = max(0, args_global.max_rank_retries - est_retries_used)
                         if args_global.verbose: tqdm.write(f"    Using loaded R:{initial_rank_opt}, A:{initial_alpha_opt:.1f}. Max further retries for layer: {max_retries_layer}.")
+                if args_global.layer_batch_size > 1 and not is_reopt_target:
+                    group_key = (out_dim, in_dim_effective, k_h, k_w, initial_rank_opt, initial_alpha_opt)
+                    group = pending_layer_groups_global.setdefault(group_key, [])
+                    group.append({'loha_key_prefix': loha_key_prefix, 'original_module_path': original_module_path, 'delta': delta_W_fp32})
+                    outer_pbar_global.set_description_str(f"Queued {loha_key_prefix} (group {len(group)}/{args_global.layer_batch_size}, Scan {keys_scanned_this_run_global}/{total_candidates_to_scan})")
+                    if len(group) >= args_global.layer_batch_size:
+                        flush_layer_group(group_key, base_model_sd, ft_model_sd, target_opt_dtype, final_save_dtype_torch)
+                        maybe_periodic_save(keys_scanned_this_run_global, total_candidates_to_scan)
+                    elif flush_oversized_layer_groups(base_model_sd, ft_model_sd, target_opt_dtype, final_save_dtype_torch):
+                        maybe_periodic_save(keys_scanned_this_run_global, total_candidates_to_scan)
+                    continue
+                if args_global.workers > 1:
+                    parallel_layer_jobs.append({'key_name': key_name, 'loha_key_prefix': loha_key_prefix, 'original_module_path': original_module_path, 'out_dim': out_dim, 'in_dim_effective': in_dim_effective, 'k_h': k_h, 'k_w': k_w, 'initial_rank': initial_rank_opt, 'initial_alpha': initial_alpha_opt, 'max_retries': max_retries_layer, 'existing_params': existing_params_init, 'numel': math.prod(base_model_sd.get_shape(key_name))})
+                    outer_pbar_global.set_description_str(f"Queued {len(parallel_layer_jobs)} layers for workers (Scan {keys_scanned_this_run_global}/{total_candidates_to_scan})")
+                    continue
                 outer_pbar_global.set_description_str(f"{current_op_mode_str} L{processed_layers_this_session_count_global + 1 - skipped_good_initial_loss_count_global} (Scan {keys_scanned_this_run_global}/{total_candidates_to_scan}, SkipGood:{skipped_good_initial_loss_count_global})")
-                opt_results = optimize_loha_for_layer(loha_key_prefix, delta_W_fp32, out_dim, in_dim_effective, k_h, k_w, initial_rank_opt, initial_alpha_opt, args_global.lr, args_global.max_iterations, args_global.min_iterations, args_global.target_loss, args_global.weight_decay, args_global.device, target_opt_dtype, is_conv, args_global.verbose_layer_debug, max_retries_layer, args_global.rank_increase_factor, existing_params_init)
-                if not opt_results.get('interrupted_mid_layer') and 'hada_w1_a' in opt_results :
-                    for p_name, p_val in opt_results.items():
-                        if p_name not in ['final_loss', 'stopped_early_by_loss', 'stopped_by_insufficient_progress', 'stopped_by_projection', 'projection_type_used', 'iterations_done', 'final_rank_used', 'interrupted_mid_layer', 'final_projected_loss_on_stop']:
-                            if torch.is_tensor(p_val): extracted_loha_state_dict_global[f'{loha_key_prefix}.{p_name}'] = p_val.to(final_save_dtype_torch)
-                    final_rank_used = opt_results['final_rank_used']
-                    stat_entry = {"name": str(loha_key_prefix),"original_name": str(original_module_path),"initial_rank_attempted": int(initial_rank_opt),"final_rank_used": int(final_rank_used),"rank_was_increased": bool(final_rank_used > initial_rank_opt),"final_loss": float(opt_results['final_loss']),"alpha_final": float(opt_results['alpha'].item()) if isinstance(opt_results.get('alpha'), torch.Tensor) else float(opt_results.get('alpha', 0.0)),"iterations_done": int(opt_results['iterations_done']),"stopped_early_by_loss_target": bool(opt_results['stopped_early_by_loss']),"stopped_by_insufficient_progress": bool(opt_results.get('stopped_by_insufficient_progress', False)),"stopped_by_projection": bool(opt_results.get('stopped_by_projection', False)),"projection_type_used": str(opt_results.get('projection_type_used', 'none')),"final_projected_loss_on_stop": float(l_val) if (l_val := opt_results.get('final_projected_loss_on_stop')) is not None else None,"skipped_reopt_due_to_initial_good_loss": False,"interrupted_mid_layer": bool(opt_results.get('interrupted_mid_layer', False))}
-                    layer_optimization_stats_global.append(stat_entry)
-                    all_completed_module_prefixes_ever_global.add(loha_key_prefix)
-                    stop_reason_short = ""
-                    if opt_results['stopped_early_by_loss']: stop_reason_short = ", Stop:LossTarget"
-                    elif opt_results.get('stopped_by_projection', False): stop_reason_short = f", Stop:Proj({opt_results.get('projection_type_used','?')})"
-                    elif opt_results['stopped_by_insufficient_progress']: stop_reason_short = ", Stop:RawProg"
-                    tqdm.write(f"  Layer {loha_key_prefix} Opt. Done. R_used: {final_rank_used}, FinalLoss: {opt_results['final_loss']:.4e}, Iters: {opt_results['iterations_done']}{stop_reason_short}")
-                    if args_global.use_bias:
-                        bias_key = f"{original_module_path}.bias"
-                        if bias_key in ft_model_sd and (bias_key not in base_model_sd or not torch.allclose(base_model_sd[bias_key], ft_model_sd[bias_key], atol=args_global.atol_fp32_check)):
-                            extracted_loha_state_dict_global[bias_key] = ft_model_sd[bias_key].cpu().to(final_save_dtype_torch)
-                            if args_global.verbose: tqdm.write(f"    Saved differing/new bias for {bias_key}")
-                    processed_layers_this_session_count_global += 1
-                    current_key_processed_or_skipped_good = True 
-                else:
-                     tqdm.write(f"  Optimization for {loha_key_prefix} did not yield saveable results (Interrupt: {opt_results.get('interrupted_mid_layer', 'N/A')}, Loss: {opt_results.get('final_loss', 'N/A')})")
-                     if not opt_results.get('interrupted_mid_layer', False) and 'hada_w1_a' not in opt_results :
-                         skipped_other_reason_count_global += 1
-                         all_completed_module_prefixes_ever_global.add(loha_key_prefix)
+                layer_max_iters, layer_min_iters, layer_deadline = args_global.max_iterations, args_global.min_iterations, None
+                layer_budget = take_layer_budget(key_name)
+                if layer_budget is not None:
+                    if layer_budget_global['unit'] == "seconds": layer_deadline = time.monotonic() + layer_budget
+                    else:
+                        layer_max_iters = int(max(1, min(args_global.max_iterations, layer_budget)))
+                        layer_min_iters = min(args_global.min_iterations, layer_max_iters)
+                        max_retries_layer = min(max_retries_layer, max(0, int(layer_budget // args_global.max_iterations) - 1))
+                    if args_global.verbose: tqdm.write(f"    Budget for {loha_key_prefix}: {layer_budget:.1f} {layer_budget_global['unit']} (max iters {layer_max_iters}, max retries {max_retries_layer}).")
+                layer_start_time = time.monotonic()
+                opt_results = optimize_loha_for_layer(loha_key_prefix, delta_W_fp32, out_dim, in_dim_effective, k_h, k_w, initial_rank_opt, initial_alpha_opt, args_global.lr, layer_max_iters, layer_min_iters, args_global.target_loss, args_global.weight_decay, args_global.device, target_opt_dtype, is_conv, args_global.verbose_layer_debug, max_retries_layer, args_global.rank_increase_factor, existing_params_init, layer_deadline)
+                if layer_budget is not None:
+                    budget_spent = time.monotonic() - layer_start_time if layer_budget_global['unit'] == "seconds" else float(opt_results.get('iterations_total', 0))
+                    layer_budget_global['remaining'] -= budget_spent
+                    opt_results.update({'budget_allotted': layer_budget, 'budget_spent': budget_spent})
+                current_key_processed_or_skipped_good = record_optimized_layer(loha_key_prefix, original_module_path, initial_rank_opt, opt_results, base_model_sd, ft_model_sd, final_save_dtype_torch)
             if current_key_processed_or_skipped_good: 
-                if args_global.save_every_n_layers > 0 and processed_layers_this_session_count_global > 0 and processed_layers_this_session_count_global % args_global.save_every_n_layers == 0 and keys_scanned_this_run_global < total_candidates_to_scan: 
-                    periodic_save_path = generate_intermediate_filename(args_global.save_to, len(all_completed_module_prefixes_ever_global))
-                    tqdm.write(f"\n--- Periodic Save: Processed {processed_layers_this_session_count_global} layers this session. Saving to {periodic_save_path} ---")
-                    if perform_graceful_save(periodic_save_path) and args_global.keep_n_resume_files > 0:
-                        cleanup_intermediate_files(args_global.save_to, True, args_global.keep_n_resume_files)
+                maybe_periodic_save(keys_scanned_this_run_global, total_candidates_to_scan)
+        for group_key in list(pending_layer_groups_global.keys()):
+            if save_attempted_on_interrupt: break
+            flush_layer_group(group_key, base_model_sd, ft_model_sd, target_opt_dtype, final_save_dtype_torch)
+        if parallel_layer_jobs and not save_attempted_on_interrupt:
+            outer_pbar_global.close(); outer_pbar_global = None
+            run_parallel_layer_jobs(parallel_layer_jobs, base_model_sd, ft_model_sd, target_opt_dtype, final_save_dtype_torch)
         if not save_attempted_on_interrupt and keys_scanned_this_run_global == total_candidates_to_scan:
             main_loop_completed_scan_flag_global = True
     finally:
+        weight_prefetcher.close()
         if outer_pbar_global: outer_pbar_global.close()
 
     if not save_attempted_on_interrupt:
@@ -996,15 +1722,15 @@ def main(cli_args):
         )
         
         is_fully_complete = main_loop_completed_scan_flag_global and len(all_completed_module_prefixes_ever_global) >= total_candidates_to_scan
-        actual_save_path = args_global.save_to if is_fully_complete else generate_intermediate_filename(args_global.save_to, len(all_completed_module_prefixes_ever_global))
-        reason_for_save_path = "Saving to final path (all candidates processed/skipped)" if is_fully_complete else \
-                               ("Run incomplete (scan not finished or --max_layers hit)." if not main_loop_completed_scan_flag_global else "Full scan done, but not all layers processed/accounted for (e.g. new errors).")
-        print(f"\n{reason_for_save_path}: {actual_save_path}")
-        if perform_graceful_save(output_path_to_save=actual_save_path):
-            if args_global.keep_n_resume_files > 0 and not is_fully_complete : 
-                 cleanup_intermediate_files(args_global.save_to, True, args_global.keep_n_resume_files)
-            if is_fully_complete and actual_save_path == args_global.save_to :
-                print("\nCleaning up ALL intermediate resume files (from this script's previous runs)...")
+        if not is_fully_complete:
+            reason_for_save_path = "Run incomplete (scan not finished or --max_layers hit)." if not main_loop_completed_scan_flag_global else "Full scan done, but not all layers processed/accounted for (e.g. new errors)."
+            print(f"\n{reason_for_save_path} Appending to journal: {get_journal_dir(args_global.save_to)}")
+            append_journal_shard(args_global.save_to)
+        else:
+            print(f"\nSaving to final path (all candidates processed/skipped), compacting journal: {args_global.save_to}")
+            if perform_graceful_save(output_path_to_save=args_global.save_to):
+                print("\nCleaning up journal and ALL intermediate resume files (from this script's previous runs)...")
+                shutil.rmtree(get_journal_dir(args_global.save_to), ignore_errors=True)
                 cleanup_intermediate_files(args_global.save_to, False)
     else: print("\nProcess interrupted. Graceful save to intermediate file attempted.")
 
@@ -1021,6 +1747,16 @@ def post_process_cli_args(parsed_args: argparse.Namespace) -> argparse.Namespace
             os.makedirs(save_dir, exist_ok=True)
         except OSError as e:
             print(f"Error creating directory {save_dir}: {e}"); sys.exit(1)
+    if parsed_args.algo == "lokr" and parsed_args.continue_training_from_loha:
+        print("Error: --continue_training_from_loha cannot be combined with --algo lokr (LoKr extraction is closed-form)."); sys.exit(1)
+    if parsed_args.time_budget and parsed_args.iteration_budget:
+        print("Error: use only one of --time_budget and --iteration_budget."); sys.exit(1)
+    if (parsed_args.time_budget or parsed_args.iteration_budget) and (parsed_args.workers > 1 or parsed_args.layer_batch_size > 1 or parsed_args.algo == "lokr"):
+        print("Error: --time_budget/--iteration_budget apply to sequential LoHA optimization only (not --workers, --layer_batch_size or --algo lokr)."); sys.exit(1)
+    if parsed_args.workers > 1 and parsed_args.layer_batch_size > 1:
+        print("Error: --workers and --layer_batch_size are mutually exclusive."); sys.exit(1)
+    if parsed_args.layer_batch_max_mb <= 0:
+        print("Error: --layer_batch_max_mb must be positive."); sys.exit(1)
     if parsed_args.initial_alpha is None:
         parsed_args.initial_alpha = float(parsed_args.rank)
     if parsed_args.initial_conv_alpha is None:
@@ -1031,12 +1767,14 @@ def post_process_cli_args(parsed_args: argparse.Namespace) -> argparse.Namespace
     return parsed_args
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Extract LoHA parameters. Saves intermediate files like 'name_resume_L{count}.safetensors'.")
+    parser = argparse.ArgumentParser(description="Extract LoHA parameters. Saves progress to an append-only 'name_journal' directory (shards + manifest.json) that is compacted into the final file.")
     parser.add_argument("base_model_path", type=str, help="Path to base model (.pt, .pth, .safetensors)")
     parser.add_argument("ft_model_path", type=str, help="Path to fine-tuned model (.pt, .pth, .safetensors)")
     parser.add_argument("save_to", type=str, help="Path for FINAL LoHA output (recommended .safetensors).")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite existing FINAL LoHA. Does NOT clean intermediates until successful final save.")
     parser.add_argument("--continue_training_from_loha", type=str, default=None, help="Path to existing LoHA to load and continue optimizing.")
+    parser.add_argument("--algo", type=str, default="loha", choices=["loha", "lokr"], help="'loha' optimizes Hadamard factors per layer; 'lokr' writes lokr_w1/lokr_w2 from the nearest Kronecker product of each delta (one SVD per layer, no optimization).")
+    parser.add_argument("--lokr_factor", type=int, default=-1, help="LoKr dimension factor, as in LyCORIS' 'factor' network arg (-1 picks the most balanced split).")
     parser.add_argument("--rank", type=int, default=4, help="Default rank for LoHA.")
     parser.add_argument("--conv_rank", type=int, default=None, help="Specific rank for Conv LoHA. Defaults to --rank.")
     parser.add_argument("--initial_alpha", type=float, default=None, help="Global initial alpha. Defaults to 'rank'.")
@@ -1057,6 +1795,9 @@ if __name__ == "__main__":
     parser.add_argument("--precision", type=str, default="fp32", choices=["fp32", "fp16", "bf16"], help="Optimization precision.")
     parser.add_argument("--save_weights_dtype", type=str, default="bf16", choices=["fp32", "fp16", "bf16"], help="Dtype for saved LoHA weights.")
     parser.add_argument("--atol_fp32_check", type=float, default=1e-6, help="Tolerance for identical weight check.")
+    parser.add_argument("--no_fingerprint_skip", action="store_true", help="Don't skip byte-identical layers via raw-byte fingerprints (cached in '<model>.fingerprints.json'); compare every layer with --atol_fp32_check.")
+    parser.add_argument("--init", type=str, default="kaiming", choices=["kaiming", "svd"], help="Initializer for new LoHA factors: 'kaiming' (Kaiming/normal noise) or 'svd' (seeded from a truncated SVD of the weight delta).")
+    parser.add_argument("--benchmark_init", type=int, default=0, help="Benchmark mode: optimize the first N differing layers with each --init and report iterations/time to --target_loss. Nothing is saved.")
     parser.add_argument("--no_warm_start", action="store_true", help="Disable warm-starting higher rank attempts from previous best.")
     parser.add_argument("--use_bias", action="store_true", help="Save differing bias terms into LoHA.")
     parser.add_argument("--dropout", type=float, default=0.0, help="General dropout (metadata only).")
@@ -1069,7 +1810,13 @@ if __name__ == "__main__":
     parser.add_argument("--projection_ema_alpha", type=float, default=0.1, help="Smoothing factor for EMA.")
     parser.add_argument("--projection_min_ema_history", type=int, default=5, help="Min EMA samples for EMA-based projection.")
     parser.add_argument("--save_every_n_layers", type=int, default=0, help="Save intermediate LoHA every N processed layers (0 to disable).")
-    parser.add_argument("--keep_n_resume_files", type=int, default=0, help="Keep only N most recent intermediate resume files (0 to keep all).")
+    parser.add_argument("--layer_batch_size", type=int, default=0, help="Optimize up to N new layers with identical shape/rank together using batched matmuls (0 or 1 to disable). Each layer keeps its own loss, LR schedule, early stop and rank retries.")
+    parser.add_argument("--layer_batch_max_mb", type=float, default=1024, help="Cap on the fp32 deltas queued by --layer_batch_size across all groups (MB). When exceeded, the largest group is optimized even if not full.")
+    parser.add_argument("--time_budget", type=float, default=None, help="Global wall-clock budget in seconds, including the layer scoring pass, split across layers in proportion to their delta Frobenius norm (estimated from sampled rows). A layer stops (and skips further rank retries) when its share runs out; unused time flows to later layers.")
+    parser.add_argument("--iteration_budget", type=int, default=None, help="Global iteration budget, split like --time_budget. A layer's share caps its --max_iterations; shares above max_iterations buy rank retries (up to --max_rank_retries).")
+    parser.add_argument("--workers", type=int, default=0, help="Optimize layers in N worker processes (0 or 1 to disable). Layers are scheduled largest-first; results are saved by the main process.")
+    parser.add_argument("--worker_threads", type=int, default=0, help="torch threads per worker process (0 = CPU count / --workers).")
+    parser.add_argument("--keep_n_resume_files", type=int, default=0, help="Keep only N most recent legacy '_resume_L' files (0 to keep all). Progress is now saved to an append-only '<name>_journal' directory.")
     
     raw_parsed_args = parser.parse_args()
     processed_args = post_process_cli_args(raw_parsed_args)
@@ -3,17 +3,22 @@ import os
 import argparse
 import json
 import time
+import hashlib
+import queue
+import threading
 import torch
-from safetensors.torch import load_file, save_file
 from tqdm import tqdm
 import logging # Import for logging
+from quantile_utils import fast_quantile
+from tensor_fingerprint import identical_tensor_keys
+from lora_key_mapping import unet_lora_targets, text_encoder_lora_targets
+from safetensors_io import SafetensorsReader, SafetensorsWriter, open_state_dict, safetensors_order, write_safetensors_streamed
 
-# NEW: Add diffusers import for model loading
+# diffusers is only needed for --loader diffusers
 try:
     from diffusers import StableDiffusionPipeline, StableDiffusionXLPipeline
 except ImportError:
-    print("Diffusers library not found. Please install it: pip install diffusers transformers accelerate")
-    raise
+    StableDiffusionPipeline = StableDiffusionXLPipeline = None
 
 # --- Localized Logging Setup ---
 def _local_setup_logging(log_level=logging.INFO):
@@ -30,6 +35,7 @@ _local_setup_logging() # Initialize logging
 logger = logging.getLogger(__name__) # Get logger for this module
 
 MIN_SV = 1e-6
+MODEL_FILE_EXTENSIONS = (".safetensors", ".ckpt", ".pt", ".pth")
 
 # --- Localized sd-scripts constants and utility functions ---
 _LOCAL_MODEL_VERSION_SDXL_BASE_V1_0 = "sdxl_v10"
@@ -89,6 +95,41 @@ def _local_create_network_placeholders(text_encoders: list, unet: torch.nn.Modul
     return text_encoder_loras, unet_loras
 
 
+# --- Direct checkpoint loading (no diffusers pipeline) ---
+class LocalCheckpointWeightRef:
+    """
+    Stands in for `org_module` of a placeholder: `.weight` reads the tensor from the checkpoint on access,
+    so only the modules currently being diffed are resident.
+    """
+    def __init__(self, reader, key: str, rows: tuple = None, transpose: bool = False, load_dtype=None):
+        self.reader, self.key, self.rows, self.transpose, self.load_dtype = reader, key, rows, transpose, load_dtype
+
+    @property
+    def weight(self) -> torch.Tensor:
+        tensor = self.reader.get_rows(self.key, *self.rows) if self.rows else self.reader[self.key]
+        if self.transpose:
+            tensor = tensor.T.contiguous()
+        return tensor.to(self.load_dtype) if self.load_dtype is not None else tensor
+
+def _local_create_checkpoint_placeholders(model_path: str, is_v2: bool, is_sdxl: bool, lora_conv_dim_init: int, load_dtype_torch):
+    """
+    Builds the same placeholders as `_local_create_network_placeholders`, but straight from original-checkpoint keys.
+    The VAE and anything that is not a Linear/Conv2d weight is never read.
+    Returns dicts of lora_name -> placeholder for text encoders and U-Net.
+    """
+    logger.info(f"Reading checkpoint keys directly from: {model_path}")
+    reader = open_state_dict(model_path)
+    unet_loras, text_encoder_loras = {}, {}
+    for lora_name, key, rows, transpose in unet_lora_targets(reader.keys(), reader.get_shape, include_conv=lora_conv_dim_init > 0):
+        unet_loras[lora_name] = LocalLoRAModulePlaceholder(lora_name, LocalCheckpointWeightRef(reader, key, rows, transpose, load_dtype_torch))
+    for lora_name, key, rows, transpose in text_encoder_lora_targets(reader.keys(), reader.get_shape, is_v2, is_sdxl):
+        text_encoder_loras[lora_name] = LocalLoRAModulePlaceholder(lora_name, LocalCheckpointWeightRef(reader, key, rows, transpose, load_dtype_torch))
+
+    logger.info(f"Found {len(text_encoder_loras)} LoRA-able modules in Text Encoders (direct).")
+    logger.info(f"Found {len(unet_loras)} LoRA-able modules in U-Net (direct).")
+    return text_encoder_loras, unet_loras
+
+
 # --- Singular Value Indexing Functions (Unchanged) ---
 def index_sv_cumulative(S, target):
     original_sum = float(torch.sum(S))
@@ -149,6 +190,53 @@ def index_sv_rel_decrease(S, tau=0.1):
             return k + 1
     return len(S)
 
+# --- Truncated SVD backends ---
+# With --svd_backend randomized/lowrank only the top l = max_rank + oversample singular values are computed.
+# How the dynamic methods behave on that truncated spectrum:
+#   sv_ratio, sv_rel_decrease: same rank as with the full spectrum (both only look at the leading values, and the
+#                              result is capped at max_rank <= l anyway).
+#   sv_fro:                    same rank; the truncated spectrum is padded with one value carrying the exact
+#                              residual energy ||A||_F^2 - sum(S^2), so the Frobenius totals match.
+#   sv_cumulative:             needs sum(S) over the whole spectrum, which a sketch cannot provide -> full SVD is used.
+#   sv_knee, sv_cumulative_knee: the knee is searched on the top-l curve only, so the rank may differ from the
+#                              full-spectrum knee; use --svd_backend full to reproduce full-SVD results exactly.
+SVD_BACKENDS_NEED_FULL_SPECTRUM = {"sv_cumulative"}
+
+def _randomized_range_svd(mat, sketch_size, niter):
+    """Randomized range finder (Halko et al.) with `niter` QR-stabilized power iterations, then an exact SVD of the small projection."""
+    omega = torch.randn(mat.shape[1], sketch_size, device=mat.device, dtype=mat.dtype)
+    Q = torch.linalg.qr(mat @ omega).Q
+    for _ in range(niter):
+        Q = torch.linalg.qr(mat.T @ Q).Q
+        Q = torch.linalg.qr(mat @ Q).Q
+    U_small, S, Vh = torch.linalg.svd(Q.T @ mat, full_matrices=False)
+    return Q @ U_small, S, Vh
+
+def _truncated_svd(mat, max_rank, backend, oversample, niter, energy_tolerance):
+    """
+    Returns (U, S, Vh, residual_energy, used_full). Non-full backends compute the top max_rank + oversample components
+    and fall back to torch.linalg.svd when the spectrum looks too flat for the sketch to be trusted: the top-k energy
+    the sketch may have missed, estimated as min(residual energy, k * S[l-1]^2), exceeds `energy_tolerance` of it.
+    """
+    sketch_size = min(max_rank + oversample, *mat.shape)
+    if backend == "full" or sketch_size >= min(mat.shape):
+        U, S, Vh = torch.linalg.svd(mat)
+        return U, S, Vh, 0.0, True
+    if backend == "lowrank":
+        U, S, V = torch.svd_lowrank(mat, q=sketch_size, niter=niter)
+        Vh = V.T
+    else:
+        U, S, Vh = _randomized_range_svd(mat, sketch_size, niter)
+    total_energy = float(mat.pow(2).sum())
+    residual_energy = max(0.0, total_energy - float(S.pow(2).sum()))
+    k = min(max_rank, len(S))
+    captured_k = float(S[:k].pow(2).sum())
+    possibly_missed = min(residual_energy, k * float(S[-1]) ** 2)
+    if captured_k + possibly_missed > 0 and possibly_missed / (captured_k + possibly_missed) > energy_tolerance:
+        U, S, Vh = torch.linalg.svd(mat)
+        return U, S, Vh, 0.0, True
+    return U, S, Vh, residual_energy, False
+
 # --- Utility Functions ---
 def _str_to_dtype(p):
     if p == "float": return torch.float
@@ -156,18 +244,16 @@ def _str_to_dtype(p):
     if p == "bf16": return torch.bfloat16
     return None
 
-def save_to_file(file_name, state_dict_to_save, dtype, metadata=None):
-    state_dict_final = {}
-    for key, value in state_dict_to_save.items():
-        if isinstance(value, torch.Tensor) and dtype is not None:
-            state_dict_final[key] = value.to(dtype)
-        else:
-            state_dict_final[key] = value
+def save_to_file(file_name, state_dict_to_save, dtype, metadata=None, sshs_hashes=False):
+    cast = lambda value: value.to(dtype) if isinstance(value, torch.Tensor) and dtype is not None else value
 
     if os.path.splitext(file_name)[1] == ".safetensors":
-        save_file(state_dict_final, file_name, metadata=metadata)
+        # Each tensor is cast while it is streamed out, instead of building a cast copy of the whole state dict.
+        # sshs_hashes: sshs_model_hash / sshs_legacy_hash are computed from the written bytes (sd-scripts compatible)
+        plan = safetensors_order([(key, dtype or value.dtype, value.shape) for key, value in state_dict_to_save.items()])
+        write_safetensors_streamed(file_name, plan, lambda key, _: cast(state_dict_to_save[key]), metadata, sshs_hashes)
     else:
-        torch.save(state_dict_final, file_name)
+        torch.save({key: cast(value) for key, value in state_dict_to_save.items()}, file_name)
 
 def _build_local_sai_metadata(title, creation_time, is_v2_flag, is_v_param_flag, is_sdxl_flag):
     metadata = {}
@@ -189,7 +275,12 @@ def _build_local_sai_metadata(title, creation_time, is_v2_flag, is_v_param_flag,
     return metadata
 
 # --- MODIFIED Helper Functions for Model Loading ---
+def _require_diffusers():
+    if StableDiffusionPipeline is None:
+        raise ImportError("Diffusers library not found. Please install it: pip install diffusers transformers accelerate (or use --loader direct)")
+
 def _load_sd_model_components(model_path, is_v2_flag, target_device_override, load_dtype_torch):
+    _require_diffusers()
     logger.info(f"Loading SD model using Diffusers.StableDiffusionPipeline from: {model_path}")
     pipeline = StableDiffusionPipeline.from_single_file(
         model_path, 
@@ -203,6 +294,7 @@ def _load_sd_model_components(model_path, is_v2_flag, target_device_override, lo
     return text_encoders, unet
 
 def _load_sdxl_model_components(model_path, target_device_override, load_dtype_torch):
+    _require_diffusers()
     actual_load_device = target_device_override if target_device_override else "cpu"
     logger.info(f"Loading SDXL model using Diffusers.StableDiffusionXLPipeline from: {model_path} to device: {actual_load_device}")
     pipeline = StableDiffusionXLPipeline.from_single_file(
@@ -217,30 +309,259 @@ def _load_sdxl_model_components(model_path, target_device_override, load_dtype_t
     logger.info(f"Loaded SDXL model components. UNet device: {unet.device}, TextEncoder1 device: {text_encoder.device}, TextEncoder2 device: {text_encoder_2.device}")
     return text_encoders, unet
 
-def _calculate_module_diffs_and_check(module_loras_o, module_loras_t, diff_calc_device, min_diff_thresh, module_type_str):
-    diffs_map = {}
-    is_different_flag = False
-    first_diff_logged = False
+def _calculate_module_diff(lora_o, lora_t, diff_calc_device, module_type_str):
+    # read each weight once: for direct checkpoint placeholders `.weight` is a lazy read
+    weight_o = getattr(lora_o.org_module, 'weight', None) if lora_o.org_module is not None else None
+    weight_t = getattr(lora_t.org_module, 'weight', None) if lora_t.org_module is not None else None
+    if weight_o is None or weight_t is None:
+        logger.warning(f"Skipping {lora_o.lora_name} in {module_type_str} due to missing org_module or weight.")
+        return None
+    if str(weight_o.device) != str(diff_calc_device): weight_o = weight_o.to(diff_calc_device)
+    if str(weight_t.device) != str(diff_calc_device): weight_t = weight_t.to(diff_calc_device)
+    return weight_t - weight_o
+
+def _check_modules_differ(module_loras_o, module_loras_t, diff_calc_device, min_diff_thresh, module_type_str):
+    """
+    First pass for the `min_diff` check: max-abs norm of each module delta, stopping at the first module above
+    the threshold. Deltas are not kept.
+    """
     for lora_o, lora_t in zip(module_loras_o, module_loras_t):
-        lora_name = lora_o.lora_name
-        if lora_o.org_module is None or lora_t.org_module is None or \
-           not hasattr(lora_o.org_module, 'weight') or lora_o.org_module.weight is None or \
-           not hasattr(lora_t.org_module, 'weight') or lora_t.org_module.weight is None:
-            logger.warning(f"Skipping {lora_name} in {module_type_str} due to missing org_module or weight.")
+        diff = _calculate_module_diff(lora_o, lora_t, diff_calc_device, module_type_str)
+        if diff is None:
             continue
-        weight_o = lora_o.org_module.weight
-        weight_t = lora_t.org_module.weight
-        if str(weight_o.device) != str(diff_calc_device): weight_o = weight_o.to(diff_calc_device)
-        if str(weight_t.device) != str(diff_calc_device): weight_t = weight_t.to(diff_calc_device)
-        diff = weight_t - weight_o
-        diffs_map[lora_name] = diff
         current_max_diff = torch.max(torch.abs(diff))
-        if not is_different_flag and current_max_diff > min_diff_thresh:
-            is_different_flag = True
-            if not first_diff_logged:
-                 logger.info(f"{module_type_str} '{lora_name}' differs: max diff {current_max_diff} > {min_diff_thresh}")
-                 first_diff_logged = True
-    return diffs_map, is_different_flag
+        if current_max_diff > min_diff_thresh:
+            logger.info(f"{module_type_str} '{lora_o.lora_name}' differs: max diff {current_max_diff} > {min_diff_thresh}")
+            return True
+    return False
+
+_PREFETCH_DONE = object()
+
+def _iter_module_diffs_prefetched(module_pairs, diff_calc_device, prefetch_count):
+    """
+    Yields (lora_name, diff) for (lora_o, lora_t, module_type_str) triples. Deltas of upcoming modules are computed
+    on a background thread, at most `prefetch_count` ahead, so diff computation overlaps the SVD of the current one.
+    """
+    diff_queue = queue.Queue(maxsize=max(1, prefetch_count))
+    stop_event = threading.Event()
+
+    @torch.no_grad()  # grad mode is per thread
+    def produce():
+        try:
+            for lora_o, lora_t, module_type_str in module_pairs:
+                if stop_event.is_set():
+                    return
+                diff = _calculate_module_diff(lora_o, lora_t, diff_calc_device, module_type_str)
+                if diff is not None:
+                    diff_queue.put((lora_o.lora_name, diff))
+        except Exception as e:
+            diff_queue.put(e)
+        finally:
+            diff_queue.put(_PREFETCH_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = diff_queue.get()
+            if item is _PREFETCH_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop_event.set()
+        while producer.is_alive():  # unblock a producer waiting on a full queue
+            try:
+                diff_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+def _local_file_fingerprint(path, cache_dir):
+    """
+    sha256 of the whole file. Results are remembered in <cache_dir>/fingerprints.json keyed by
+    (size, mtime), so unchanged models are only hashed once.
+    """
+    index_path = os.path.join(cache_dir, "fingerprints.json")
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    st = os.stat(path)
+    entry = index.get(os.path.abspath(path))
+    if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+        return entry["sha256"]
+    logger.info(f"Fingerprinting {path} for the SVD cache...")
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(16 * 1024 * 1024), b""):
+            h.update(chunk)
+    index[os.path.abspath(path)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+    with open(index_path + ".part", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(index_path + ".part", index_path)
+    return h.hexdigest()
+
+class LocalSVDCache:
+    """
+    Sidecar cache of per-layer SVD results for one (base, tuned) model pair: the singular values, the top-K
+    singular vectors, the residual energy of truncated backends and the delta shape. Stored in `cache_dir` as
+    one safetensors file named after both source fingerprints and the load precision.
+    The metadata records which backend decomposed each layer ("full", or e.g. "randomized:oversample=8:niter=2").
+    Approximate vectors from a truncated backend are never reused by a run that asks for the full SVD.
+    """
+    FORMAT = "kohya_ss_lora_svd_cache"
+    VERSION = "2"
+
+    def __init__(self, cache_dir, model_org, model_tuned, load_precision, cache_rank=None,
+                 svd_backend="full", svd_oversample=8, svd_niter=2):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.fingerprints = (_local_file_fingerprint(model_org, cache_dir), _local_file_fingerprint(model_tuned, cache_dir))
+        self.load_precision = load_precision or "native"
+        self.path = os.path.join(cache_dir, f"{self.fingerprints[0][:16]}_{self.fingerprints[1][:16]}_{self.load_precision}.safetensors")
+        self.cache_rank = cache_rank
+        self.svd_backend = svd_backend
+        self.truncated_label = f"{svd_backend}:oversample={svd_oversample}:niter={svd_niter}"
+        self.hits, self.misses = 0, 0
+        self._handle, self._names, self._new, self._backends = None, set(), {}, {}
+        if os.path.exists(self.path):
+            try:
+                handle = SafetensorsReader(self.path)
+                meta = handle.metadata or {}
+                if meta.get("format") == self.FORMAT and meta.get("version") == self.VERSION and \
+                        meta.get("fingerprints") == ",".join(self.fingerprints) and meta.get("load_precision") == self.load_precision:
+                    self._handle = handle
+                    self._names = {k.rsplit(".", 1)[0] for k in handle.keys()}
+                    self._backends = json.loads(meta.get("svd_backends", "{}"))
+                    logger.info(f"SVD cache: {len(self._names)} layers available in {self.path}")
+                else:
+                    logger.warning(f"SVD cache {self.path} does not match these models; it will be rebuilt.")
+            except Exception as e:
+                logger.warning(f"Could not read SVD cache {self.path} ({e}); it will be rebuilt.")
+
+    def get(self, lora_name, need_full_spectrum=False):
+        """Returns (U, S, Vh, residual_energy, diff_shape) or None."""
+        if self.svd_backend == "full" and self._backends.get(lora_name) != "full":
+            return None
+        if lora_name in self._new:
+            entry = self._new[lora_name]
+        elif lora_name in self._names:
+            entry = {part: self._handle[f"{lora_name}.{part}"] for part in ("U", "S", "Vh", "residual", "shape")}
+        else:
+            return None
+        residual = float(entry["residual"])
+        if need_full_spectrum and residual > 0:
+            return None
+        return entry["U"], entry["S"], entry["Vh"], residual, tuple(entry["shape"].tolist())
+
+    def put(self, lora_name, diff_shape, U, S, Vh, residual_energy, max_rank, exact):
+        """`exact`: the components come from a full SVD (also when a truncated backend fell back to it)."""
+        k = max(max_rank, self.cache_rank or 0)
+        self._backends[lora_name] = "full" if exact else self.truncated_label
+        self._new[lora_name] = {
+            "U": U[:, :k].to("cpu", dtype=torch.float).contiguous(),
+            "S": S.to("cpu", dtype=torch.float).contiguous(),
+            "Vh": Vh[:k, :].to("cpu", dtype=torch.float).contiguous(),
+            "residual": torch.tensor(float(residual_energy), dtype=torch.float64),
+            "shape": torch.tensor(list(diff_shape), dtype=torch.int64),
+        }
+
+    def save(self):
+        if not self._new:
+            return
+        # Layers kept from the existing cache are copied as raw bytes, never loaded
+        plan = []
+        for lora_name in sorted(self._names - self._new.keys()):
+            plan += [(f"{lora_name}.{part}", *self._handle.info(f"{lora_name}.{part}")) for part in ("U", "S", "Vh", "residual", "shape")]
+        for lora_name, entry in self._new.items():
+            plan += [(f"{lora_name}.{part}", tensor.dtype, tensor.shape) for part, tensor in entry.items()]
+        metadata = {"format": self.FORMAT, "version": self.VERSION, "fingerprints": ",".join(self.fingerprints), "load_precision": self.load_precision,
+                    "svd_backends": json.dumps(self._backends, sort_keys=True)}
+        with SafetensorsWriter(self.path, plan, metadata) as writer:
+            for name, _, _ in writer.plan:
+                lora_name, part = name.rsplit(".", 1)
+                writer.write(name, self._new[lora_name][part] if lora_name in self._new else self._handle.get_raw(name))
+            if self._handle is not None:
+                self._handle.close()  # release the mmap before the file is replaced
+        self._handle = SafetensorsReader(self.path)
+        self._names |= self._new.keys()
+        logger.info(f"SVD cache: wrote {len(self._new)} new/updated layers ({len(self._names)} total) to {self.path}")
+        self._new = {}
+
+def _svd_module_to_lora(lora_name, original_diff_tensor, svd_computation_device, dim, conv_dim,
+                        dynamic_method, dynamic_param, clamp_quantile,
+                        final_weights_device, save_dtype_torch, verbose,
+                        svd_backend="full", svd_oversample=8, svd_niter=2, svd_energy_tolerance=0.05, backend_stats=None,
+                        svd_cache=None):
+    """Decomposes one module delta and returns the truncated (up, down) factors, or None if it cannot be decomposed."""
+    is_conv2d_layer = len(original_diff_tensor.size()) == 4
+    kernel_s = original_diff_tensor.size()[2:4] if is_conv2d_layer else None
+    is_conv2d_3x3_layer = is_conv2d_layer and kernel_s != (1, 1)
+    mat_for_svd = original_diff_tensor.to(svd_computation_device, dtype=torch.float)
+    if is_conv2d_layer:
+        if is_conv2d_3x3_layer: mat_for_svd = mat_for_svd.flatten(start_dim=1)
+        else: mat_for_svd = mat_for_svd.squeeze()
+    if mat_for_svd.numel() == 0 or mat_for_svd.shape[0] == 0 or mat_for_svd.shape[1] == 0 :
+        logger.warning(f"Skipping SVD for {lora_name} due to empty/invalid shape: {mat_for_svd.shape}")
+        return None
+    # Max rank for SVD is based on 'dim' for linear and 'conv_dim' for conv3x3
+    # The original `current_max_rank` logic was:
+    # current_max_rank = dim if not is_conv2d_3x3_layer or conv_dim is None else conv_dim
+    # Here, `dim` is args.dim and `conv_dim` is args.conv_dim (defaulted to args.dim)
+    module_specific_max_rank = conv_dim if is_conv2d_3x3_layer else dim
+
+    try:
+        U_full, S_full, Vh_full, residual_energy, used_full = _truncated_svd(
+            mat_for_svd, module_specific_max_rank, svd_backend, svd_oversample, svd_niter, svd_energy_tolerance
+        )
+    except Exception as e:
+        logger.error(f"SVD failed for {lora_name} with shape {mat_for_svd.shape}. Error: {e}")
+        return None
+    if backend_stats is not None:
+        backend_stats["full" if used_full else "truncated"] += 1
+        if used_full and svd_backend != "full" and module_specific_max_rank + svd_oversample < min(mat_for_svd.shape):
+            backend_stats["fallback"] += 1
+            logger.debug(f"{lora_name}: spectrum too flat for a {svd_backend} sketch, used full SVD.")
+    if svd_cache is not None:
+        svd_cache.put(lora_name, original_diff_tensor.size(), U_full, S_full, Vh_full, residual_energy, module_specific_max_rank, used_full)
+
+    return _svd_components_to_lora(
+        lora_name, U_full, S_full, Vh_full, residual_energy, original_diff_tensor.size(), dim, conv_dim,
+        dynamic_method, dynamic_param, clamp_quantile, final_weights_device, save_dtype_torch, verbose
+    )
+
+def _svd_components_to_lora(lora_name, U_full, S_full, Vh_full, residual_energy, diff_shape, dim, conv_dim,
+                            dynamic_method, dynamic_param, clamp_quantile, final_weights_device, save_dtype_torch, verbose):
+    """
+    Picks the rank from S and builds the clamped (up, down) factors. Returns None when the chosen rank needs more
+    singular vectors than U/Vh hold (only possible for cached, top-K truncated components).
+    """
+    is_conv2d_layer = len(diff_shape) == 4
+    kernel_s = tuple(diff_shape[2:4]) if is_conv2d_layer else None
+    is_conv2d_3x3_layer = is_conv2d_layer and kernel_s != (1, 1)
+    module_true_out_channels, module_true_in_channels = diff_shape[0:2]
+    module_specific_max_rank = conv_dim if is_conv2d_3x3_layer else dim
+
+    # sv_fro needs the full Frobenius total; one extra value carrying the exact residual energy restores it
+    S_for_rank = S_full
+    if residual_energy > 0 and dynamic_method == "sv_fro":
+        S_for_rank = torch.cat([S_full, S_full.new_tensor([residual_energy ** 0.5])])
+
+    eff_out_dim, eff_in_dim = U_full.shape[0], Vh_full.shape[1]
+    rank = _determine_rank(S_for_rank, dynamic_method, dynamic_param,
+                           module_specific_max_rank, eff_in_dim, eff_out_dim, MIN_SV)
+    rank = min(rank, len(S_full))
+    if rank > min(U_full.shape[1], Vh_full.shape[0]):
+        return None
+    U_clamped, Vh_clamped = _construct_lora_weights_from_svd_components(
+        U_full, S_full, Vh_full, rank, clamp_quantile,
+        is_conv2d_layer, is_conv2d_3x3_layer, kernel_s,
+        module_true_out_channels, module_true_in_channels,
+        final_weights_device, save_dtype_torch
+    )
+    if verbose: _log_svd_stats(lora_name, S_for_rank, rank, MIN_SV)
+    return U_clamped, Vh_clamped
 
 def _determine_rank(S_values, dynamic_method_name, dynamic_param_value, max_rank_limit, 
                     module_eff_in_dim, module_eff_out_dim, min_sv_threshold=MIN_SV):
@@ -270,7 +591,7 @@ def _construct_lora_weights_from_svd_components(U_full, S_all_values, Vh_full, r
     U_final = U_k * s_sqrt.unsqueeze(0)
     Vh_final = Vh_k * s_sqrt.unsqueeze(1)
     dist = torch.cat([U_final.flatten(), Vh_final.flatten()])
-    hi_val = torch.quantile(dist, clamp_quantile_val)
+    hi_val = fast_quantile(dist, clamp_quantile_val)
     if hi_val == 0 and torch.max(torch.abs(dist)) > 1e-9:
          logger.debug(f"Clamping hi_val is zero for non-zero distribution. Max abs val: {torch.max(torch.abs(dist))}. Quantile: {clamp_quantile_val}")
     U_clamped = U_final.clamp(-hi_val, hi_val)
@@ -336,126 +657,104 @@ def _prepare_lora_metadata(output_path, is_v2_flag, kohya_base_model_version_str
         final_metadata.update(sai_metadata_content)
     return final_metadata
 
-# --- Main SVD Function ---
-def svd(
-    model_org=None, model_tuned=None, save_to=None, dim=4, v2=None, sdxl=None, 
-    conv_dim=None, v_parameterization=None, device=None, save_precision=None,
-    clamp_quantile=0.99, min_diff=0.01, no_metadata=False, load_precision=None,
-    load_original_model_to=None, load_tuned_model_to=None,
-    dynamic_method=None, dynamic_param=None, verbose=False,
-):
-    actual_v_parameterization = v2 if v_parameterization is None else v_parameterization
-    load_dtype_torch = _str_to_dtype(load_precision)
-    save_dtype_torch = _str_to_dtype(save_precision) if save_precision else torch.float
-    
-    svd_computation_device = torch.device(device if device else "cuda" if torch.cuda.is_available() else "cpu")
-    logger.info(f"Using SVD computation device: {svd_computation_device}")
-    diff_calculation_device = torch.device("cpu")
-    logger.info(f"Calculating weight differences on: {diff_calculation_device}")
-    final_weights_device = torch.device("cpu")
-
+def _load_model_placeholders(model_path, loader, v2, sdxl, lora_conv_dim_init, load_to, load_dtype_torch):
+    """Returns (text_encoder, unet) dicts of lora_name -> placeholder for one model, with either loader."""
+    if loader == "direct":
+        # Map checkpoint keys to LoRA names from the file header; weights are read lazily, the VAE never.
+        return _local_create_checkpoint_placeholders(model_path, v2, sdxl, lora_conv_dim_init, load_dtype_torch)
     if not sdxl:
-        text_encoders_o, unet_o = _load_sd_model_components(model_org, v2, load_original_model_to, load_dtype_torch)
-        text_encoders_t, unet_t = _load_sd_model_components(model_tuned, v2, load_tuned_model_to, load_dtype_torch)
-        kohya_model_version = _local_get_model_version_str_for_sd1_sd2(v2, actual_v_parameterization)
+        text_encoders, unet = _load_sd_model_components(model_path, v2, load_to, load_dtype_torch)
     else:
-        text_encoders_o, unet_o = _load_sdxl_model_components(model_org, load_original_model_to, load_dtype_torch)
-        text_encoders_t, unet_t = _load_sdxl_model_components(model_tuned, load_tuned_model_to, load_dtype_torch)
-        kohya_model_version = _LOCAL_MODEL_VERSION_SDXL_BASE_V1_0
-    
-    # Determine lora_conv_dim_init based on conv_dim argument for network creation
-    # The original script used init_dim_val (1) if conv_dim was None.
-    # Here, conv_dim is already defaulted to args.dim if None by the main block.
-    # So, lora_conv_dim_init will be args.conv_dim (which defaults to args.dim).
-    # If args.conv_dim was explicitly 0, this would be 0.
-    lora_conv_dim_init_val = conv_dim # conv_dim is args.conv_dim (or args.dim)
-
-    # Create LoRA placeholders using the localized function
-    text_encoder_loras_o, unet_loras_o = _local_create_network_placeholders(text_encoders_o, unet_o, lora_conv_dim_init_val)
-    text_encoder_loras_t, unet_loras_t = _local_create_network_placeholders(text_encoders_t, unet_t, lora_conv_dim_init_val) # same conv_dim logic for tuned
-
-    # Group LoRA placeholders for easier processing (mimicking LoraNetwork structure somewhat)
-    class LocalLoraNetworkPlaceholder:
-        def __init__(self, te_loras, unet_loras_list):
-            self.text_encoder_loras = te_loras
-            self.unet_loras = unet_loras_list
-            
-    lora_network_o = LocalLoraNetworkPlaceholder(text_encoder_loras_o, unet_loras_o)
-    lora_network_t = LocalLoraNetworkPlaceholder(text_encoder_loras_t, unet_loras_t)
-    
-    assert len(lora_network_o.text_encoder_loras) == len(lora_network_t.text_encoder_loras), \
-        f"Model versions (based on identified LoRA-able TE modules) differ: {len(lora_network_o.text_encoder_loras)} vs {len(lora_network_t.text_encoder_loras)} TEs"
-
-    all_diffs = {}
-    te_diffs, text_encoder_different = _calculate_module_diffs_and_check(
-        lora_network_o.text_encoder_loras, lora_network_t.text_encoder_loras,
+        text_encoders, unet = _load_sdxl_model_components(model_path, load_to, load_dtype_torch)
+    # Create LoRA placeholders using the localized function; they keep the loaded modules alive
+    te_loras, unet_loras = _local_create_network_placeholders(text_encoders, unet, lora_conv_dim_init)
+    return {p.lora_name: p for p in te_loras}, {p.lora_name: p for p in unet_loras}
+
+def _extract_lora_for_target(
+    te_map_o, unet_map_o, model_tuned, save_to, *, v2, sdxl, conv_dim, dim, kohya_model_version,
+    actual_v_parameterization, load_tuned_model_to, load_dtype_torch, save_dtype_torch, loader,
+    svd_computation_device, diff_calculation_device, final_weights_device,
+    clamp_quantile, min_diff, no_metadata, dynamic_method, dynamic_param, verbose,
+    prefetch_modules, svd_backend, svd_oversample, svd_niter, svd_energy_tolerance,
+    model_org=None, load_precision=None, svd_cache_dir=None, svd_cache_rank=None,
+):
+    """Diffs one tuned model against the already-loaded base placeholders and saves its LoRA."""
+    logger.info(f"--- Target: {model_tuned} -> {save_to}")
+    svd_cache = LocalSVDCache(svd_cache_dir, model_org, model_tuned, load_precision, svd_cache_rank,
+                              svd_backend, svd_oversample, svd_niter) if svd_cache_dir else None
+    te_map_t, unet_map_t = _load_model_placeholders(model_tuned, loader, v2, sdxl, conv_dim, load_tuned_model_to, load_dtype_torch)
+    for kind, map_o, map_t in (("Text Encoder", te_map_o, te_map_t), ("U-Net", unet_map_o, unet_map_t)):
+        if map_o.keys() != map_t.keys():
+            logger.warning(f"{kind} modules differ between models ({len(map_o)} vs {len(map_t)}); using the {len(map_o.keys() & map_t.keys())} common ones.")
+    te_names = sorted(te_map_o.keys() & te_map_t.keys())
+    unet_names = sorted(unet_map_o.keys() & unet_map_t.keys())
+    if loader == "direct":
+        # Modules whose checkpoint tensors are byte-identical (raw-byte fingerprints, cached next to the models) are never read
+        def same_source(name, map_o, map_t):
+            ref_o, ref_t = map_o[name].org_module, map_t[name].org_module
+            return ref_o.key == ref_t.key and ref_o.rows == ref_t.rows and ref_o.transpose == ref_t.transpose
+        identical_keys = identical_tensor_keys(model_org, model_tuned, sorted({p.org_module.key for p in te_map_o.values()} | {p.org_module.key for p in unet_map_o.values()}))
+        te_kept = [n for n in te_names if not (same_source(n, te_map_o, te_map_t) and te_map_o[n].org_module.key in identical_keys)]
+        unet_kept = [n for n in unet_names if not (same_source(n, unet_map_o, unet_map_t) and unet_map_o[n].org_module.key in identical_keys)]
+        if len(te_kept) + len(unet_kept) < len(te_names) + len(unet_names):
+            logger.info(f"Fingerprints: skipping {len(te_names) - len(te_kept)} Text Encoder and {len(unet_names) - len(unet_kept)} U-Net modules with byte-identical weights.")
+        te_names, unet_names = te_kept, unet_kept
+
+    # First pass: cheap max-abs check decides whether the text encoders are extracted at all.
+    text_encoder_different = _check_modules_differ(
+        [te_map_o[n] for n in te_names], [te_map_t[n] for n in te_names],
         diff_calculation_device, min_diff, "Text Encoder"
     )
-
+    module_pairs = []
     if text_encoder_different:
-        all_diffs.update(te_diffs)
+        module_pairs += [(te_map_o[n], te_map_t[n], "Text Encoder") for n in te_names]
     else:
         logger.warning("Text encoders are considered identical based on min_diff. Not extracting TE LoRA.")
-        # To prevent processing empty list later, ensure it's empty if no diffs
-        lora_network_o.text_encoder_loras = []
-    del text_encoders_t # Free memory early
+    module_pairs += [(unet_map_o[n], unet_map_t[n], "U-Net") for n in unet_names]
 
-    unet_diffs, _ = _calculate_module_diffs_and_check(
-        lora_network_o.unet_loras, lora_network_t.unet_loras,
-        diff_calculation_device, min_diff, "U-Net"
-    )
-    all_diffs.update(unet_diffs)
-    del lora_network_t, unet_t # Free memory early
-
-    # Ensure lora_names_to_process only includes modules from lora_network_o
-    # that are actually present (e.g., if TEs were skipped)
-    lora_names_to_process = set()
-    if text_encoder_different: # Only add TE loras if they were deemed different
-        lora_names_to_process.update(p.lora_name for p in lora_network_o.text_encoder_loras)
-    lora_names_to_process.update(p.lora_name for p in lora_network_o.unet_loras)
-    
-    logger.info("Extracting and resizing LoRA via SVD")
     lora_weights = {}
+    if svd_cache is not None:
+        # Layers whose cached spectrum covers the rank chosen now are rebuilt without reading either model
+        need_full_spectrum = dynamic_method in SVD_BACKENDS_NEED_FULL_SPECTRUM
+        remaining_pairs = []
+        for pair in module_pairs:
+            cached = svd_cache.get(pair[0].lora_name, need_full_spectrum)
+            factors = None
+            if cached is not None:
+                U_c, S_c, Vh_c, residual_c, shape_c = cached
+                factors = _svd_components_to_lora(
+                    pair[0].lora_name, U_c, S_c, Vh_c, residual_c, shape_c, dim, conv_dim,
+                    dynamic_method, dynamic_param, clamp_quantile, final_weights_device, save_dtype_torch, verbose
+                )
+            if factors is None:
+                svd_cache.misses += 1
+                remaining_pairs.append(pair)
+            else:
+                svd_cache.hits += 1
+                lora_weights[pair[0].lora_name] = factors
+        module_pairs = remaining_pairs
+        logger.info(f"SVD cache: {svd_cache.hits} layers rebuilt from cache, {svd_cache.misses} to decompose.")
+
+    # Second pass: one module delta at a time -> SVD -> keep only the truncated factors.
+    logger.info(f"Extracting and resizing LoRA via SVD (backend: {svd_backend}, diff prefetch: {prefetch_modules} modules)")
+    backend_stats = {"full": 0, "truncated": 0, "fallback": 0}
     with torch.no_grad():
-        for lora_name in tqdm(lora_names_to_process):
-            if lora_name not in all_diffs:
-                logger.warning(f"Skipping {lora_name} as no diff was calculated for it (e.g., Text Encoders were identical).")
-                continue
-            original_diff_tensor = all_diffs[lora_name]
-            is_conv2d_layer = len(original_diff_tensor.size()) == 4
-            kernel_s = original_diff_tensor.size()[2:4] if is_conv2d_layer else None
-            is_conv2d_3x3_layer = is_conv2d_layer and kernel_s != (1, 1)
-            module_true_out_channels, module_true_in_channels = original_diff_tensor.size()[0:2]
-            mat_for_svd = original_diff_tensor.to(svd_computation_device, dtype=torch.float)
-            if is_conv2d_layer:
-                if is_conv2d_3x3_layer: mat_for_svd = mat_for_svd.flatten(start_dim=1)
-                else: mat_for_svd = mat_for_svd.squeeze()
-            if mat_for_svd.numel() == 0 or mat_for_svd.shape[0] == 0 or mat_for_svd.shape[1] == 0 :
-                logger.warning(f"Skipping SVD for {lora_name} due to empty/invalid shape: {mat_for_svd.shape}")
-                continue
-            try:
-                U_full, S_full, Vh_full = torch.linalg.svd(mat_for_svd)
-            except Exception as e:
-                logger.error(f"SVD failed for {lora_name} with shape {mat_for_svd.shape}. Error: {e}")
-                continue
-            
-            # Max rank for SVD is based on 'dim' for linear and 'conv_dim' for conv3x3
-            # The original `current_max_rank` logic was:
-            # current_max_rank = dim if not is_conv2d_3x3_layer or conv_dim is None else conv_dim
-            # Here, `dim` is args.dim and `conv_dim` is args.conv_dim (defaulted to args.dim)
-            module_specific_max_rank = conv_dim if is_conv2d_3x3_layer else dim
-            
-            eff_out_dim, eff_in_dim = mat_for_svd.shape[0], mat_for_svd.shape[1]
-            rank = _determine_rank(S_full, dynamic_method, dynamic_param,
-                                   module_specific_max_rank, eff_in_dim, eff_out_dim, MIN_SV)
-            U_clamped, Vh_clamped = _construct_lora_weights_from_svd_components(
-                U_full, S_full, Vh_full, rank, clamp_quantile,
-                is_conv2d_layer, is_conv2d_3x3_layer, kernel_s,
-                module_true_out_channels, module_true_in_channels,
-                final_weights_device, save_dtype_torch
+        module_diffs = _iter_module_diffs_prefetched(module_pairs, diff_calculation_device, prefetch_modules)
+        for lora_name, original_diff_tensor in tqdm(module_diffs, total=len(module_pairs)):
+            factors = _svd_module_to_lora(
+                lora_name, original_diff_tensor, svd_computation_device, dim, conv_dim,
+                dynamic_method, dynamic_param, clamp_quantile,
+                final_weights_device, save_dtype_torch, verbose,
+                svd_backend, svd_oversample, svd_niter, svd_energy_tolerance, backend_stats, svd_cache
             )
-            lora_weights[lora_name] = (U_clamped, Vh_clamped)
-            if verbose: _log_svd_stats(lora_name, S_full, rank, MIN_SV)
+            del original_diff_tensor
+            if factors is not None:
+                lora_weights[lora_name] = factors
+    del module_pairs, te_map_t, unet_map_t # Free the tuned model early
+    if svd_cache is not None:
+        svd_cache.save()
+    if svd_backend != "full":
+        logger.info(f"SVD backend '{svd_backend}': {backend_stats['truncated']} truncated, {backend_stats['full']} full ({backend_stats['fallback']} fallbacks on flat spectra).")
 
     lora_sd = {}
     for lora_name, (up_weight, down_weight) in lora_weights.items():
@@ -464,7 +763,6 @@ def svd(
         # Alpha is set to the rank (dim of down_weight's 0th axis, which is rank)
         lora_sd[lora_name + ".alpha"] = torch.tensor(down_weight.size()[0], dtype=save_dtype_torch, device=final_weights_device)
 
-    del text_encoders_o, unet_o, lora_network_o, all_diffs # Clean up original models and placeholders
     if 'torch' in sys.modules and hasattr(torch, 'cuda') and torch.cuda.is_available():
         torch.cuda.empty_cache()
         
@@ -482,10 +780,114 @@ def svd(
         is_sdxl_flag=sdxl, 
         skip_sai_meta=no_metadata
     )
-    
-    save_to_file(save_to, lora_sd, save_dtype_torch, metadata_to_save)
+    save_to_file(save_to, lora_sd, save_dtype_torch, metadata_to_save, sshs_hashes=not no_metadata)
     logger.info(f"LoRA saved to: {save_to}")
 
+def _target_save_path(save_to, model_tuned, multi_target):
+    """Single target: `save_to` as given. Several targets: `save_to` is a directory or a path template with `{name}`."""
+    if not multi_target:
+        return save_to
+    name = os.path.splitext(os.path.basename(model_tuned))[0]
+    if "{name}" in save_to:
+        return save_to.format(name=name)
+    return os.path.join(save_to, name + ".safetensors")
+
+def _list_model_files(directory):
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if os.path.splitext(f)[1].lower() in MODEL_FILE_EXTENSIONS)
+
+# --- Main SVD Function ---
+def svd(
+    model_org=None, model_tuned=None, save_to=None, dim=4, v2=None, sdxl=None, 
+    conv_dim=None, v_parameterization=None, device=None, save_precision=None,
+    clamp_quantile=0.99, min_diff=0.01, no_metadata=False, load_precision=None,
+    load_original_model_to=None, load_tuned_model_to=None,
+    dynamic_method=None, dynamic_param=None, verbose=False, loader="direct", prefetch_modules=2,
+    svd_backend="full", svd_oversample=8, svd_niter=2, svd_energy_tolerance=0.05,
+    tuned_dir=None, watch=False, watch_interval=30.0, svd_cache=None, svd_cache_rank=None,
+):
+    actual_v_parameterization = v2 if v_parameterization is None else v_parameterization
+    load_dtype_torch = _str_to_dtype(load_precision)
+    save_dtype_torch = _str_to_dtype(save_precision) if save_precision else torch.float
+    
+    svd_computation_device = torch.device(device if device else "cuda" if torch.cuda.is_available() else "cpu")
+    logger.info(f"Using SVD computation device: {svd_computation_device}")
+    diff_calculation_device = torch.device("cpu")
+    logger.info(f"Calculating weight differences on: {diff_calculation_device}")
+    final_weights_device = torch.device("cpu")
+
+    kohya_model_version = _LOCAL_MODEL_VERSION_SDXL_BASE_V1_0 if sdxl else _local_get_model_version_str_for_sd1_sd2(v2, actual_v_parameterization)
+    
+    # Determine lora_conv_dim_init based on conv_dim argument for network creation
+    # The original script used init_dim_val (1) if conv_dim was None.
+    # Here, conv_dim is already defaulted to args.dim if None by the main block.
+    # So, lora_conv_dim_init will be args.conv_dim (which defaults to args.dim).
+    # If args.conv_dim was explicitly 0, this would be 0.
+    lora_conv_dim_init_val = conv_dim # conv_dim is args.conv_dim (or args.dim)
+
+    if svd_backend != "full" and dynamic_method in SVD_BACKENDS_NEED_FULL_SPECTRUM:
+        logger.warning(f"--dynamic_method {dynamic_method} needs the full spectrum; using --svd_backend full instead of {svd_backend}.")
+        svd_backend = "full"
+
+    # The base model is loaded once and shared by every target.
+    te_map_o, unet_map_o = _load_model_placeholders(model_org, loader, v2, sdxl, lora_conv_dim_init_val, load_original_model_to, load_dtype_torch)
+
+    tuned_models = list(model_tuned or [])
+    if isinstance(model_tuned, str):
+        tuned_models = [model_tuned]
+    if tuned_dir:
+        tuned_models += [p for p in _list_model_files(tuned_dir) if p not in tuned_models]
+    multi_target = len(tuned_models) > 1 or bool(tuned_dir)
+    target_kwargs = dict(
+        v2=v2, sdxl=sdxl, conv_dim=conv_dim, dim=dim, kohya_model_version=kohya_model_version,
+        actual_v_parameterization=actual_v_parameterization, load_tuned_model_to=load_tuned_model_to,
+        load_dtype_torch=load_dtype_torch, save_dtype_torch=save_dtype_torch, loader=loader,
+        svd_computation_device=svd_computation_device, diff_calculation_device=diff_calculation_device,
+        final_weights_device=final_weights_device, clamp_quantile=clamp_quantile, min_diff=min_diff,
+        no_metadata=no_metadata, dynamic_method=dynamic_method, dynamic_param=dynamic_param, verbose=verbose,
+        prefetch_modules=prefetch_modules, svd_backend=svd_backend, svd_oversample=svd_oversample,
+        svd_niter=svd_niter, svd_energy_tolerance=svd_energy_tolerance,
+        model_org=model_org, load_precision=load_precision, svd_cache_dir=svd_cache, svd_cache_rank=svd_cache_rank,
+    )
+
+    done, failed = set(), []
+    def run_target(tuned_path):
+        target_save_to = _target_save_path(save_to, tuned_path, multi_target)
+        if watch and os.path.exists(target_save_to):
+            logger.info(f"Skipping {tuned_path}: {target_save_to} already exists.")
+        else:
+            try:
+                _extract_lora_for_target(te_map_o, unet_map_o, tuned_path, target_save_to, **target_kwargs)
+            except Exception as e:
+                if not multi_target:
+                    raise
+                logger.error(f"Extraction failed for {tuned_path}: {e}")
+                failed.append(tuned_path)
+        done.add(tuned_path)
+
+    for i, tuned_path in enumerate(tuned_models):
+        if multi_target: logger.info(f"=== Target {i + 1}/{len(tuned_models)} ===")
+        run_target(tuned_path)
+
+    if watch:
+        logger.info(f"Watching {tuned_dir} for new models every {watch_interval:g}s (Ctrl+C to stop).")
+        last_sizes = {}
+        try:
+            while True:
+                time.sleep(watch_interval)
+                for tuned_path in _list_model_files(tuned_dir):
+                    if tuned_path in done:
+                        continue
+                    size = os.path.getsize(tuned_path)
+                    # only pick up files whose size was stable across two polls (i.e. fully copied)
+                    if last_sizes.get(tuned_path) == size:
+                        run_target(tuned_path)
+                    last_sizes[tuned_path] = size
+        except KeyboardInterrupt:
+            logger.info("Stopped watching.")
+
+    if multi_target:
+        logger.info(f"Extracted {len(done) - len(failed)} of {len(done)} targets." + (f" Failed: {', '.join(failed)}" if failed else ""))
+
 def setup_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--v2", action="store_true", help="Load Stable Diffusion v2.x model")
@@ -494,8 +896,11 @@ def setup_parser():
     parser.add_argument("--load_precision", type=str, choices=["float", "fp16", "bf16"], default=None, help="Precision for loading models (applied after initial load)")
     parser.add_argument("--save_precision", type=str, choices=["float", "fp16", "bf16"], default="float", help="Precision for saving LoRA weights")
     parser.add_argument("--model_org", type=str, required=True, help="Original Stable Diffusion model (ckpt/safetensors)")
-    parser.add_argument("--model_tuned", type=str, required=True, help="Tuned Stable Diffusion model (ckpt/safetensors)")
-    parser.add_argument("--save_to", type=str, required=True, help="Output file name (ckpt/safetensors)")
+    parser.add_argument("--model_tuned", type=str, nargs="*", default=[], help="Tuned Stable Diffusion model(s) (ckpt/safetensors). Several targets share one base load")
+    parser.add_argument("--tuned_dir", type=str, default=None, help="Directory of tuned models to extract, in addition to --model_tuned")
+    parser.add_argument("--watch", action="store_true", help="Keep polling --tuned_dir and extract models that appear (skips targets whose output exists)")
+    parser.add_argument("--watch_interval", type=float, default=30.0, help="Polling interval in seconds for --watch")
+    parser.add_argument("--save_to", type=str, required=True, help="Output file name (ckpt/safetensors). With several targets: an output directory, or a path containing '{name}' (tuned model file name without extension)")
     parser.add_argument("--dim", type=int, default=4, help="Max dimension (rank) of LoRA for linear layers")
     parser.add_argument("--conv_dim", type=int, default=None, help="Max dimension (rank) of LoRA for Conv2d-3x3. Defaults to 'dim' if not set.")
     parser.add_argument("--device", type=str, default=None, help="Device for SVD computation (e.g., cuda, cpu). Defaults to cuda if available, else cpu.")
@@ -504,6 +909,24 @@ def setup_parser():
     parser.add_argument("--no_metadata", action="store_true", help="Omit detailed metadata from SAI and Kohya_ss")
     parser.add_argument("--load_original_model_to", type=str, default=None, help="Device for original model (e.g. 'cpu', 'cuda:0'). Defaults to CPU for SD1/2, honored for SDXL.")
     parser.add_argument("--load_tuned_model_to", type=str, default=None, help="Device for tuned model (e.g. 'cpu', 'cuda:0'). Defaults to CPU for SD1/2, honored for SDXL.")
+    parser.add_argument(
+        "--loader", type=str, choices=["direct", "diffusers"], default="direct",
+        help="'direct' maps original checkpoint keys to LoRA names and reads weights lazily (no VAE, no pipeline); "
+             "'diffusers' builds full diffusers pipelines via from_single_file (--load_*_model_to only apply here)"
+    )
+    parser.add_argument(
+        "--svd_backend", type=str, choices=["full", "randomized", "lowrank"], default="full",
+        help="'full' = torch.linalg.svd; 'randomized' = range finder with power iterations; 'lowrank' = torch.svd_lowrank. "
+             "Truncated backends compute dim + oversample components and fall back to a full SVD on flat spectra. "
+             "sv_ratio/sv_rel_decrease/sv_fro give the same ranks as 'full', sv_cumulative always uses 'full', "
+             "knee methods are evaluated on the truncated spectrum"
+    )
+    parser.add_argument("--svd_oversample", type=int, default=8, help="Extra components computed by truncated SVD backends")
+    parser.add_argument("--svd_niter", type=int, default=2, help="Power iterations for truncated SVD backends")
+    parser.add_argument("--svd_energy_tolerance", type=float, default=0.05, help="Fall back to full SVD when the estimated top-k energy a sketch may have missed exceeds this fraction")
+    parser.add_argument("--svd_cache", type=str, default=None, help="Directory for a per-layer SVD cache (singular values + top-K vectors) keyed by fingerprints of both models. Later runs at rank <= K rebuild layers from it without decomposing; layers decomposed by a truncated --svd_backend are not reused by --svd_backend full")
+    parser.add_argument("--svd_cache_rank", type=int, default=None, help="K: number of singular vectors kept per layer in --svd_cache (default and minimum: the rank requested for this run). Truncated backends keep at most rank + oversample")
+    parser.add_argument("--prefetch_modules", type=int, default=2, help="Number of module deltas computed ahead of the SVD on a background thread (bounds extra memory)")
     parser.add_argument("--dynamic_param", type=float, help="Parameter for dynamic rank reduction")
     parser.add_argument("--verbose", action="store_true", help="Show detailed rank reduction info for each module")
     parser.add_argument(
@@ -529,6 +952,11 @@ if __name__ == "__main__":
         if args.dim <= 0: parser.error(f"--dim (rank) must be > 0. Got {args.dim}")
         if args.conv_dim <=0: parser.error(f"--conv_dim (rank) must be > 0. Got {args.conv_dim}") # Check after defaulting
     
+    if not args.model_tuned and not args.tuned_dir:
+        parser.error("Give at least one --model_tuned or a --tuned_dir.")
+    if args.watch and not args.tuned_dir:
+        parser.error("--watch requires --tuned_dir.")
+
     if MIN_SV <= 0: logger.warning(f"Global MIN_SV ({MIN_SV}) should be positive.")
         
     svd_args = vars(args).copy()
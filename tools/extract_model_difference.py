@@ -1,87 +1,233 @@
 import torch
-from safetensors.torch import load_file, save_file
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import os
+import sys
+import json
+import math
 import argparse # Import argparse
+from tensor_fingerprint import identical_tensor_keys
+from safetensors_io import SAFETENSORS_DTYPES, FLOAT_DTYPE_NAMES, SafetensorsReader, write_safetensors_streamed
 
-def extract_model_differences(base_model_path, finetuned_model_path, output_delta_path=None, save_dtype_str="float32"):
+DELTA_FORMATS = ["float", "int8", "topk", "lowrank_sparse"]
+# Compressed entries are stored as "<key>::<part>"; plain "<key>" entries are full deltas (or new tensors)
+DELTA_PART_SEPARATOR = "::"
+
+def _topk_count(numel, ratio):
+    return max(1, min(numel, math.ceil(ratio * numel)))
+
+
+def _topk_index_dtype(numel):
+    return torch.int32 if numel <= torch.iinfo(torch.int32).max else torch.int64
+
+
+def _topk_sparse(flat, ratio):
+    """Indices/values of the ceil(ratio * n) largest-magnitude elements of a 1-D tensor."""
+    indices = torch.topk(flat.abs(), _topk_count(flat.numel(), ratio), sorted=False).indices.sort().values
+    return indices.to(_topk_index_dtype(flat.numel())), flat[indices]
+
+
+def encode_delta_tensor(key, delta, delta_format, save_dtype, topk_ratio=0.01, delta_rank=32):
+    """
+    Encodes one float32 delta. Returns the {name: tensor} entries to store.
+    Only floating-point tensors with 2+ dims are compressed; others are stored as plain deltas.
+      int8:           per-output-channel (dim 0) symmetric int8 ("q") with float32 "scale".
+      topk:           the topk_ratio largest-magnitude elements ("idx" flat indices, "val") plus "shape".
+      lowrank_sparse: rank-`delta_rank` factors of the (out, -1) matrix ("up", "down") plus a top-k sparse
+                      residual ("idx", "val") and "shape".
+    """
+    if delta_format == "float" or delta.dim() < 2 or not delta.is_floating_point():
+        return {key: delta.to(save_dtype) if delta.is_floating_point() else delta}
+    part = lambda name: f"{key}{DELTA_PART_SEPARATOR}{name}"
+    if delta_format == "int8":
+        scale = delta.abs().reshape(delta.shape[0], -1).amax(dim=1) / 127.0
+        scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+        q = torch.round(delta / scale.reshape(-1, *([1] * (delta.dim() - 1)))).clamp(-127, 127).to(torch.int8)
+        return {part("q"): q.contiguous(), part("scale"): scale.to(torch.float32)}
+    entries = {part("shape"): torch.tensor(list(delta.shape), dtype=torch.int64)}
+    residual = delta
+    if delta_format == "lowrank_sparse":
+        mat = delta.reshape(delta.shape[0], -1)
+        rank = min(delta_rank, *mat.shape)
+        if min(mat.shape) > 2 * (rank + 8):
+            U, S, V = torch.svd_lowrank(mat, q=rank + 8, niter=4)
+            Vh = V.T
+        else:
+            U, S, Vh = torch.linalg.svd(mat, full_matrices=False)
+        up, down = U[:, :rank] * S[:rank], Vh[:rank]
+        entries[part("up")] = up.to(save_dtype).contiguous()
+        entries[part("down")] = down.to(save_dtype).contiguous()
+        residual = (mat - entries[part("up")].float() @ entries[part("down")].float()).reshape(delta.shape)
+    indices, values = _topk_sparse(residual.reshape(-1), topk_ratio)
+    entries[part("idx")] = indices.contiguous()
+    entries[part("val")] = values.to(save_dtype).contiguous()
+    return entries
+
+
+def delta_entry_plan(key, shape, delta_format, save_dtype, topk_ratio=0.01, delta_rank=32):
+    """The [(name, dtype, shape)] entries encode_delta_tensor produces for a floating-point delta of `shape`."""
+    shape = list(shape)
+    if delta_format == "float" or len(shape) < 2:
+        return [(key, save_dtype, shape)]
+    part = lambda name: f"{key}{DELTA_PART_SEPARATOR}{name}"
+    if delta_format == "int8":
+        return [(part("q"), torch.int8, shape), (part("scale"), torch.float32, [shape[0]])]
+    numel = math.prod(shape)
+    entries = [(part("shape"), torch.int64, [len(shape)])]
+    if delta_format == "lowrank_sparse":
+        rank = min(delta_rank, shape[0], numel // shape[0])
+        entries += [(part("up"), save_dtype, [shape[0], rank]), (part("down"), save_dtype, [rank, numel // shape[0]])]
+    k = _topk_count(numel, topk_ratio)
+    return entries + [(part("idx"), _topk_index_dtype(numel), [k]), (part("val"), save_dtype, [k])]
+
+
+def delta_entry_keys(delta_keys):
+    """Maps each model key described by a delta file to the names of its stored entries."""
+    grouped = OrderedDict()
+    for name in delta_keys:
+        grouped.setdefault(name.split(DELTA_PART_SEPARATOR, 1)[0], []).append(name)
+    return grouped
+
+
+def decode_delta_tensor(key, get_entry, entry_names):
+    """Rebuilds the float32 delta for `key`; `get_entry(name)` returns a stored tensor."""
+    parts = {name.split(DELTA_PART_SEPARATOR, 1)[1]: name for name in entry_names if DELTA_PART_SEPARATOR in name}
+    if not parts:
+        tensor = get_entry(key)
+        return tensor.to(torch.float32) if tensor.is_floating_point() else tensor
+    if "q" in parts:
+        q = get_entry(parts["q"]).to(torch.float32)
+        return q * get_entry(parts["scale"]).to(torch.float32).reshape(-1, *([1] * (q.dim() - 1)))
+    shape = [int(d) for d in get_entry(parts["shape"]).tolist()]
+    if "up" in parts:
+        delta = (get_entry(parts["up"]).to(torch.float32) @ get_entry(parts["down"]).to(torch.float32)).reshape(-1)
+    else:
+        delta = torch.zeros(math.prod(shape), dtype=torch.float32)
+    delta.index_add_(0, get_entry(parts["idx"]).long(), get_entry(parts["val"]).to(torch.float32))
+    return delta.reshape(shape)
+
+def _peak_rss_bytes():
+    """Peak resident set size of this process, or None where it cannot be measured."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    except ImportError:
+        return None
+
+
+def _size_balanced_chunks(items, item_bytes, target_bytes):
+    """Splits `items` ((kind, key) work items, in order) into consecutive chunks of about `target_bytes` each."""
+    chunks, current, current_bytes = [], [], 0
+    for item in items:
+        current.append(item)
+        current_bytes += item_bytes[item[1]]
+        if current_bytes >= target_bytes:
+            chunks.append(current)
+            current, current_bytes = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def extract_model_differences(base_model_path, finetuned_model_path, output_delta_path=None, save_dtype_str="float32", skip_identical=True,
+                              delta_format="float", topk_ratio=0.01, delta_rank=32, error_report_path=None, workers=None,
+                              max_inflight_mb=2048):
     """
     Calculates the difference between the state dictionaries of a fine-tuned model
-    and a base model.
+    and a base model, and streams it to a .safetensors file.
+
+    Keys are planned from both file headers, split into size-balanced chunks and diffed by a thread pool.
+    Each chunk is encoded straight to the save dtype and written in order as soon as it is ready. Chunks are
+    only submitted while the estimated memory of all submitted-but-unwritten chunks stays under
+    max_inflight_mb, so peak memory is bounded independently of the model size.
 
     Args:
         base_model_path (str): Path to the base model .safetensors file.
         finetuned_model_path (str): Path to the fine-tuned model .safetensors file.
         output_delta_path (str, optional): Path to save the resulting delta weights
-                                           .safetensors file. If None, not saved.
+                                           .safetensors file. If None, differences are only computed and reported.
         save_dtype_str (str, optional): Data type to save the delta weights ('float32', 'float16', 'bfloat16').
                                         Defaults to 'float32'.
+        skip_identical (bool, optional): Leave out keys whose tensors are byte-identical in both files
+                                         (found via raw-byte fingerprints). Defaults to True.
+        delta_format (str, optional): How deltas are stored: 'float', 'int8', 'topk' or 'lowrank_sparse'
+                                      (see encode_delta_tensor). Defaults to 'float'.
+        topk_ratio (float, optional): Fraction of elements kept by 'topk' / the residual of 'lowrank_sparse'.
+        delta_rank (int, optional): Rank of the 'lowrank_sparse' factors.
+        error_report_path (str, optional): Write the per-key relative reconstruction error as JSON here.
+        workers (int, optional): Diff threads. Defaults to the CPU count (at most 16).
+        max_inflight_mb (int, optional): Memory budget for chunks in flight: their fp32 working set plus the
+                                         encoded deltas not yet written. A single chunk above it still runs,
+                                         alone. Defaults to 2048.
     Returns:
-        OrderedDict: A state dictionary containing the delta weights.
-                     Returns None if loading fails or other critical errors.
+        dict: Counts ('diffed', 'identical', 'unique_to_finetuned', 'skipped', 'written') and per-key
+              reconstruction 'errors'. Returns None if the model headers cannot be read.
     """
-    print(f"Loading base model from: {base_model_path}")
-    try:
-        # Ensure model is loaded to CPU to avoid CUDA issues if not needed for diffing
-        base_state_dict = load_file(base_model_path, device="cpu")
-        print(f"Base model loaded. Found {len(base_state_dict)} tensors.")
-    except Exception as e:
-        print(f"Error loading base model: {e}")
-        return None
+    save_dtype = torch.float32 # Default
+    if save_dtype_str == "float16":
+        save_dtype = torch.float16
+    elif save_dtype_str == "bfloat16":
+        save_dtype = torch.bfloat16
+    elif save_dtype_str != "float32":
+        print(f"Warning: Invalid save_dtype '{save_dtype_str}'. Defaulting to float32.")
+        save_dtype_str = "float32" # for print message
+    workers = workers or min(os.cpu_count() or 1, 16)
 
-    print(f"\nLoading fine-tuned model from: {finetuned_model_path}")
     try:
-        finetuned_state_dict = load_file(finetuned_model_path, device="cpu")
-        print(f"Fine-tuned model loaded. Found {len(finetuned_state_dict)} tensors.")
+        base_model = SafetensorsReader(base_model_path)
+        finetuned_model = SafetensorsReader(finetuned_model_path)
     except Exception as e:
-        print(f"Error loading fine-tuned model: {e}")
+        print(f"Error reading model headers: {e}")
         return None
+    base_header, finetuned_header = base_model.header, finetuned_model.header
+    print(f"Base model: {len(base_header)} tensors. Fine-tuned model: {len(finetuned_header)} tensors.")
 
-    delta_state_dict = OrderedDict()
-    diff_count = 0
     skipped_count = 0
-    error_count = 0
-    unique_to_finetuned_count = 0
-    unique_to_base_count = 0
-
-    print("\nCalculating differences...")
+    identical_count = 0
 
     # Keys in finetuned model
-    finetuned_keys = set(finetuned_state_dict.keys())
-    base_keys = set(base_state_dict.keys())
+    finetuned_keys = set(finetuned_header.keys())
+    base_keys = set(base_header.keys())
 
     common_keys = finetuned_keys.intersection(base_keys)
     keys_only_in_finetuned = finetuned_keys - base_keys
     keys_only_in_base = base_keys - finetuned_keys
 
-    for key in common_keys:
-        ft_tensor = finetuned_state_dict[key]
-        base_tensor = base_state_dict[key]
+    identical_keys = identical_tensor_keys(base_model_path, finetuned_model_path, sorted(common_keys)) if skip_identical else set()
 
-        if not (ft_tensor.is_floating_point() and base_tensor.is_floating_point()):
-            # print(f"Skipping key '{key}': Non-floating point tensors (FT: {ft_tensor.dtype}, Base: {base_tensor.dtype}).")
+    # Work items in output order: ("diff" | "new", key), with the planned entries of each
+    work, plan, item_bytes, item_fp32_bytes = [], [], {}, {}
+    for key in sorted(common_keys):
+        if key in identical_keys:
+            identical_count += 1
+            continue
+        base_info, ft_info = base_header[key], finetuned_header[key]
+        if not (base_info["dtype"] in FLOAT_DTYPE_NAMES and ft_info["dtype"] in FLOAT_DTYPE_NAMES):
             skipped_count += 1
             continue
-
-        if ft_tensor.shape != base_tensor.shape:
-            print(f"Skipping key '{key}': Shape mismatch (FT: {ft_tensor.shape}, Base: {base_tensor.shape}).")
+        if base_info["shape"] != ft_info["shape"]:
+            print(f"Skipping key '{key}': Shape mismatch (FT: {ft_info['shape']}, Base: {base_info['shape']}).")
             skipped_count += 1
             continue
+        work.append(("diff", key))
+        plan += delta_entry_plan(key, ft_info["shape"], delta_format, save_dtype, topk_ratio, delta_rank)
+        item_bytes[key] = (base_info["data_offsets"][1] - base_info["data_offsets"][0]) + (ft_info["data_offsets"][1] - ft_info["data_offsets"][0])
+        item_fp32_bytes[key] = 4 * math.prod(ft_info["shape"])
+    for key in sorted(keys_only_in_finetuned):
+        ft_info = finetuned_header[key]
+        print(f"Warning: Key '{key}' (Shape: {ft_info['shape']}, Dtype: {ft_info['dtype']}) is present in fine-tuned model but not in base model. Storing as is.")
+        work.append(("new", key))
+        # New tensors are stored whole and inserted on apply
+        plan.append((key, save_dtype if ft_info["dtype"] in FLOAT_DTYPE_NAMES else SAFETENSORS_DTYPES[ft_info["dtype"]], ft_info["shape"]))
+        item_bytes[key] = ft_info["data_offsets"][1] - ft_info["data_offsets"][0]
+        item_fp32_bytes[key] = 4 * math.prod(ft_info["shape"])
 
-        try:
-            # Calculate difference in float32 for precision, then cast to save_dtype
-            delta_tensor = ft_tensor.to(dtype=torch.float32) - base_tensor.to(dtype=torch.float32)
-            delta_state_dict[key] = delta_tensor
-            diff_count += 1
-        except Exception as e:
-            print(f"Error calculating difference for key '{key}': {e}")
-            error_count += 1
-
-    for key in keys_only_in_finetuned:
-        print(f"Warning: Key '{key}' (Shape: {finetuned_state_dict[key].shape}, Dtype: {finetuned_state_dict[key].dtype}) is present in fine-tuned model but not in base model. Storing as is.")
-        delta_state_dict[key] = finetuned_state_dict[key] # Store the tensor from the finetuned model
-        unique_to_finetuned_count += 1
-        
     if keys_only_in_base:
         print(f"\nWarning: {len(keys_only_in_base)} key(s) are present only in the base model and will not be in the delta file.")
         for key in list(keys_only_in_base)[:5]: # Print first 5 as examples
@@ -89,42 +235,113 @@ def extract_model_differences(base_model_path, finetuned_model_path, output_delt
         if len(keys_only_in_base) > 5:
             print(f"  ... and {len(keys_only_in_base) - 5} more.")
 
+    total_bytes = sum(item_bytes.values())
+    # The chunk size follows the memory budget, never the model size; 64 MiB is only a floor
+    max_inflight_bytes = max_inflight_mb << 20
+    chunks = _size_balanced_chunks(work, item_fp32_bytes, max(64 << 20, max_inflight_bytes // (2 * (workers + 1))))
+    def chunk_cost(chunk):
+        # encoded output (at most the fp32 delta) plus the fp32 ft/base/delta/rebuilt temporaries of the tensor being diffed
+        sizes = [item_fp32_bytes[key] for _, key in chunk]
+        return sum(sizes) + 3 * max(sizes)
+    chunk_queue = deque((chunk, chunk_cost(chunk)) for chunk in chunks)
+    print(f"\nCalculating differences: {len(work)} tensors ({total_bytes / 2**30:.2f} GiB read) in {len(chunks)} chunks on {workers} threads, "
+          f"at most {max_inflight_mb} MiB in flight, saving as {save_dtype_str}...")
 
+    def diff_chunk(chunk):
+        entries, errors = {}, {}
+        for kind, key in chunk:
+            ft_tensor = finetuned_model[key]
+            if kind == "new":
+                entries[key] = ft_tensor.to(dtype=save_dtype) if ft_tensor.is_floating_point() else ft_tensor
+                continue
+            # Calculate difference in float32 for precision, then encode straight to save_dtype
+            delta_tensor = ft_tensor.to(dtype=torch.float32) - base_model[key].to(dtype=torch.float32)
+            del ft_tensor
+            key_entries = encode_delta_tensor(key, delta_tensor, delta_format, save_dtype, topk_ratio, delta_rank)
+            # relative Frobenius error of what apply_model_difference will add back
+            rebuilt = decode_delta_tensor(key, key_entries.__getitem__, list(key_entries.keys()))
+            norm = float(delta_tensor.norm())
+            errors[key] = float((rebuilt - delta_tensor).norm()) / norm if norm > 0 else 0.0
+            del delta_tensor, rebuilt
+            entries.update(key_entries)
+        return entries, errors
+
+    key_errors = {}
+    # Bytes held by submitted chunks: "inflight" are estimates for chunks not yet consumed (running or finished and
+    # waiting in `pending`), "buffered" the actual encoded entries of consumed chunks not yet written
+    held = {"inflight": 0, "buffered": 0, "peak": 0}
+    buffered_entries = {}
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit_next():
+        # At most workers + 1 chunks, within the byte budget; one chunk is always allowed so work can progress
+        while chunk_queue and len(pending) < workers + 1 and \
+                (not pending or held["inflight"] + held["buffered"] + chunk_queue[0][1] <= max_inflight_bytes):
+            chunk, cost = chunk_queue.popleft()
+            held["inflight"] += cost
+            pending.append((executor.submit(diff_chunk, chunk), cost))
+        held["peak"] = max(held["peak"], held["inflight"] + held["buffered"])
+
+    def produce(name, dtype):
+        # Chunks complete in any order but are consumed in plan order
+        while name not in buffered_entries:
+            future, cost = pending.popleft()
+            entries, errors = future.result()
+            key_errors.update(errors)
+            buffered_entries.update(entries)
+            held["inflight"] -= cost
+            held["buffered"] += sum(t.numel() * t.element_size() for t in entries.values())
+            submit_next()
+        tensor = buffered_entries.pop(name)
+        held["buffered"] -= tensor.numel() * tensor.element_size()
+        return tensor
+
+    metadata = None
+    if delta_format != "float":
+        metadata = {"delta_format": delta_format, "delta_topk_ratio": str(topk_ratio), "delta_rank": str(delta_rank)}
+    try:
+        submit_next()
+        if output_delta_path and plan:
+            write_safetensors_streamed(output_delta_path, plan, produce, metadata)
+            print(f"Delta weights saved to: {output_delta_path}")
+        else:
+            for name, dtype, _ in plan:
+                produce(name, dtype)
+    except Exception as e:
+        print(f"Error calculating or saving delta weights: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        base_model.close()
+        finetuned_model.close()
+
+    diff_count = len(key_errors)
     print(f"\nDifference calculation complete.")
     print(f"  {diff_count} layers successfully diffed.")
-    print(f"  {unique_to_finetuned_count} layers unique to fine-tuned model (added as is).")
+    print(f"  {identical_count} common layers byte-identical (left out of the delta).")
+    print(f"  {len(keys_only_in_finetuned)} layers unique to fine-tuned model (added as is).")
     print(f"  {skipped_count} common layers skipped (shape/type mismatch).")
-    print(f"  {error_count} common layers had errors during diffing.")
-
-    if output_delta_path and delta_state_dict:
-        save_dtype = torch.float32 # Default
-        if save_dtype_str == "float16":
-            save_dtype = torch.float16
-        elif save_dtype_str == "bfloat16":
-            save_dtype = torch.bfloat16
-        elif save_dtype_str != "float32":
-            print(f"Warning: Invalid save_dtype '{save_dtype_str}'. Defaulting to float32.")
-            save_dtype_str = "float32" # for print message
-
-        print(f"\nPreparing to save delta weights with dtype: {save_dtype_str}")
-        
-        final_save_dict = OrderedDict()
-        for k, v_tensor in delta_state_dict.items():
-            if v_tensor.is_floating_point():
-                final_save_dict[k] = v_tensor.to(dtype=save_dtype)
-            else:
-                final_save_dict[k] = v_tensor # Keep non-float as is (e.g. int tensors if any)
-        
-        try:
-            save_file(final_save_dict, output_delta_path)
-            print(f"Delta weights saved to: {output_delta_path}")
-        except Exception as e:
-            print(f"Error saving delta weights: {e}")
-            import traceback
-            traceback.print_exc()
+    peak_rss = _peak_rss_bytes()
+    print(f"  Peak memory: ~{held['peak'] / 2**20:.1f} MiB held by chunks in flight (estimated)"
+          + (f", process peak RSS {peak_rss / 2**20:.1f} MiB." if peak_rss else "."))
 
+    if key_errors:
+        worst = sorted(key_errors.items(), key=lambda kv: kv[1], reverse=True)
+        print(f"Reconstruction error ({delta_format}): mean {sum(key_errors.values()) / len(key_errors):.3e}, max {worst[0][1]:.3e} relative Frobenius")
+        for k, err in worst[:10]:
+            print(f"  {err:.3e}  {k}")
+        if error_report_path:
+            with open(error_report_path, "w", encoding="utf-8") as f:
+                json.dump(dict(worst), f, indent=1)
+            print(f"Per-key reconstruction errors written to: {error_report_path}")
 
-    return delta_state_dict
+    return {
+        "diffed": diff_count, "identical": identical_count, "unique_to_finetuned": len(keys_only_in_finetuned),
+        "skipped": skipped_count, "written": len(plan) if output_delta_path else 0, "errors": key_errors,
+    }
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract weight differences between a fine-tuned and a base SDXL model.")
@@ -136,6 +353,23 @@ if __name__ == "__main__":
     parser.add_argument("--save_dtype", type=str, default="float32", choices=["float32", "float16", "bfloat16"],
                         help="Data type for saving the delta weights. Choose from 'float32', 'float16', 'bfloat16'. "
                              "Defaults to 'float32'.")
+    parser.add_argument("--format", type=str, default="float", choices=DELTA_FORMATS,
+                        help="Delta storage: 'float' (full deltas in --save_dtype), 'int8' (per-channel int8 + scales), "
+                             "'topk' (largest-magnitude elements only) or 'lowrank_sparse' (rank --delta_rank factors + "
+                             "top-k residual). Apply with tools/apply_model_difference.py.")
+    parser.add_argument("--topk_ratio", type=float, default=0.01,
+                        help="Fraction of elements kept per tensor by 'topk' and the residual of 'lowrank_sparse'.")
+    parser.add_argument("--delta_rank", type=int, default=32, help="Rank of the 'lowrank_sparse' factors.")
+    parser.add_argument("--error_report", type=str, default=None,
+                        help="Optional: write the per-key relative reconstruction error to this JSON file.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Threads diffing size-balanced chunks of keys. Defaults to the CPU count (at most 16).")
+    parser.add_argument("--max_inflight_mb", type=int, default=2048,
+                        help="Memory budget (MiB) for chunks being diffed or waiting to be written. Bounds peak memory "
+                             "independently of the model size. Defaults to 2048.")
+    parser.add_argument("--keep_identical", action="store_true",
+                        help="Also store (zero) deltas for layers that are byte-identical in both models. "
+                             "By default they are detected via raw-byte fingerprints and left out.")
 
     args = parser.parse_args()
 
@@ -166,10 +400,17 @@ if __name__ == "__main__":
         args.base_model_path,
         args.finetuned_model_path,
         output_delta_path=output_delta_file,
-        save_dtype_str=args.save_dtype
+        save_dtype_str=args.save_dtype,
+        skip_identical=not args.keep_identical,
+        delta_format=args.format,
+        topk_ratio=args.topk_ratio,
+        delta_rank=args.delta_rank,
+        error_report_path=args.error_report,
+        workers=args.workers,
+        max_inflight_mb=args.max_inflight_mb
     )
 
     if differences:
-        print(f"\nExtraction process finished. {len(differences)} total keys in the delta state_dict.")
+        print(f"\nExtraction process finished. {differences['written']} tensors in the delta file.")
     else:
-        print("\nCould not extract differences due to errors during model loading.")
\ No newline at end of file
+        print("\nCould not extract differences due to errors during model loading or saving.")
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Maps original (LDM / SGM) checkpoint keys to LoRA module names, so tools can work on checkpoint tensors
+without building diffusers models.
+
+Two naming schemes are in use:
+  - sd-scripts / LyCORIS networks name modules after the diffusers model ("lora_unet_down_blocks_0_...",
+    "lora_te_text_model_encoder_layers_0_...", "lora_te1_"/"lora_te2_" for SDXL).
+  - extract_loha_from_model.py names modules after the checkpoint key itself ("lora_unet_input_blocks_1_1_...").
+
+Targets are yielded as (lora_name, checkpoint_key, rows, transpose): `rows` is a (start, end) slice of dim 0
+for fused OpenCLIP q/k/v projections, `transpose` marks OpenCLIP's text_projection (stored as x @ P).
+"""
+
+LDM_UNET_PREFIX = "model.diffusion_model."
+_LDM_RESNET_LAYER_MAP = {"in_layers.2": "conv1", "out_layers.3": "conv2", "emb_layers.1": "time_emb_proj", "skip_connection": "conv_shortcut"}
+_LDM_UNET_TOP_LEVEL_MAP = {
+    "input_blocks.0.0": "conv_in", "out.2": "conv_out",
+    "time_embed.0": "time_embedding.linear_1", "time_embed.2": "time_embedding.linear_2",
+    "label_emb.0.0": "add_embedding.linear_1", "label_emb.0.2": "add_embedding.linear_2",
+}
+_OPEN_CLIP_LAYER_MAP = {"attn.out_proj": "self_attn.out_proj", "mlp.c_fc": "mlp.fc1", "mlp.c_proj": "mlp.fc2"}
+
+
+def ldm_lora_name(module_path: str) -> str:
+    """Checkpoint-style LoRA name of a module path (the naming of extract_loha_from_model.py)."""
+    if "model.diffusion_model." in module_path: return "lora_unet_" + module_path.split("model.diffusion_model.")[-1].replace(".", "_")
+    if "first_stage_model." in module_path: return "lora_vae_" + module_path.split("first_stage_model.")[-1].replace(".", "_")
+    return "lora_" + module_path.replace(".", "_")
+
+
+def ldm_unet_module_to_diffusers(module_path: str):
+    """Maps an LDM UNet module path (without `model.diffusion_model.`) to the diffusers UNet2DConditionModel module path."""
+    if module_path in _LDM_UNET_TOP_LEVEL_MAP:
+        return _LDM_UNET_TOP_LEVEL_MAP[module_path]
+    parts = module_path.split(".")
+    if parts[0] in ("input_blocks", "output_blocks") and len(parts) >= 4:
+        block_idx, layer_idx, rest = int(parts[1]), int(parts[2]), ".".join(parts[3:])
+        if parts[0] == "input_blocks":
+            level, slot, diffusers_block = (block_idx - 1) // 3, (block_idx - 1) % 3, "down_blocks"
+            if slot == 2:  # third slot of a level holds the downsampler
+                return f"down_blocks.{level}.downsamplers.0.conv" if rest == "op" else None
+        else:
+            level, slot, diffusers_block = block_idx // 3, block_idx % 3, "up_blocks"
+            if rest == "conv":  # Upsample sits after the resnet (and the attention, if any)
+                return f"up_blocks.{level}.upsamplers.0.conv"
+    elif parts[0] == "middle_block" and len(parts) >= 3:
+        layer_idx, rest, level, diffusers_block = int(parts[1]), ".".join(parts[2:]), None, "mid_block"
+        slot = layer_idx // 2  # middle_block: resnet, attention, resnet
+    else:
+        return None
+    block_path = diffusers_block if level is None else f"{diffusers_block}.{level}"
+    if rest in _LDM_RESNET_LAYER_MAP:
+        return f"{block_path}.resnets.{slot}.{_LDM_RESNET_LAYER_MAP[rest]}"
+    if layer_idx >= 1 and (rest.startswith("proj_") or rest.startswith("transformer_blocks.")):
+        return f"{block_path}.attentions.{0 if level is None else slot}.{rest}"
+    return None
+
+
+def unet_lora_targets(keys, get_shape, include_conv=True):
+    """Yields targets for the Linear/Conv2d weights of an LDM UNet, with diffusers-style names."""
+    for key in keys:
+        if not key.startswith(LDM_UNET_PREFIX) or not key.endswith(".weight"):
+            continue
+        ndim = len(get_shape(key))
+        if ndim not in (2, 4) or (ndim == 4 and not include_conv):
+            continue
+        diffusers_path = ldm_unet_module_to_diffusers(key[len(LDM_UNET_PREFIX):-len(".weight")])
+        if diffusers_path is not None:
+            yield "lora_unet_" + diffusers_path.replace(".", "_"), key, None, False
+
+
+def open_clip_lora_targets(keys, get_shape, prefix, lora_prefix, layers_to_keep):
+    """Yields targets for an OpenCLIP text transformer, using the diffusers CLIPTextModel naming (fused in_proj split into q/k/v)."""
+    for key in keys:
+        if not key.startswith(prefix + "transformer.resblocks."):
+            continue
+        parts = key[len(prefix + "transformer.resblocks."):].split(".")
+        layer, rest = int(parts[0]), ".".join(parts[1:])
+        if layer >= layers_to_keep:
+            continue
+        te_path = f"text_model.encoder.layers.{layer}"
+        if rest == "attn.in_proj_weight":
+            dim = get_shape(key)[0] // 3
+            for i, proj in enumerate(["q_proj", "k_proj", "v_proj"]):
+                yield f"{lora_prefix}{te_path}.self_attn.{proj}".replace(".", "_"), key, (i * dim, (i + 1) * dim), False
+        elif rest.endswith(".weight") and rest[:-len(".weight")] in _OPEN_CLIP_LAYER_MAP:
+            yield f"{lora_prefix}{te_path}.{_OPEN_CLIP_LAYER_MAP[rest[:-len('.weight')]]}".replace(".", "_"), key, None, False
+
+
+def hf_clip_lora_targets(keys, get_shape, prefix, lora_prefix):
+    """Yields targets for the Linear layers of a transformers CLIPTextModel stored under `prefix`."""
+    for key in keys:
+        if not key.startswith(prefix) or not key.endswith(".weight") or "embeddings" in key or len(get_shape(key)) != 2:
+            continue
+        module_path = key[len(prefix):-len(".weight")]
+        if not module_path.startswith("text_model."):  # older transformers layout without the text_model wrapper
+            module_path = "text_model." + module_path
+        yield lora_prefix + module_path.replace(".", "_"), key, None, False
+
+
+def _open_clip_layer_count(keys, prefix):
+    return 1 + max((int(k[len(prefix + "transformer.resblocks."):].split(".")[0]) for k in keys if k.startswith(prefix + "transformer.resblocks.")), default=-1)
+
+
+def text_encoder_lora_targets(keys, get_shape, is_v2, is_sdxl, drop_v2_last_layer=True):
+    """
+    Yields targets for the text encoder(s) of an SD1 / SD2 / SDXL checkpoint. SD2 uses the penultimate layer and
+    diffusers' converted text encoder drops the last one; `drop_v2_last_layer` mirrors that.
+    """
+    keys = list(keys)
+    if is_sdxl:
+        yield from hf_clip_lora_targets(keys, get_shape, "conditioner.embedders.0.transformer.", "lora_te1_")
+        te2_prefix = "conditioner.embedders.1.model."
+        yield from open_clip_lora_targets(keys, get_shape, te2_prefix, "lora_te2_", _open_clip_layer_count(keys, te2_prefix))
+        if te2_prefix + "text_projection" in keys:  # OpenCLIP stores x @ P, diffusers a Linear with weight P^T
+            yield "lora_te2_text_projection", te2_prefix + "text_projection", None, True
+    elif is_v2:
+        te_prefix = "cond_stage_model.model."
+        layers = _open_clip_layer_count(keys, te_prefix)
+        yield from open_clip_lora_targets(keys, get_shape, te_prefix, "lora_te_", layers - 1 if drop_v2_last_layer else layers)
+    else:
+        yield from hf_clip_lora_targets(keys, get_shape, "cond_stage_model.transformer.", "lora_te_")
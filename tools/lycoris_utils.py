@@ -1,7 +1,5 @@
 from typing import *
 
-import numpy as np
-
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -10,15 +8,118 @@ import torch.linalg as linalg
 
 from tqdm import tqdm
 
+from quantile_utils import fast_quantile
+
 
 def make_sparse(t: torch.Tensor, sparsity=0.95):
     abs_t = torch.abs(t)
-    np_array = abs_t.detach().cpu().numpy()
-    quan = float(np.quantile(np_array, sparsity))
+    quan = fast_quantile(abs_t, sparsity)
     sparse_t = t.masked_fill(abs_t < quan, 0)
     return sparse_t
 
 
+def index_dtype_for(max_value: int) -> torch.dtype:
+    """Smallest signed integer dtype (safetensors-compatible) that holds 0..max_value."""
+    for dtype in (torch.int8, torch.int16, torch.int32):
+        if max_value <= torch.iinfo(dtype).max:
+            return dtype
+    return torch.int64
+
+
+def encode_sparse_bias(lora_name: str, diff: torch.Tensor, sparsity=0.98, bias_format='coo'):
+    """
+    Sparsifies the 2D residual `diff` (out, -1) of a low-rank module and stores it. Formats:
+      'coo':  the original LyCORIS layout (int16 bias_indices) that other LyCORIS loaders read; refuses shapes
+              that int16 cannot index instead of silently wrapping.
+      'csr':  bias_crow (rows+1 offsets) + bias_col (column per value) + bias_values; index widths adapt to
+              nnz / column count, and a packed bit mask (bias_mask) replaces the offsets and columns when that
+              is smaller. Works for any shape, but only this repo's merge reads it.
+    """
+    return encode_sparse_residual(lora_name, make_sparse(diff.detach().cpu(), sparsity), bias_format)
+
+
+def encode_sparse_residual(lora_name: str, sparse_diff: torch.Tensor, bias_format='coo'):
+    """Stores an already sparsified 2D residual in `bias_format` (see encode_sparse_bias)."""
+    sparse_diff = sparse_diff.detach().cpu()
+    rows, cols = sparse_diff.shape
+    if bias_format == 'coo':
+        if max(rows, cols) > torch.iinfo(torch.int16).max:
+            raise ValueError(f"{lora_name}: residual of shape {tuple(sparse_diff.shape)} cannot be indexed with int16 COO; use bias_format='csr'")
+        coo = sparse_diff.to_sparse().coalesce()
+        return {
+            f'{lora_name}.bias_indices': coo.indices().to(torch.int16),
+            f'{lora_name}.bias_values': coo.values().half(),
+            f'{lora_name}.bias_size': torch.tensor(sparse_diff.shape).to(torch.int16),
+        }
+    nonzero = sparse_diff != 0
+    nnz = int(nonzero.sum())
+    result = {
+        f'{lora_name}.bias_values': sparse_diff[nonzero].half(),  # row-major order
+        f'{lora_name}.bias_size': torch.tensor([rows, cols], dtype=index_dtype_for(max(rows, cols))),
+    }
+    col_dtype, crow_dtype = index_dtype_for(cols - 1), index_dtype_for(nnz)
+    csr_bytes = nnz * col_dtype.itemsize + (rows + 1) * crow_dtype.itemsize
+    if (rows * cols + 7) // 8 < csr_bytes:
+        # dense-ish: one bit per element, little bit order, padded to a whole byte
+        bits = torch.nn.functional.pad(nonzero.flatten(), (0, (-rows * cols) % 8)).reshape(-1, 8).to(torch.uint8)
+        result[f'{lora_name}.bias_mask'] = (bits << torch.arange(8, dtype=torch.uint8)).sum(dim=1, dtype=torch.uint8)
+    else:
+        crow = torch.zeros(rows + 1, dtype=torch.int64)
+        crow[1:] = nonzero.sum(dim=1).cumsum(0)
+        result[f'{lora_name}.bias_crow'] = crow.to(crow_dtype)
+        result[f'{lora_name}.bias_col'] = nonzero.nonzero()[:, 1].to(col_dtype)
+    return result
+
+
+def get_sparse_bias(lyco_state_dict: Dict, lora_name):
+    """Returns (rows, cols, row_idx, col_idx, mask, values) for any stored bias layout, or None."""
+    values = lyco_state_dict.get(f'{lora_name}.bias_values', None)
+    if values is None:
+        return None
+    rows, cols = (int(x) for x in lyco_state_dict[f'{lora_name}.bias_size'].tolist())
+    if f'{lora_name}.bias_mask' in lyco_state_dict:
+        packed = lyco_state_dict[f'{lora_name}.bias_mask'].to(torch.uint8)
+        bits = (packed.unsqueeze(1) >> torch.arange(8, dtype=torch.uint8, device=packed.device)) & 1
+        mask = bits.flatten()[:rows * cols].bool().reshape(rows, cols)
+        return rows, cols, None, None, mask, values
+    if f'{lora_name}.bias_crow' in lyco_state_dict:
+        crow = lyco_state_dict[f'{lora_name}.bias_crow'].long()
+        row_idx = torch.repeat_interleave(torch.arange(rows, device=crow.device), crow[1:] - crow[:-1])
+        return rows, cols, row_idx, lyco_state_dict[f'{lora_name}.bias_col'].long(), None, values
+    # legacy int16 COO: undo two's-complement wrap-around of indices in 32768..65535
+    indices = lyco_state_dict[f'{lora_name}.bias_indices'].long() % 65536
+    if rows < 0 or cols < 0:
+        rows, cols = rows % 65536, cols % 65536
+    return rows, cols, indices[0], indices[1], None, values
+
+
+def apply_sparse_bias(weight: torch.Tensor, bias, scale=1):
+    """Adds a `get_sparse_bias` residual to `weight` (any shape with weight.numel() == rows * cols) in place."""
+    rows, cols, row_idx, col_idx, mask, values = bias
+    weight_2d = weight.view(rows, cols)
+    values = values.to(weight.device, dtype=weight.dtype) * scale
+    if mask is not None:
+        weight_2d[mask.to(weight.device)] += values
+    else:
+        weight_2d.index_put_((row_idx.to(weight.device), col_idx.to(weight.device)), values, accumulate=True)
+    return weight
+
+
+def convert_sparse_bias(lyco_state_dict: Dict, bias_format='csr'):
+    """
+    Re-encodes every sparse bias of a LyCORIS state dict (any stored layout) in `bias_format`, in place. The stored
+    values are kept as they are; nothing is sparsified again.
+    """
+    for values_key in [k for k in lyco_state_dict if k.endswith('.bias_values')]:
+        lora_name = values_key[:-len('.bias_values')]
+        bias = get_sparse_bias(lyco_state_dict, lora_name)
+        sparse_diff = apply_sparse_bias(torch.zeros(bias[0], bias[1], dtype=bias[5].dtype, device=bias[5].device), bias)
+        for suffix in ('bias_indices', 'bias_values', 'bias_size', 'bias_crow', 'bias_col', 'bias_mask'):
+            lyco_state_dict.pop(f'{lora_name}.{suffix}', None)
+        lyco_state_dict.update(encode_sparse_residual(lora_name, sparse_diff, bias_format))
+    return lyco_state_dict
+
+
 def extract_conv(
     weight: Union[torch.Tensor, nn.Parameter],
     mode = 'fixed',
@@ -117,7 +218,8 @@ def extract_diff(
     extract_device = 'cpu',
     use_bias = False,
     sparsity = 0.98,
-    small_conv = True
+    small_conv = True,
+    bias_format = 'coo'
 ):
     UNET_TARGET_REPLACE_MODULE = [
         "Transformer2DModel", 
@@ -211,13 +313,7 @@ def extract_diff(
                         loras[f'{lora_name}.alpha'] = torch.Tensor([extract_a.shape[0]]).half()
                         if use_bias:
                             diff = diff.detach().cpu().reshape(extract_b.size(0), -1)
-                            sparse_diff = make_sparse(diff, sparsity).to_sparse().coalesce()
-                            
-                            indices = sparse_diff.indices().to(torch.int16)
-                            values = sparse_diff.values().half()
-                            loras[f'{lora_name}.bias_indices'] = indices
-                            loras[f'{lora_name}.bias_values'] = values
-                            loras[f'{lora_name}.bias_size'] = torch.tensor(diff.shape).to(torch.int16)
+                            loras.update(encode_sparse_bias(lora_name, diff, sparsity, bias_format))
                         del extract_a, extract_b, diff
                     elif decompose_mode == 'full':
                         loras[f'{lora_name}.diff'] = weight.detach().cpu().contiguous().half()
@@ -279,13 +375,7 @@ def extract_diff(
                     loras[f'{lora_name}.alpha'] = torch.Tensor([extract_a.shape[0]]).half()
                     if use_bias:
                         diff = diff.detach().cpu().reshape(extract_b.size(0), -1)
-                        sparse_diff = make_sparse(diff, sparsity).to_sparse().coalesce()
-                        
-                        indices = sparse_diff.indices().to(torch.int16)
-                        values = sparse_diff.values().half()
-                        loras[f'{lora_name}.bias_indices'] = indices
-                        loras[f'{lora_name}.bias_values'] = values
-                        loras[f'{lora_name}.bias_size'] = torch.tensor(diff.shape).to(torch.int16)
+                        loras.update(encode_sparse_bias(lora_name, diff, sparsity, bias_format))
                     del extract_a, extract_b, diff
                 elif decompose_mode == 'full':
                     loras[f'{lora_name}.diff'] = weight.detach().cpu().contiguous().half()
@@ -318,7 +408,8 @@ def get_module(
         down = lyco_state_dict[f'{lora_name}.lora_down.weight']
         mid = lyco_state_dict.get(f'{lora_name}.lora_mid.weight', None)
         alpha = lyco_state_dict.get(f'{lora_name}.alpha', None)
-        return 'locon', (up, down, mid, alpha)
+        bias = get_sparse_bias(lyco_state_dict, lora_name)
+        return 'locon', (up, down, mid, alpha, bias)
     elif f'{lora_name}.hada_w1_a' in lyco_state_dict:
         w1a = lyco_state_dict[f'{lora_name}.hada_w1_a']
         w1b = lyco_state_dict[f'{lora_name}.hada_w1_b']
@@ -370,15 +461,18 @@ def rebuild_weight(module_type, params, orig_weight, scale=1):
         return orig_weight
     merged = orig_weight
     if module_type == 'locon':
-        up, down, mid, alpha = params
+        up, down, mid, alpha, bias = params
+        if bias is not None:
+            # the residual is stored unscaled by alpha; add it before `scale` picks up alpha/rank
+            merged = apply_sparse_bias(orig_weight.clone(), bias, scale)
         if alpha is not None:
             scale *= alpha/up.size(1)
         if mid is not None:
             rebuild = cp_weight_from_conv(up, down, mid)
         else:
             rebuild = up.reshape(up.size(0),-1) @ down.reshape(down.size(0), -1)
-        merged = orig_weight + rebuild.reshape(orig_weight.shape) * scale
-        del up, down, mid, alpha, params, rebuild
+        merged = merged + rebuild.reshape(orig_weight.shape) * scale
+        del up, down, mid, alpha, bias, params, rebuild
     elif module_type == 'hada':
         w1a, w1b, w2a, w2b, t1, t2, alpha = params
         if alpha is not None:
@@ -414,6 +508,8 @@ def rebuild_weight(module_type, params, orig_weight, scale=1):
                 w2 = cp_weight(w2a, w2b, t2)
             else:
                 w2 = w2a @ w2b
+        if w2.dim() == 4 and w1.dim() == 2:
+            w1 = w1[:, :, None, None]
         rebuild = torch.kron(w1, w2).reshape(orig_weight.shape) 
         merged = orig_weight + rebuild* scale
         del w1, w1a, w1b, w2, w2a, w2b, t1, t2, alpha, params, rebuild
@@ -485,7 +581,7 @@ def merge(
     
     if device == 'cpu':
         for k, v in tqdm(list(lyco_state_dict.items()), desc='Converting Dtype'):
-            lyco_state_dict[k] = v.float()
+            lyco_state_dict[k] = v.float() if v.is_floating_point() else v  # keep sparse-bias indices integral
     
     merge_state_dict(
         LORA_PREFIX_TEXT_ENCODER,
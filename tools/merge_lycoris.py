@@ -1,7 +1,9 @@
-import os, sys
-
-sys.path.insert(0, os.getcwd())
 import argparse
+import torch
+from tqdm import tqdm
+from lycoris_utils import get_module, rebuild_weight
+from lora_key_mapping import ldm_lora_name, text_encoder_lora_targets, unet_lora_targets
+from safetensors_io import open_state_dict, write_safetensors_streamed
 
 
 def get_args():
@@ -16,7 +18,7 @@ def get_args():
         type=str,
     )
     parser.add_argument(
-        "output_name", help="the output model", default="./out.pt", type=str
+        "output_name", help="the output model (.safetensors is written streamed, anything else as a ckpt)", default="./out.pt", type=str
     )
     parser.add_argument(
         "--is_v2",
@@ -36,44 +38,22 @@ def get_args():
         default="cpu",
         type=str,
     )
-    parser.add_argument("--dtype", help="dtype to save", default="float", type=str)
+    parser.add_argument(
+        "--dtype",
+        help="dtype to save floating-point tensors in; 'same' keeps the base model's dtypes and copies unaffected tensors byte for byte",
+        default="same",
+        type=str,
+    )
     parser.add_argument(
         "--weight", help="weight for the lyco model to merge", default="1.0", type=float
     )
     return parser.parse_args()
 
 
-args = ARGS = get_args()
-
-
-from lycoris.utils import merge
-from lycoris.kohya.model_utils import (
-    load_models_from_stable_diffusion_checkpoint,
-    save_stable_diffusion_checkpoint,
-    load_file,
-)
-from lycoris.kohya.sdxl_model_util import (
-    load_models_from_sdxl_checkpoint,
-    save_stable_diffusion_checkpoint as save_sdxl_checkpoint,
-)
-
-import torch
-
-
-@torch.no_grad()
-def main():
-    if args.is_sdxl:
-        base = load_models_from_sdxl_checkpoint(
-            None, args.base_model, map_location=args.device
-        )
-    else:
-        base = load_models_from_stable_diffusion_checkpoint(args.is_v2, args.base_model)
-    if ARGS.lycoris_model.rsplit(".", 1)[-1] == "safetensors":
-        lyco = load_file(ARGS.lycoris_model)
-    else:
-        lyco = torch.load(ARGS.lycoris_model)
-
-    dtype_str = ARGS.dtype.replace("fp", "float").replace("bf", "bfloat")
+def parse_dtype(dtype_arg):
+    if dtype_arg == "same":
+        return None
+    dtype_str = dtype_arg.replace("fp", "float").replace("bf", "bfloat")
     dtype = {
         "float": torch.float,
         "float16": torch.float16,
@@ -83,43 +63,83 @@ def main():
         "bfloat16": torch.bfloat16,
     }.get(dtype_str, None)
     if dtype is None:
-        raise ValueError(f'Cannot Find the dtype "{dtype}"')
+        raise ValueError(f'Cannot Find the dtype "{dtype_arg}"')
+    return dtype
+
+
+def map_lycoris_modules(source, lyco_modules, is_v2, is_sdxl):
+    """
+    Returns ({checkpoint key: [(lora_name, rows, transpose)]}, unmatched module names) for the modules of a LyCORIS
+    file, accepting both diffusers-style (sd-scripts/LyCORIS) and checkpoint-style (extract_loha_from_model) names.
+    """
+    keys = source.keys()
+    get_shape = lambda key: source.info(key)[1]
+    targets = list(unet_lora_targets(keys, get_shape))
+    targets += list(text_encoder_lora_targets(keys, get_shape, is_v2, is_sdxl, drop_v2_last_layer=False))
+    targets += [(ldm_lora_name(k[:-len(".weight")]), k, None, False) for k in keys if k.endswith(".weight") and len(get_shape(k)) in (2, 4)]
+    by_key, matched = {}, set()
+    for lora_name, key, rows, transpose in targets:
+        if lora_name in lyco_modules and lora_name not in matched:
+            by_key.setdefault(key, []).append((lora_name, rows, transpose))
+            matched.add(lora_name)
+    return by_key, lyco_modules - matched
+
+
+def merge_tensor(weight, targets, lyco_groups, scale, device):
+    """Adds every LyCORIS module that targets (a slice of) `weight`; returns the merged float32 tensor."""
+    merged = weight.to(device, dtype=torch.float32, copy=True)
+    for lora_name, rows, transpose in targets:
+        params = {k: v.to(device, dtype=torch.float32) if v.is_floating_point() else v.to(device) for k, v in lyco_groups[lora_name].items()}
+        part = merged[rows[0]:rows[1]] if rows else merged
+        result = rebuild_weight(*get_module(params, lora_name), part.T.contiguous() if transpose else part, scale)
+        if transpose:
+            result = result.T
+        if rows:
+            merged[rows[0]:rows[1]] = result
+        else:
+            merged = result
+    return merged
 
-    if args.is_sdxl:
-        base_tes = [base[0], base[1]]
-        base_unet = base[3]
-    else:
-        base_tes = [base[0]]
-        base_unet = base[2]
-
-    merge(base_tes, base_unet, lyco, ARGS.weight, ARGS.device)
-
-    if args.is_sdxl:
-        save_sdxl_checkpoint(
-            ARGS.output_name,
-            base[0].cpu(),
-            base[1].cpu(),
-            base[3].cpu(),
-            0,
-            0,
-            None,
-            base[2],
-            getattr(base[1], "logit_scale", None),
-            dtype,
-        )
+
+@torch.no_grad()
+def main():
+    # The base model is never loaded as a whole: headers are planned up front and tensors are read one at a time
+    source = open_state_dict(args.base_model)
+    lyco_groups = {}
+    with open_state_dict(ARGS.lycoris_model) as lyco:
+        for k, v in lyco.iter_tensors():
+            lyco_groups.setdefault(k.split(".", 1)[0], {})[k] = v
+
+    by_key, unmatched = map_lycoris_modules(source, set(lyco_groups), args.is_v2, args.is_sdxl)
+    print(f"{len(lyco_groups) - len(unmatched)} of {len(lyco_groups)} LyCORIS modules map onto {len(by_key)} checkpoint tensors.")
+    if unmatched:
+        print(f"Warning: {len(unmatched)} modules have no matching weight and are ignored, e.g. {sorted(unmatched)[:5]}")
+
+    dtype = parse_dtype(ARGS.dtype)
+    plan = []
+    for key in source.keys():
+        key_dtype, shape = source.info(key)
+        plan.append((key, dtype if dtype is not None and key_dtype.is_floating_point else key_dtype, shape))
+
+    streamed = ARGS.output_name.endswith(".safetensors")
+    pbar = tqdm(total=len(plan), desc="Merging")
+    def produce(key, out_dtype):
+        pbar.update(1)
+        if key not in by_key:
+            raw = source.get_raw(key) if streamed else None
+            if raw is not None and out_dtype == source.info(key)[0]:
+                return raw  # unaffected tensors pass through byte for byte
+            return source[key].to(out_dtype)
+        return merge_tensor(source[key], by_key[key], lyco_groups, ARGS.weight, ARGS.device).to("cpu", dtype=out_dtype)
+
+    if streamed:
+        write_safetensors_streamed(ARGS.output_name, plan, produce, source.metadata)
     else:
-        save_stable_diffusion_checkpoint(
-            ARGS.is_v2,
-            ARGS.output_name,
-            base[0].cpu(),
-            base[2].cpu(),
-            None,
-            0,
-            0,
-            dtype,
-            base[1],
-        )
+        torch.save({"state_dict": {key: produce(key, out_dtype) for key, out_dtype, _ in plan}}, ARGS.output_name)
+    pbar.close()
+    print(f"Merged model saved to: {ARGS.output_name}")
 
 
 if __name__ == "__main__":
+    args = ARGS = get_args()
     main()
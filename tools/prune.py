@@ -1,37 +1,109 @@
 import argparse
+import os
+import re
 import torch
 from tqdm import tqdm
+from safetensors_io import open_state_dict, write_safetensors_streamed
 
-parser = argparse.ArgumentParser(description="Prune a model")
-parser.add_argument("model_prune", type=str, help="Path to model to prune")
-parser.add_argument("prune_output", type=str, help="Path to pruned ckpt output")
-parser.add_argument("--half", action="store_true", help="Save weights in half precision.")
-args = parser.parse_args()
+PRECISIONS = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}
+# Named drop rules for the usual extra weights in training checkpoints
+DROP_PRESETS = {
+    "ema": r"^model_ema\.",
+    "vae": r"^first_stage_model\.",
+    "text_encoder": r"^(cond_stage_model|conditioner)\.",
+}
 
-print("Loading model...")
-model_prune = torch.load(args.model_prune)
-theta_prune = model_prune["state_dict"]
-theta = {}
 
-print("Pruning model...")
-for key in tqdm(theta_prune.keys(), desc="Pruning keys"):
-    if "model" in key:
-        theta.update({key: theta_prune[key]})
+def select_keys(keys, keep_patterns, drop_patterns):
+    """Keys matching any keep pattern and no drop pattern (regular expressions, re.search)."""
+    keep = [re.compile(p) for p in keep_patterns]
+    drop = [re.compile(p) for p in drop_patterns]
+    return [k for k in keys if any(p.search(k) for p in keep) and not any(p.search(k) for p in drop)]
 
-del theta_prune
 
-if args.half:
-    print("Halving model...")
-    state_dict = {k: v.half() for k, v in tqdm(theta.items(), desc="Halving weights")}
-else:
-    state_dict = theta
+def parse_cast_rules(rules):
+    """'PATTERN=PRECISION' strings -> [(compiled pattern, dtype)]; the first matching rule wins."""
+    parsed = []
+    for rule in rules:
+        pattern, _, precision = rule.rpartition("=")
+        if not pattern or precision not in PRECISIONS:
+            raise ValueError(f"Invalid cast rule '{rule}': expected PATTERN=PRECISION with PRECISION in {list(PRECISIONS)}")
+        parsed.append((re.compile(pattern), PRECISIONS[precision]))
+    return parsed
 
-del theta
 
-print("Saving pruned model...")
+def target_dtype(key, dtype, default_dtype, cast_rules):
+    """Output dtype of one tensor: floating-point tensors follow the cast rules, then the default; others are kept."""
+    if not dtype.is_floating_point:
+        return dtype
+    for pattern, rule_dtype in cast_rules:
+        if pattern.search(key):
+            return rule_dtype
+    return default_dtype or dtype
 
-torch.save({"state_dict": state_dict}, args.prune_output)
 
-del state_dict
+def prune_model(model_path, output_path, keep_patterns=("model",), drop_patterns=(), default_dtype=None, cast_rules=()):
+    """
+    Writes the selected tensors of `model_path` to `output_path`, cast per key.
+    A .safetensors output is streamed one tensor at a time, and tensors that keep their dtype are copied byte for
+    byte from a .safetensors input; a .ckpt output is written with torch.save and therefore holds the pruned state
+    dict in memory.
+    """
+    print("Opening model...")
+    source = open_state_dict(model_path)
+    all_keys = source.keys()
+    keys = select_keys(all_keys, keep_patterns, drop_patterns)
+    plan = []
+    for key in keys:
+        dtype, shape = source.info(key)
+        plan.append((key, target_dtype(key, dtype, default_dtype, cast_rules), shape))
+    print(f"Keeping {len(keys)} of {len(all_keys)} tensors.")
 
-print("Done pruning!")
\ No newline at end of file
+    print("Saving pruned model...")
+    streamed = output_path.endswith(".safetensors")
+    pbar = tqdm(total=len(plan), desc="Pruning keys")
+    def produce(key, dtype):
+        pbar.update(1)
+        raw = source.get_raw(key) if streamed and dtype == source.info(key)[0] else None
+        return raw if raw is not None else source[key].to(dtype)
+
+    if streamed:
+        write_safetensors_streamed(output_path, plan, produce, source.metadata)
+    else:
+        torch.save({"state_dict": {key: produce(key, dtype) for key, dtype, _ in plan}}, output_path)
+    pbar.close()
+    print(f"Input {os.path.getsize(model_path) / 2**30:.2f} GiB -> output {os.path.getsize(output_path) / 2**30:.2f} GiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune a model")
+    parser.add_argument("model_prune", type=str, help="Path to model to prune (.ckpt/.pt/.safetensors)")
+    parser.add_argument("prune_output", type=str, help="Path to pruned output; .safetensors is written streamed, anything else as a ckpt")
+    parser.add_argument("--half", action="store_true", help="Save weights in half precision (same as --precision fp16).")
+    parser.add_argument("--precision", type=str, default=None, choices=list(PRECISIONS), help="Cast all floating-point tensors to this precision (default: keep).")
+    parser.add_argument("--cast", type=str, action="append", default=[], metavar="PATTERN=PRECISION",
+                        help="Per-key precision for keys matching the regex PATTERN, e.g. 'first_stage_model\\.=fp32'. Repeatable; the first match wins over --precision.")
+    parser.add_argument("--keep", type=str, action="append", default=None, metavar="PATTERN",
+                        help="Keep keys matching this regex. Repeatable. Default: 'model' (the model, VAE and text encoder weights).")
+    parser.add_argument("--drop", type=str, action="append", default=[], metavar="PATTERN", help="Drop keys matching this regex. Repeatable.")
+    for preset, pattern in DROP_PRESETS.items():
+        parser.add_argument(f"--drop_{preset}", action="store_true", help=f"Drop {preset} keys ('{pattern}').")
+    args = parser.parse_args()
+
+    if args.half and args.precision not in (None, "fp16"):
+        parser.error("--half conflicts with --precision " + args.precision)
+    drop_patterns = args.drop + [pattern for preset, pattern in DROP_PRESETS.items() if getattr(args, f"drop_{preset}")]
+    try:
+        cast_rules = parse_cast_rules(args.cast)
+    except ValueError as e:
+        parser.error(str(e))
+
+    prune_model(
+        args.model_prune,
+        args.prune_output,
+        keep_patterns=args.keep or ["model"],
+        drop_patterns=drop_patterns,
+        default_dtype=PRECISIONS["fp16"] if args.half else PRECISIONS.get(args.precision),
+        cast_rules=cast_rules,
+    )
+    print("Done pruning!")
@@ -0,0 +1,108 @@
+"""
+Quantiles of large tensors without torch.quantile's input-size limit or a NumPy round trip.
+
+`fast_quantile` is exact (torch.kthvalue, same linear interpolation as torch.quantile / np.quantile) up to
+`max_exact_numel` elements, and above that estimates the quantile from a uniform random sample drawn on the
+tensor's own device. By the Dvoretzky-Kiefer-Wolfowitz inequality the sampled estimate lies between the true
+(q - eps) and (q + eps) quantiles with probability `confidence`, where eps = sqrt(ln(2 / (1 - confidence)) / (2 m))
+for m samples; `quantile_rank_error` returns that eps. Without an explicit generator the sample is drawn with a fixed
+seed, so identical inputs always give identical results.
+
+Run this file directly for a speed/accuracy benchmark against torch.quantile and np.quantile.
+"""
+import math
+import time
+import argparse
+
+import torch
+
+DEFAULT_MAX_EXACT_NUMEL = 1 << 24  # torch.quantile refuses inputs above 2**24 elements
+DEFAULT_SAMPLE_SIZE = 1 << 22
+DEFAULT_CONFIDENCE = 0.999
+DEFAULT_SEED = 0
+
+
+def quantile_rank_error(sample_size: int, confidence: float = DEFAULT_CONFIDENCE) -> float:
+    """DKW bound on how far (in quantile level) a sampled estimate can be from q, with probability `confidence`."""
+    return math.sqrt(math.log(2.0 / (1.0 - confidence)) / (2.0 * sample_size))
+
+
+def _exact_quantile(flat: torch.Tensor, q: float) -> float:
+    n = flat.numel()
+    pos = q * (n - 1)
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, n - 1)
+    v_lo = float(flat.kthvalue(lo + 1).values)
+    if hi == lo or pos == lo:
+        return v_lo
+    v_hi = float(flat.kthvalue(hi + 1).values)
+    return v_lo + (v_hi - v_lo) * (pos - lo)
+
+
+def fast_quantile(
+    t: torch.Tensor,
+    q: float,
+    max_exact_numel: int = DEFAULT_MAX_EXACT_NUMEL,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    generator: torch.Generator = None,
+) -> float:
+    """
+    Returns the q-quantile (0 <= q <= 1) of all elements of `t` as a Python float.
+    Exact below `max_exact_numel` elements, otherwise estimated from `sample_size` uniform samples
+    (see `quantile_rank_error` for the bound), drawn with `generator` or, if None, one seeded with DEFAULT_SEED.
+    Works on any device; half/bfloat16 CPU tensors are upcast.
+    """
+    if not 0.0 <= q <= 1.0:
+        raise ValueError(f"quantile level must be in [0, 1], got {q}")
+    flat = t.detach().reshape(-1)
+    if flat.numel() == 0:
+        raise ValueError("quantile of an empty tensor")
+    if flat.device.type == "cpu" and flat.dtype in (torch.float16, torch.bfloat16):
+        flat = flat.float()
+    if flat.numel() > max_exact_numel:
+        if generator is None:
+            generator = torch.Generator(device=flat.device).manual_seed(DEFAULT_SEED)
+        idx = torch.randint(flat.numel(), (sample_size,), device=flat.device, generator=generator)
+        flat = flat[idx]
+    return _exact_quantile(flat, q)
+
+
+def _benchmark(numels, q, device, repeats):
+    import numpy as np
+
+    print(f"device={device} q={q} exact up to {DEFAULT_MAX_EXACT_NUMEL:,} elements, "
+          f"sampled above (m={DEFAULT_SAMPLE_SIZE:,}, rank error <= {quantile_rank_error(DEFAULT_SAMPLE_SIZE):.2e} at {DEFAULT_CONFIDENCE:.1%})")
+    print(f"{'numel':>12} | {'fast_quantile':>14} | {'torch.quantile':>14} | {'np.quantile':>12} | {'rank err':>9}")
+    for numel in numels:
+        t = torch.randn(numel, device=device)
+
+        def timed(fn):
+            best = float("inf")
+            for _ in range(repeats):
+                if device.startswith("cuda"): torch.cuda.synchronize()
+                start = time.perf_counter()
+                value = fn()
+                if device.startswith("cuda"): torch.cuda.synchronize()
+                best = min(best, time.perf_counter() - start)
+            return value, best
+
+        fast_val, fast_t = timed(lambda: fast_quantile(t, q))
+        try:
+            _, torch_t = timed(lambda: float(torch.quantile(t, q)))
+            torch_col = f"{torch_t * 1e3:11.1f} ms"
+        except RuntimeError:
+            torch_col = f"{'too large':>14}"
+        ref_val, np_t = timed(lambda: float(np.quantile(t.cpu().numpy(), q)))
+        # Accuracy as the quantile level actually hit, compared to q
+        rank_err = abs(float((t <= fast_val).float().mean()) - float((t <= ref_val).float().mean()))
+        print(f"{numel:>12,} | {fast_t * 1e3:11.1f} ms | {torch_col} | {np_t * 1e3:9.1f} ms | {rank_err:9.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fast_quantile against torch.quantile and np.quantile")
+    parser.add_argument("--numel", type=int, nargs="+", default=[1 << 16, 1 << 20, 1 << 24, 1 << 26], help="Tensor sizes to test")
+    parser.add_argument("--q", type=float, default=0.99, help="Quantile level")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu", help="Device to benchmark on")
+    parser.add_argument("--repeats", type=int, default=3, help="Timing repeats (best is reported)")
+    args = parser.parse_args()
+    _benchmark(args.numel, args.q, args.device, args.repeats)
@@ -7,26 +7,22 @@
 # Thanks to cloneofsimo and kohya
 
 import argparse
+import heapq
+import json
+import os
 import torch
-from safetensors.torch import load_file, save_file, safe_open
 from tqdm import tqdm
-from library import train_util, model_util
+from library import model_util
+from safetensors_io import open_state_dict, save_safetensors
 import numpy as np
 
 MIN_SV = 1e-6
 
 def load_state_dict(file_name, dtype):
-  if model_util.is_safetensors(file_name):
-    sd = load_file(file_name)
-    with safe_open(file_name, framework="pt") as f:
-      metadata = f.metadata()
-  else:
-    sd = torch.load(file_name, map_location='cpu')
-    metadata = None
-
-  for key in list(sd.keys()):
-    if type(sd[key]) == torch.Tensor:
-      sd[key] = sd[key].to(dtype)
+  # tensors are read and cast one at a time, so the file is never resident twice
+  with open_state_dict(file_name) as reader:
+    metadata = reader.metadata
+    sd = {key: tensor.to(dtype) for key, tensor in reader.iter_tensors()}
 
   return sd, metadata
 
@@ -38,7 +34,8 @@ def save_to_file(file_name, model, state_dict, dtype, metadata):
         state_dict[key] = state_dict[key].to(dtype)
 
   if model_util.is_safetensors(file_name):
-    save_file(model, file_name, metadata)
+    # sshs_model_hash / sshs_legacy_hash are computed from the bytes as they are written
+    save_safetensors(model, file_name, metadata, sshs_hashes=True)
   else:
     torch.save(model, file_name)
 
@@ -102,6 +99,71 @@ def extract_linear(weight, lora_rank, dynamic_method, dynamic_param, device, sca
     return param_dict
 
 
+def svd_factored(lora_down, lora_up, device):
+    # lora_up @ lora_down has rank <= old rank, so QR-factor both sides and only
+    # decompose the small r x r core instead of the full out x in matrix
+    out_size = lora_up.size(0)
+    in_rank = lora_down.size(0)
+    up = lora_up.reshape(out_size, -1).to(device)
+    down = lora_down.reshape(in_rank, -1).to(device)
+
+    Q_up, R_up = torch.linalg.qr(up)
+    Q_down, R_down = torch.linalg.qr(down.T)
+    U_core, S, Vh_core = torch.linalg.svd(R_up @ R_down.T)
+
+    U = Q_up @ U_core
+    Vh = Vh_core @ Q_down.T
+
+    # pad with the zero singular values a full SVD would return so rank_resize sees the same spectrum
+    full_len = min(out_size, down.size(1))
+    if len(S) < full_len:
+        S = torch.cat([S, S.new_zeros(full_len - len(S))])
+    del up, down, Q_up, R_up, Q_down, R_down, U_core, Vh_core
+    return U, S, Vh
+
+
+def truncate_svd(U, S, Vh, param_dict, down_shape, up_shape):
+    lora_rank = param_dict["new_rank"]
+
+    # rank can exceed the number of factored components when padding zeros were selected
+    pad = lora_rank - U.size(1)
+    if pad > 0:
+        U = torch.cat([U, U.new_zeros(U.size(0), pad)], dim=1)
+        Vh = torch.cat([Vh, Vh.new_zeros(pad, Vh.size(1))], dim=0)
+
+    U = U[:, :lora_rank]
+    S = S[:lora_rank]
+    U = U @ torch.diag(S)
+    Vh = Vh[:lora_rank, :]
+
+    param_dict["lora_down"] = Vh.reshape(lora_rank, *down_shape[1:]).cpu()
+    param_dict["lora_up"] = U.reshape(up_shape[0], lora_rank, *up_shape[2:]).cpu()
+    del U, S, Vh
+    return param_dict
+
+
+def extract_factored(lora_down, lora_up, lora_rank, dynamic_method, dynamic_param, device, scale=1):
+    U, S, Vh = svd_factored(lora_down, lora_up, device)
+
+    param_dict = rank_resize(S, lora_rank, dynamic_method, dynamic_param, scale)
+    truncate_svd(U, S, Vh, param_dict, lora_down.shape, lora_up.shape)
+    del U, S, Vh
+    return param_dict
+
+
+def decompose_lora(lora_down, lora_up, device, svd_mode="full"):
+    if svd_mode == "factored":
+        return svd_factored(lora_down, lora_up, device)
+
+    if len(lora_down.size()) == 4:
+        weight = merge_conv(lora_down, lora_up, device)
+    else:
+        weight = merge_linear(lora_down, lora_up, device)
+    U, S, Vh = torch.linalg.svd(weight.reshape(weight.size(0), -1))
+    del weight
+    return U, S, Vh
+
+
 def merge_conv(lora_down, lora_up, device):
     in_rank, in_size, kernel_size, k_ = lora_down.shape
     out_size, out_rank, _, _ = lora_up.shape
@@ -181,11 +243,14 @@ def rank_resize(S, rank, dynamic_method, dynamic_param, scale=1):
     return param_dict
 
 
-def resize_lora_model(lora_sd, new_rank, save_dtype, device, dynamic_method, dynamic_param, verbose):
+def resize_lora_model(lora_sd, new_rank, save_dtype, device, dynamic_method, dynamic_param, verbose, svd_mode="full"):
+  sweep = [{"new_rank": new_rank, "dynamic_method": dynamic_method, "dynamic_param": dynamic_param}]
+  return resize_lora_model_sweep(lora_sd, sweep, save_dtype, device, verbose, svd_mode)[0]
+
+
+def get_network_dim_and_scale(lora_sd):
   network_alpha = None
   network_dim = None
-  verbose_str = "\n"
-  fro_list = []
 
   # Extract loaded lora dim and alpha
   for key, value in lora_sd.items():
@@ -198,73 +263,242 @@ def resize_lora_model(lora_sd, new_rank, save_dtype, device, dynamic_method, dyn
     if network_alpha is None:
       network_alpha = network_dim
 
-  scale = network_alpha/network_dim
+  return network_dim, network_alpha/network_dim
 
-  if dynamic_method:
-    print(f"Dynamically determining new alphas and dims based off {dynamic_method}: {dynamic_param}, max rank is {new_rank}")
 
+def iter_lora_pairs(lora_sd):
   lora_down_weight = None
   lora_up_weight = None
 
-  o_lora_sd = lora_sd.copy()
   block_down_name = None
   block_up_name = None
 
-  with torch.no_grad():
-    for key, value in tqdm(lora_sd.items()):
-      if 'lora_down' in key:
-        block_down_name = key.split(".")[0]
-        lora_down_weight = value
-      if 'lora_up' in key:
-        block_up_name = key.split(".")[0]
-        lora_up_weight = value
+  for key, value in tqdm(lora_sd.items()):
+    if 'lora_down' in key:
+      block_down_name = key.split(".")[0]
+      lora_down_weight = value
+    if 'lora_up' in key:
+      block_up_name = key.split(".")[0]
+      lora_up_weight = value
 
-      weights_loaded = (lora_down_weight is not None and lora_up_weight is not None)
+    weights_loaded = (lora_down_weight is not None and lora_up_weight is not None)
 
-      if (block_down_name == block_up_name) and weights_loaded:
+    if (block_down_name == block_up_name) and weights_loaded:
+      yield block_down_name, lora_down_weight, lora_up_weight
 
-        conv2d = (len(lora_down_weight.size()) == 4)
+      block_down_name = None
+      block_up_name = None
+      lora_down_weight = None
+      lora_up_weight = None
 
-        if conv2d:
-          full_weight_matrix = merge_conv(lora_down_weight, lora_up_weight, device)
-          param_dict = extract_conv(full_weight_matrix, new_rank, dynamic_method, dynamic_param, device, scale)
-        else:
-          full_weight_matrix = merge_linear(lora_down_weight, lora_up_weight, device)
-          param_dict = extract_linear(full_weight_matrix, new_rank, dynamic_method, dynamic_param, device, scale)
+
+def resize_lora_model_sweep(lora_sd, sweep, save_dtype, device, verbose, svd_mode="full", decompositions=None):
+  # Each layer is decomposed once and every entry of the sweep is cut from the same SVD.
+  # `decompositions` maps block name -> (U, S, Vh) computed ahead of time, e.g. by the budget allocator
+  network_dim, scale = get_network_dim_and_scale(lora_sd)
+
+  for cfg in sweep:
+    if cfg["dynamic_method"]:
+      print(f"Dynamically determining new alphas and dims based off {cfg['dynamic_method']}: {cfg['dynamic_param']}, max rank is {cfg['new_rank']}")
+
+  outputs = [{"state_dict": lora_sd.copy(), "new_alpha": None, "verbose_str": "\n", "fro_list": []} for _ in sweep]
+
+  with torch.no_grad():
+    for block_name, lora_down_weight, lora_up_weight in iter_lora_pairs(lora_sd):
+      if decompositions is not None:
+        U, S, Vh = decompositions.pop(block_name)
+      else:
+        U, S, Vh = decompose_lora(lora_down_weight, lora_up_weight, device, svd_mode)
+
+      for cfg, output in zip(sweep, outputs):
+        # per-layer ranks (budget mode) override the global rank and are never dynamic
+        new_rank = cfg["layer_ranks"][block_name] if cfg.get("layer_ranks") else cfg["new_rank"]
+        param_dict = rank_resize(S, new_rank, cfg["dynamic_method"], cfg["dynamic_param"], scale)
+        truncate_svd(U, S, Vh, param_dict, lora_down_weight.shape, lora_up_weight.shape)
 
         if verbose:
           max_ratio = param_dict['max_ratio']
           sum_retained = param_dict['sum_retained']
           fro_retained = param_dict['fro_retained']
           if not np.isnan(fro_retained):
-            fro_list.append(float(fro_retained))
+            output["fro_list"].append(float(fro_retained))
 
-          verbose_str+=f"{block_down_name:75} | "
-          verbose_str+=f"sum(S) retained: {sum_retained:.1%}, fro retained: {fro_retained:.1%}, max(S) ratio: {max_ratio:0.1f}"
+          output["verbose_str"]+=f"{block_name:75} | "
+          output["verbose_str"]+=f"sum(S) retained: {sum_retained:.1%}, fro retained: {fro_retained:.1%}, max(S) ratio: {max_ratio:0.1f}"
 
-        if verbose and dynamic_method:
-          verbose_str+=f", dynamic | dim: {param_dict['new_rank']}, alpha: {param_dict['new_alpha']}\n"
+        if verbose and (cfg["dynamic_method"] or cfg.get("layer_ranks")):
+          output["verbose_str"]+=f", dynamic | dim: {param_dict['new_rank']}, alpha: {param_dict['new_alpha']}\n"
         else:
-          verbose_str+=f"\n"
-
-        new_alpha = param_dict['new_alpha']
-        o_lora_sd[block_down_name + "." + "lora_down.weight"] = param_dict["lora_down"].to(save_dtype).contiguous()
-        o_lora_sd[block_up_name + "." + "lora_up.weight"] = param_dict["lora_up"].to(save_dtype).contiguous()
-        o_lora_sd[block_up_name + "." "alpha"] = torch.tensor(param_dict['new_alpha']).to(save_dtype)
-
-        block_down_name = None
-        block_up_name = None
-        lora_down_weight = None
-        lora_up_weight = None
-        weights_loaded = False
+          output["verbose_str"]+=f"\n"
+
+        output["new_alpha"] = param_dict['new_alpha']
+        o_lora_sd = output["state_dict"]
+        o_lora_sd[block_name + "." + "lora_down.weight"] = param_dict["lora_down"].to(save_dtype).contiguous()
+        o_lora_sd[block_name + "." + "lora_up.weight"] = param_dict["lora_up"].to(save_dtype).contiguous()
+        o_lora_sd[block_name + "." "alpha"] = torch.tensor(param_dict['new_alpha']).to(save_dtype)
         del param_dict
 
+      del U, S, Vh
+
   if verbose:
-    print(verbose_str)
+    for cfg, output in zip(sweep, outputs):
+      if len(sweep) > 1:
+        print(f"\n--- {sweep_tag(cfg)} ---")
+      print(output["verbose_str"])
 
-    print(f"Average Frobenius norm retention: {np.mean(fro_list):.2%} | std: {np.std(fro_list):0.3f}")
+      print(f"Average Frobenius norm retention: {np.mean(output['fro_list']):.2%} | std: {np.std(output['fro_list']):0.3f}")
   print("resizing complete")
-  return o_lora_sd, network_dim, new_alpha
+  return [(output["state_dict"], network_dim, output["new_alpha"]) for output in outputs]
+
+
+def estimate_header_bytes(keys, metadata):
+  # safetensors JSON header: roughly the key plus dtype/shape/offset fields per tensor
+  return sum(len(key) + 80 for key in keys) + len(json.dumps(metadata or {}))
+
+
+def allocate_rank_budget(layers, budget_params, max_rank):
+  """
+  Greedily hand out ranks across all layers by marginal Frobenius energy per parameter.
+
+  `layers` maps block name -> (S, params_per_rank). Every layer keeps at least rank 1, and each
+  further rank goes to the layer whose next singular value buys the most energy per parameter,
+  until `budget_params` is exhausted. Returns (ranks, params_used).
+  """
+  ranks = {}
+  limits = {}
+  params_used = 0
+  for block_name, (S, params_per_rank) in layers.items():
+    ranks[block_name] = 1
+    # rank_resize reads S[new_rank], so stay one below the spectrum length
+    limits[block_name] = max(1, min(max_rank, len(S) - 1))
+    params_used += params_per_rank
+
+  heap = []
+  for block_name, (S, params_per_rank) in layers.items():
+    if ranks[block_name] < limits[block_name] and S[1] > MIN_SV:
+      heapq.heappush(heap, (-float(S[1]) ** 2 / params_per_rank, block_name))
+
+  while heap:
+    _, block_name = heapq.heappop(heap)
+    S, params_per_rank = layers[block_name]
+    if params_used + params_per_rank > budget_params:
+      # a cheaper layer further down the heap may still fit
+      continue
+    ranks[block_name] += 1
+    params_used += params_per_rank
+
+    next_index = ranks[block_name]
+    if next_index < limits[block_name] and S[next_index] > MIN_SV:
+      heapq.heappush(heap, (-float(S[next_index]) ** 2 / params_per_rank, block_name))
+
+  return ranks, params_used
+
+
+def plan_rank_budget(lora_sd, metadata, max_rank, save_dtype, device, svd_mode, target_params=None, target_size_mb=None):
+  """
+  Decompose every layer once and allocate ranks globally to hit a parameter count or file size.
+  Returns (layer_ranks, decompositions, report) where decompositions can be fed back into
+  resize_lora_model_sweep so no SVD is computed twice.
+  """
+  layers = {}
+  decompositions = {}
+  shapes = {}
+  pair_keys = set()
+
+  print("Collecting singular values from all layers...")
+  with torch.no_grad():
+    for block_name, lora_down_weight, lora_up_weight in iter_lora_pairs(lora_sd):
+      U, S, Vh = decompose_lora(lora_down_weight, lora_up_weight, device, svd_mode)
+      keep = min(max_rank, U.size(1))
+      decompositions[block_name] = (U[:, :keep].clone(), S, Vh[:keep, :].clone())
+
+      out_size = lora_up_weight.size(0)
+      params_per_rank = int(np.prod(lora_down_weight.shape[1:])) + out_size * int(np.prod(lora_up_weight.shape[2:]))
+      layers[block_name] = (S.cpu(), params_per_rank)
+      shapes[block_name] = (out_size, int(np.prod(lora_down_weight.shape[1:])))
+      pair_keys.update([block_name + ".lora_down.weight", block_name + ".lora_up.weight", block_name + ".alpha"])
+      del U, Vh
+
+  # tensors that are passed through untouched, plus one alpha scalar per layer
+  fixed_params = sum(v.numel() for k, v in lora_sd.items() if k not in pair_keys and isinstance(v, torch.Tensor)) + len(layers)
+  itemsize = torch.tensor([], dtype=save_dtype).element_size()
+
+  if target_size_mb is not None:
+    header_bytes = estimate_header_bytes(set(lora_sd.keys()) | pair_keys, metadata)
+    budget_params = int((target_size_mb * 1024 * 1024 - header_bytes) // itemsize) - fixed_params
+  else:
+    budget_params = int(target_params) - fixed_params
+
+  min_params = sum(params_per_rank for _, params_per_rank in layers.values())
+  if budget_params < min_params:
+    print(f"Warning: budget is below rank 1 for every layer ({min_params + fixed_params} params); every layer is kept at rank 1")
+
+  layer_ranks, params_used = allocate_rank_budget(layers, budget_params, max_rank)
+
+  total_params = params_used + fixed_params
+  report = {
+    "layers": [],
+    "total_params": total_params,
+    "estimated_bytes": total_params * itemsize + estimate_header_bytes(set(lora_sd.keys()) | pair_keys, metadata),
+    "budget_params": budget_params + fixed_params,
+  }
+  total_energy = 0.0
+  kept_energy = 0.0
+  for block_name, (S, params_per_rank) in layers.items():
+    S_squared = S.pow(2)
+    layer_energy = float(torch.sum(S_squared))
+    layer_kept = float(torch.sum(S_squared[:layer_ranks[block_name]]))
+    total_energy += layer_energy
+    kept_energy += layer_kept
+    report["layers"].append({
+      "name": block_name,
+      "shape": shapes[block_name],
+      "rank": layer_ranks[block_name],
+      "params": layer_ranks[block_name] * params_per_rank,
+      "fro_retained": (layer_kept / layer_energy) ** 0.5 if layer_energy > 0 else 1.0,
+    })
+  report["fro_retained"] = (kept_energy / total_energy) ** 0.5 if total_energy > 0 else 1.0
+
+  return layer_ranks, decompositions, report
+
+
+def print_budget_report(report, verbose):
+  if verbose:
+    print()
+    for layer in report["layers"]:
+      out_size, in_size = layer["shape"]
+      print(f"{layer['name']:75} | {out_size}x{in_size}, rank: {layer['rank']}, params: {layer['params']}, fro retained: {layer['fro_retained']:.1%}")
+
+  ranks = [layer["rank"] for layer in report["layers"]]
+  print(f"\nBudget allocation: {len(ranks)} layers, rank min/mean/max: {min(ranks)}/{np.mean(ranks):.1f}/{max(ranks)}")
+  print(f"Parameters: {report['total_params']:,} of {report['budget_params']:,} budget")
+  print(f"Estimated file size: {report['estimated_bytes'] / 1024 / 1024:.2f} MB")
+  print(f"Overall Frobenius norm retention: {report['fro_retained']:.2%}")
+
+
+def build_sweep(new_ranks, dynamic_methods, dynamic_params):
+  # every rank x method x param combination; dynamic_param is meaningless without a method
+  sweep = []
+  for dynamic_method in (dynamic_methods or [None]):
+    for dynamic_param in ((dynamic_params or [None]) if dynamic_method else [None]):
+      for new_rank in new_ranks:
+        sweep.append({"new_rank": new_rank, "dynamic_method": dynamic_method, "dynamic_param": dynamic_param})
+  return sweep
+
+
+def sweep_tag(cfg):
+  if cfg.get("layer_ranks"):
+    return f"budget_r{cfg['new_rank']}"
+  if cfg["dynamic_method"]:
+    return f"{cfg['dynamic_method']}_{cfg['dynamic_param']:g}_r{cfg['new_rank']}"
+  return f"r{cfg['new_rank']}"
+
+
+def sweep_save_path(save_to, cfg, multiple):
+  if not multiple:
+    return save_to
+  base, ext = os.path.splitext(save_to)
+  return f"{base}_{sweep_tag(cfg)}{ext}"
 
 
 def resize(args):
@@ -289,8 +523,29 @@ def resize(args):
   print("loading Model...")
   lora_sd, metadata = load_state_dict(args.model, merge_dtype)
 
-  print("Resizing Lora...")
-  state_dict, old_dim, new_alpha = resize_lora_model(lora_sd, args.new_rank, save_dtype, args.device, args.dynamic_method, args.dynamic_param, args.verbose)
+  budget_mode = args.target_size_mb is not None or args.target_params is not None
+  decompositions = None
+  if budget_mode:
+    if args.dynamic_method:
+      raise Exception("--target_size_mb/--target_params cannot be combined with dynamic_method")
+    max_rank = max(args.new_rank)
+    layer_ranks, decompositions, report = plan_rank_budget(
+      lora_sd, metadata, max_rank, save_dtype, args.device, args.svd_mode, args.target_params, args.target_size_mb)
+    print_budget_report(report, args.verbose or args.dry_run)
+    if args.dry_run:
+      print("dry run, nothing written")
+      return
+    sweep = [{"new_rank": max_rank, "dynamic_method": None, "dynamic_param": None, "layer_ranks": layer_ranks}]
+  else:
+    if args.dry_run:
+      raise Exception("--dry_run is only supported with --target_size_mb or --target_params")
+    sweep = build_sweep(args.new_rank, args.dynamic_method, args.dynamic_param)
+  multiple = len(sweep) > 1
+  if multiple:
+    print(f"Resizing Lora to {len(sweep)} variants: {', '.join(sweep_tag(cfg) for cfg in sweep)}")
+  else:
+    print("Resizing Lora...")
+  results = resize_lora_model_sweep(lora_sd, sweep, save_dtype, args.device, args.verbose, args.svd_mode, decompositions)
 
   # update metadata
   if metadata is None:
@@ -298,21 +553,25 @@ def resize(args):
 
   comment = metadata.get("ss_training_comment", "")
 
-  if not args.dynamic_method:
-    metadata["ss_training_comment"] = f"dimension is resized from {old_dim} to {args.new_rank}; {comment}"
-    metadata["ss_network_dim"] = str(args.new_rank)
-    metadata["ss_network_alpha"] = str(new_alpha)
-  else:
-    metadata["ss_training_comment"] = f"Dynamic resize with {args.dynamic_method}: {args.dynamic_param} from {old_dim}; {comment}"
-    metadata["ss_network_dim"] = 'Dynamic'
-    metadata["ss_network_alpha"] = 'Dynamic'
-
-  model_hash, legacy_hash = train_util.precalculate_safetensors_hashes(state_dict, metadata)
-  metadata["sshs_model_hash"] = model_hash
-  metadata["sshs_legacy_hash"] = legacy_hash
+  for cfg, (state_dict, old_dim, new_alpha) in zip(sweep, results):
+    variant_metadata = dict(metadata)
+    if cfg.get("layer_ranks"):
+      budget = f"{args.target_size_mb} MB" if args.target_size_mb is not None else f"{args.target_params} params"
+      variant_metadata["ss_training_comment"] = f"Budget resize to {budget} (max rank {cfg['new_rank']}) from {old_dim}; {comment}"
+      variant_metadata["ss_network_dim"] = 'Dynamic'
+      variant_metadata["ss_network_alpha"] = 'Dynamic'
+    elif not cfg["dynamic_method"]:
+      variant_metadata["ss_training_comment"] = f"dimension is resized from {old_dim} to {cfg['new_rank']}; {comment}"
+      variant_metadata["ss_network_dim"] = str(cfg["new_rank"])
+      variant_metadata["ss_network_alpha"] = str(new_alpha)
+    else:
+      variant_metadata["ss_training_comment"] = f"Dynamic resize with {cfg['dynamic_method']}: {cfg['dynamic_param']} from {old_dim}; {comment}"
+      variant_metadata["ss_network_dim"] = 'Dynamic'
+      variant_metadata["ss_network_alpha"] = 'Dynamic'
 
-  print(f"saving model to: {args.save_to}")
-  save_to_file(args.save_to, state_dict, state_dict, save_dtype, metadata)
+    save_path = sweep_save_path(args.save_to, cfg, multiple)
+    print(f"saving model to: {save_path}")
+    save_to_file(save_path, state_dict, state_dict, save_dtype, variant_metadata)
 
 
 if __name__ == '__main__':
@@ -320,19 +579,27 @@ if __name__ == '__main__':
 
   parser.add_argument("--save_precision", type=str, default=None,
                       choices=[None, "float", "fp16", "bf16"], help="precision in saving, float if omitted / 保存時の精度、未指定時はfloat")
-  parser.add_argument("--new_rank", type=int, default=4,
-                      help="Specify rank of output LoRA / 出力するLoRAのrank (dim)")
+  parser.add_argument("--new_rank", type=int, nargs="+", default=[4],
+                      help="Specify rank of output LoRA, several ranks write one file each / 出力するLoRAのrank (dim)")
   parser.add_argument("--save_to", type=str, default=None,
-                      help="destination file name: ckpt or safetensors file / 保存先のファイル名、ckptまたはsafetensors")
+                      help="destination file name: ckpt or safetensors file, suffixed per variant when sweeping / 保存先のファイル名、ckptまたはsafetensors")
   parser.add_argument("--model", type=str, default=None,
                       help="LoRA model to resize at to new rank: ckpt or safetensors file / 読み込むLoRAモデル、ckptまたはsafetensors")
   parser.add_argument("--device", type=str, default=None, help="device to use, cuda for GPU / 計算を行うデバイス、cuda でGPUを使う")
   parser.add_argument("--verbose", action="store_true", 
                       help="Display verbose resizing information / rank変更時の詳細情報を出力する")
-  parser.add_argument("--dynamic_method", type=str, default=None, choices=[None, "sv_ratio", "sv_fro", "sv_cumulative"],
-                      help="Specify dynamic resizing method, --new_rank is used as a hard limit for max rank")
-  parser.add_argument("--dynamic_param", type=float, default=None,
-                      help="Specify target for dynamic reduction")
+  parser.add_argument("--dynamic_method", type=str, nargs="+", default=None, choices=["sv_ratio", "sv_fro", "sv_cumulative"],
+                      help="Specify dynamic resizing method(s), --new_rank is used as a hard limit for max rank")
+  parser.add_argument("--dynamic_param", type=float, nargs="+", default=None,
+                      help="Specify target(s) for dynamic reduction, every method/param/rank combination is written")
+  parser.add_argument("--svd_mode", type=str, default="full", choices=["full", "factored"],
+                      help="full: SVD of the merged up@down weight. factored: QR-factor lora_up/lora_down and SVD only the small rank x rank core (same result, much faster)")
+  parser.add_argument("--target_size_mb", type=float, default=None,
+                      help="Allocate ranks across all layers to fit this output file size in MB, --new_rank is the per-layer max rank")
+  parser.add_argument("--target_params", type=int, default=None,
+                      help="Allocate ranks across all layers to keep the total parameter count under this value, --new_rank is the per-layer max rank")
+  parser.add_argument("--dry_run", action="store_true",
+                      help="With --target_size_mb/--target_params, print the rank allocation report without writing weights")
                                            
 
   args = parser.parse_args()
@@ -0,0 +1,447 @@
+"""
+Streaming .safetensors I/O shared by the tools.
+
+SafetensorsReader is a lazy, dict-like view of a file. The JSON header is parsed once, and a tensor is read from
+the memory-mapped file only when it is accessed. iter_tensors() reads the next tensors on a background thread
+while the caller works on the current one. open_state_dict() gives .ckpt/.pt files the same interface through a
+memory-mapped torch.load.
+
+SafetensorsWriter fixes the file layout up front from the declared (name, dtype, shape) of every tensor. It writes
+the header first, then appends each tensor's bytes as they are produced. A read-modify-write tool therefore holds
+about one tensor at a time (plus the prefetch depth) rather than the whole input and output state dicts.
+
+The files are the same as safetensors.torch writes. save_safetensors() is a drop-in for save_file() and orders
+the tensors the same way.
+
+With sshs_hashes=True, the writer also computes the sshs_model_hash/sshs_legacy_hash metadata that sd-scripts
+stores in LoRA files. The hashes are updated as the bytes are written and filled into space reserved in the header
+on close, so the tensors are not serialized a second time. `python safetensors_io.py verify FILE...` recomputes
+them for existing files.
+"""
+import os
+import sys
+import json
+import mmap
+import hashlib
+import logging
+import argparse
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from safetensors import safe_open
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8, "BOOL": torch.bool,
+}
+for _name, _attr in (("F8_E4M3", "float8_e4m3fn"), ("F8_E5M2", "float8_e5m2")):
+    if hasattr(torch, _attr):
+        SAFETENSORS_DTYPES[_name] = getattr(torch, _attr)
+SAFETENSORS_DTYPE_NAMES = {v: k for k, v in SAFETENSORS_DTYPES.items()}
+FLOAT_DTYPE_NAMES = {name for name, dtype in SAFETENSORS_DTYPES.items() if dtype.is_floating_point}
+# Declaration order of safetensors' Dtype enum; save_file() writes the largest first, then sorts by name
+_SAFETENSORS_DTYPE_ORDER = ["BOOL", "U8", "I8", "F8_E5M2", "F8_E4M3", "I16", "U16", "F16", "BF16", "I32", "U32", "F32", "F64", "I64", "U64"]
+SSHS_KEYS = ("sshs_model_hash", "sshs_legacy_hash")
+_SSHS_LEGACY_WINDOW = (0x100000, 0x110000)
+
+
+def read_safetensors_header(path: str) -> tuple[dict, int]:
+    """Returns (header, data_start): the parsed JSON header and the file offset where tensor data begins."""
+    with open(path, "rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        if header_len > os.fstat(f.fileno()).st_size - 8:
+            raise ValueError(f"{path} is not a safetensors file (header length {header_len} exceeds the file size)")
+        header = json.loads(f.read(header_len))
+    return header, 8 + header_len
+
+
+def tensor_nbytes(dtype: torch.dtype, shape) -> int:
+    nbytes = torch.empty((), dtype=dtype).element_size()
+    for d in shape:
+        nbytes *= d
+    return nbytes
+
+
+def tensor_buffer(tensor: torch.Tensor):
+    """The bytes of a tensor as a buffer (a uint8 numpy view of a CPU copy only if one is needed)."""
+    return tensor.detach().to("cpu").contiguous().reshape(-1).view(torch.uint8).numpy()
+
+
+def safetensors_order(plan):
+    """Sorts a [(name, dtype, shape)] plan the way safetensors.torch.save_file lays tensors out."""
+    rank = lambda dtype: _SAFETENSORS_DTYPE_ORDER.index(SAFETENSORS_DTYPE_NAMES[dtype])
+    return sorted(plan, key=lambda entry: (-rank(entry[1]), entry[0]))
+
+
+class SafetensorsReader(Mapping):
+    """
+    Read-only mapping over a .safetensors file. Shapes, dtypes and metadata come from the header; tensors are
+    read on access. Each thread gets its own safe_open handle, so one reader can be shared by a thread pool.
+    """
+    def __init__(self, path: str, device: str = "cpu"):
+        self.path = path
+        self.device = device
+        self.header, self.data_start = read_safetensors_header(path)
+        self.metadata = self.header.pop("__metadata__", None)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._handles = []
+        self._mmap, self._view = None, None
+
+    def _handle(self):
+        handle = getattr(self._local, "handle", None)
+        if handle is None:
+            handle = self._local.handle = safe_open(self.path, framework="pt", device=self.device)
+            with self._lock:
+                self._handles.append(handle)
+        return handle
+
+    def __getitem__(self, key: str) -> torch.Tensor:
+        if key not in self.header:
+            raise KeyError(key)
+        return self._handle().get_tensor(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.header
+
+    def __iter__(self):
+        return iter(self.header)
+
+    def __len__(self) -> int:
+        return len(self.header)
+
+    def get_shape(self, key: str) -> tuple:
+        return tuple(self.header[key]["shape"])
+
+    def get_dtype(self, key: str) -> torch.dtype:
+        return SAFETENSORS_DTYPES[self.header[key]["dtype"]]
+
+    def info(self, key: str):
+        """(dtype, shape) without reading the tensor."""
+        return self.get_dtype(key), list(self.header[key]["shape"])
+
+    def nbytes(self, key: str) -> int:
+        begin, end = self.header[key]["data_offsets"]
+        return end - begin
+
+    def get_rows(self, key: str, start: int, end: int) -> torch.Tensor:
+        """Rows start:end (dim 0) of a tensor; only those bytes are read."""
+        return self._handle().get_slice(key)[start:end]
+
+    def get_raw(self, key: str):
+        """The stored bytes of a tensor: a memoryview into the mapped file, valid until close()."""
+        if self._view is None:
+            with self._lock:
+                if self._view is None:
+                    with open(self.path, "rb") as f:
+                        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._view = memoryview(self._mmap)
+        begin, end = self.header[key]["data_offsets"]
+        return self._view[self.data_start + begin:self.data_start + end]
+
+    def iter_tensors(self, keys=None, prefetch: int = 2):
+        """Yields (key, tensor) for `keys` (default: all), reading up to `prefetch` tensors ahead on a background thread."""
+        keys = list(self.header) if keys is None else list(keys)
+        if prefetch <= 0:
+            for key in keys:
+                yield key, self[key]
+            return
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = [executor.submit(self.__getitem__, key) for key in keys[:prefetch]]
+            for i, key in enumerate(keys):
+                tensor = pending.pop(0).result()
+                if i + prefetch < len(keys):
+                    pending.append(executor.submit(self.__getitem__, keys[i + prefetch]))
+                yield key, tensor
+
+    def close(self):
+        """Drops the file handles. Tensors already read stay valid; raw views may keep the mapping alive."""
+        with self._lock:
+            self._handles.clear()
+            self._local = threading.local()
+            if self._view is not None:
+                try:
+                    self._view.release()
+                    self._mmap.close()
+                except BufferError:  # raw slices still in use; the mapping is freed with them
+                    pass
+                self._mmap, self._view = None, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CheckpointReader(Mapping):
+    """
+    The SafetensorsReader interface for .ckpt/.pt files. They are memory-mapped with torch.load(mmap=True) where
+    the format allows it. Only the tensors of the state dict are exposed; optimizer state and other top-level
+    entries are never touched.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.metadata = None
+        try:
+            checkpoint = torch.load(path, map_location="cpu", mmap=True)
+        except Exception as e:  # legacy (pre zip-format) checkpoints cannot be memory-mapped
+            logger.warning(f"Memory-mapped load of {path} not possible ({e}); loading fully.")
+            checkpoint = torch.load(path, map_location="cpu")
+        state_dict = checkpoint.get("state_dict", checkpoint) if isinstance(checkpoint, dict) else checkpoint
+        self._state_dict = {k: v for k, v in state_dict.items() if isinstance(v, torch.Tensor)}
+        if len(self._state_dict) != len(state_dict):
+            logger.warning(f"Ignoring {len(state_dict) - len(self._state_dict)} non-tensor state dict entries of {path}.")
+
+    def __getitem__(self, key: str) -> torch.Tensor:
+        return self._state_dict[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._state_dict
+
+    def __iter__(self):
+        return iter(self._state_dict)
+
+    def __len__(self) -> int:
+        return len(self._state_dict)
+
+    def get_shape(self, key: str) -> tuple:
+        return tuple(self._state_dict[key].shape)
+
+    def get_dtype(self, key: str) -> torch.dtype:
+        return self._state_dict[key].dtype
+
+    def info(self, key: str):
+        return self.get_dtype(key), list(self.get_shape(key))
+
+    def nbytes(self, key: str) -> int:
+        return tensor_nbytes(*self.info(key))
+
+    def get_rows(self, key: str, start: int, end: int) -> torch.Tensor:
+        return self._state_dict[key][start:end]
+
+    def get_raw(self, key: str):
+        """Not available for pickled checkpoints; callers fall back to the tensor."""
+        return None
+
+    def iter_tensors(self, keys=None, prefetch: int = 2):
+        for key in (self._state_dict if keys is None else keys):
+            yield key, self._state_dict[key]
+
+    def close(self):
+        self._state_dict = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_state_dict(path: str):
+    """A lazy reader for a .safetensors, .ckpt or .pt file."""
+    return SafetensorsReader(path) if path.endswith(".safetensors") else CheckpointReader(path)
+
+
+def _encode_header(header: dict) -> bytes:
+    # Compact, non-ASCII kept as UTF-8 and padded to 8 bytes, byte for byte what safetensors writes
+    header_bytes = json.dumps(header, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 8)
+    return len(header_bytes).to_bytes(8, "little") + header_bytes
+
+
+def _tensor_entries(plan) -> dict:
+    entries, offset = {}, 0
+    for name, dtype, shape in plan:
+        nbytes = tensor_nbytes(dtype, shape)
+        entries[name] = {"dtype": SAFETENSORS_DTYPE_NAMES[dtype], "shape": list(shape), "data_offsets": [offset, offset + nbytes]}
+        offset += nbytes
+    return entries
+
+
+def build_safetensors_header(plan, metadata=None) -> bytes:
+    """The length-prefixed, 8-byte aligned header for a [(name, dtype, shape)] plan laid out in order."""
+    header = {}
+    if metadata:
+        for k, v in metadata.items():
+            if not isinstance(k, str) or not isinstance(v, str):
+                raise ValueError(f"safetensors metadata must map str to str, got {k!r}: {type(v).__name__}")
+        header["__metadata__"] = metadata
+    header.update(_tensor_entries(plan))
+    return _encode_header(header)
+
+
+class SSHSHasher:
+    """
+    Incremental sshs_model_hash/sshs_legacy_hash, as sd-scripts' train_util.precalculate_safetensors_hashes defines
+    them. Both refer to the file safetensors would write for the same tensors with only the ss_* metadata. The model
+    hash is the sha256 of the tensor data. The legacy hash is the first 8 hex digits of the sha256 of file bytes
+    0x100000-0x110000, so it also depends on the length of that file's header.
+    Feed the data in file order with update(); the results match sd-scripts when the tensors are laid out in
+    safetensors_order().
+    """
+    def __init__(self, tensor_entries: dict, metadata=None):
+        ss_metadata = {k: v for k, v in (metadata or {}).items() if k.startswith("ss_")}
+        self._model = hashlib.sha256()
+        self._legacy = hashlib.sha256()
+        self._pos = 0  # offset in that file
+        self._update_legacy(memoryview(_encode_header({"__metadata__": ss_metadata, **tensor_entries})))
+
+    def _update_legacy(self, buf):
+        begin, end = max(self._pos, _SSHS_LEGACY_WINDOW[0]), min(self._pos + len(buf), _SSHS_LEGACY_WINDOW[1])
+        if begin < end:
+            self._legacy.update(buf[begin - self._pos:end - self._pos])
+        self._pos += len(buf)
+
+    def update(self, data):
+        buf = memoryview(data).cast("B")
+        self._model.update(buf)
+        self._update_legacy(buf)
+
+    def hexdigests(self) -> dict:
+        return {"sshs_model_hash": self._model.hexdigest(), "sshs_legacy_hash": self._legacy.hexdigest()[:8]}
+
+
+class SafetensorsWriter:
+    """
+    Writes a .safetensors file whose layout is declared up front as a [(name, dtype, shape)] plan. open() writes
+    the header; write(name, data) then appends the tensors in plan order. data is a tensor of the declared dtype
+    and shape, or its already-encoded bytes (any buffer), which are copied through unchanged.
+    Output goes to `<path>.part`. close() checks that every tensor was written and renames the file to `path`;
+    abort() (or an exception in a `with` block) removes it.
+    With sshs_hashes=True the header reserves the sshs_* metadata values, which close() fills in from the bytes
+    written; they are then also available as `hashes`.
+    """
+    def __init__(self, path: str, plan, metadata=None, sshs_hashes: bool = False):
+        self.path = path
+        self.part_path = path + ".part"
+        self.plan = [(name, dtype, list(shape)) for name, dtype, shape in plan]
+        self.metadata = dict(metadata or {})
+        self.hashes = None
+        self._hasher = None
+        self._hash_offsets = {}
+        self._file = None
+        self._next = 0
+        if sshs_hashes:
+            self._hasher = SSHSHasher(_tensor_entries(self.plan), self.metadata)
+            self.metadata.update({"sshs_model_hash": "0" * 64, "sshs_legacy_hash": "0" * 8})
+
+    def open(self):
+        self._file = open(self.part_path, "wb")
+        try:
+            header = build_safetensors_header(self.plan, self.metadata)
+            for key in SSHS_KEYS if self._hasher is not None else ():
+                marker = f'"{key}":"'.encode("utf-8")
+                self._hash_offsets[key] = header.index(marker) + len(marker)
+            self._file.write(header)
+        except BaseException:
+            self.abort()
+            raise
+        return self
+
+    def write(self, name: str, data):
+        if self._next >= len(self.plan):
+            raise ValueError(f"'{name}': all {len(self.plan)} planned tensors are already written")
+        planned_name, dtype, shape = self.plan[self._next]
+        if name != planned_name:
+            raise ValueError(f"'{name}' written out of order; expected '{planned_name}'")
+        if isinstance(data, torch.Tensor):
+            if list(data.shape) != shape or data.dtype != dtype:
+                raise ValueError(f"'{name}': produced {data.dtype} {list(data.shape)}, planned {dtype} {shape}")
+            data = tensor_buffer(data)
+        else:
+            size, expected = len(memoryview(data).cast("B")), tensor_nbytes(dtype, shape)
+            if size != expected:
+                raise ValueError(f"'{name}': produced {size} bytes, planned {expected}")
+        self._file.write(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
+        self._next += 1
+
+    def close(self):
+        if self._next != len(self.plan):
+            self.abort()
+            raise ValueError(f"Only {self._next} of {len(self.plan)} planned tensors were written to {self.path}")
+        if self._hasher is not None:
+            self.hashes = self._hasher.hexdigests()
+            for key, offset in self._hash_offsets.items():
+                self._file.seek(offset)
+                self._file.write(self.hashes[key].encode("ascii"))
+        self._file.close()
+        self._file = None
+        os.replace(self.part_path, self.path)
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_safetensors_streamed(output_path: str, plan, produce, metadata=None, sshs_hashes: bool = False):
+    """
+    Writes `plan` [(name, dtype, shape)] as a .safetensors file, calling produce(name, dtype) for one tensor at a time.
+    Returns the sshs_* hashes written into the metadata if sshs_hashes is set, else None.
+    """
+    with SafetensorsWriter(output_path, plan, metadata, sshs_hashes) as writer:
+        for name, dtype, _ in writer.plan:
+            writer.write(name, produce(name, dtype))
+    return writer.hashes
+
+
+def save_safetensors(state_dict, path: str, metadata=None, sshs_hashes: bool = False):
+    """
+    Drop-in for safetensors.torch.save_file. Tensors are written one at a time rather than serialized into a single
+    buffer first. `state_dict` may be any mapping, including a lazy reader, whose tensors are then read on demand.
+    """
+    if hasattr(state_dict, "info"):  # lazy readers know dtypes and shapes without reading
+        plan = [(name, *state_dict.info(name)) for name in state_dict]
+    else:
+        plan = [(name, tensor.dtype, tensor.shape) for name, tensor in state_dict.items()]
+    return write_safetensors_streamed(path, safetensors_order(plan), lambda name, dtype: state_dict[name], metadata, sshs_hashes)
+
+
+def verify_sshs_hashes(path: str) -> dict:
+    """Recomputes the sshs_* hashes of a .safetensors file in one pass over its data. Returns {key: (stored, computed)}."""
+    header, data_start = read_safetensors_header(path)
+    metadata = header.pop("__metadata__", None) or {}
+    entries = dict(sorted(header.items(), key=lambda item: item[1]["data_offsets"][0]))
+    hasher = SSHSHasher(entries, metadata)
+    with open(path, "rb") as f:
+        f.seek(data_start)
+        for block in iter(lambda: f.read(1 << 24), b""):
+            hasher.update(block)
+    return {key: (metadata.get(key), value) for key, value in hasher.hexdigests().items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming safetensors utilities.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    verify_parser = subparsers.add_parser("verify", help="Recompute sshs_model_hash/sshs_legacy_hash and compare them with the stored metadata.")
+    verify_parser.add_argument("files", nargs="+", help=".safetensors files to check")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.files:
+        results = verify_sshs_hashes(path)
+        if all(stored is None for stored, _ in results.values()):
+            print(f"{path}: no sshs hashes stored (computed {', '.join(f'{k}={v}' for k, (_, v) in results.items())})")
+            continue
+        mismatched = [k for k, (stored, computed) in results.items() if stored != computed]
+        failed += bool(mismatched)
+        print(f"{path}: " + ("OK" if not mismatched else "MISMATCH " + ", ".join(f"{k} stored {results[k][0]} computed {results[k][1]}" for k in mismatched)))
+    sys.exit(1 if failed else 0)
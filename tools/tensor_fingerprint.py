@@ -0,0 +1,93 @@
+"""
+Per-tensor fingerprints of .safetensors files, hashed from the raw bytes of the memory-mapped file.
+
+Nothing is converted to another dtype or copied, so finding byte-identical layers between two checkpoints costs
+one sequential read of each file, and nothing at all once the fingerprints are cached. Fingerprints are stored
+next to the model in a `<model>.fingerprints.json` sidecar that is valid while the file's size and mtime are
+unchanged. A fingerprint covers dtype, shape and data, so tensors only match if they are stored identically.
+Other formats (.ckpt/.pt) are not fingerprinted; callers then fall back to comparing values.
+
+Uses xxhash (xxh3_128) when it is installed, otherwise hashlib's blake2b.
+"""
+import os
+import json
+import mmap
+import hashlib
+from safetensors_io import read_safetensors_header
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+SIDECAR_SUFFIX = ".fingerprints.json"
+HASH_NAME = "xxh3_128" if xxhash is not None else "blake2b-128"
+
+
+def _hash_buffer(buf) -> str:
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(buf)
+    return hashlib.blake2b(buf, digest_size=16).hexdigest()
+
+
+def _compute_fingerprints(path: str, keys) -> dict:
+    header, data_start = read_safetensors_header(path)
+    fingerprints = {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            for key in keys:
+                info = header.get(key)
+                if info is None or key == "__metadata__":
+                    continue
+                begin, end = info["data_offsets"]
+                digest = _hash_buffer(view[data_start + begin:data_start + end])
+                fingerprints[key] = f"{info['dtype']}|{','.join(str(d) for d in info['shape'])}|{digest}"
+        finally:
+            view.release()
+    return fingerprints
+
+
+def load_tensor_fingerprints(path: str, keys=None, use_sidecar: bool = True) -> dict:
+    """
+    Returns {key: fingerprint} for `keys` (default: all tensors) of a .safetensors file, or {} for other formats.
+    Missing fingerprints are computed and added to the sidecar; an unwritable directory only disables caching.
+    """
+    if not path.endswith(".safetensors"):
+        return {}
+    st = os.stat(path)
+    sidecar_path = path + SIDECAR_SUFFIX
+    cached = {}
+    if use_sidecar and os.path.exists(sidecar_path):
+        try:
+            with open(sidecar_path, "r", encoding="utf-8") as f:
+                sidecar = json.load(f)
+            if sidecar.get("size") == st.st_size and sidecar.get("mtime_ns") == st.st_mtime_ns and sidecar.get("hash") == HASH_NAME:
+                cached = sidecar.get("tensors", {})
+        except (OSError, ValueError):
+            cached = {}
+    if keys is None:
+        keys = [k for k in read_safetensors_header(path)[0] if k != "__metadata__"]
+    missing = [k for k in keys if k not in cached]
+    if missing:
+        cached.update(_compute_fingerprints(path, missing))
+        if use_sidecar:
+            try:
+                with open(sidecar_path + ".part", "w", encoding="utf-8") as f:
+                    json.dump({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": HASH_NAME, "tensors": cached}, f)
+                os.replace(sidecar_path + ".part", sidecar_path)
+            except OSError:
+                pass
+    return {k: cached[k] for k in keys if k in cached}
+
+
+def identical_tensor_keys(path_a: str, path_b: str, keys=None, use_sidecar: bool = True) -> set:
+    """Keys (among `keys`, default all shared ones) whose tensors are byte-identical in both files."""
+    if not (path_a.endswith(".safetensors") and path_b.endswith(".safetensors")):
+        return set()
+    if keys is None:
+        keys_b = set(read_safetensors_header(path_b)[0])
+        keys = [k for k in read_safetensors_header(path_a)[0] if k in keys_b and k != "__metadata__"]
+    fingerprints_a = load_tensor_fingerprints(path_a, keys, use_sidecar)
+    fingerprints_b = load_tensor_fingerprints(path_b, keys, use_sidecar)
+    return {k for k, fp in fingerprints_a.items() if fingerprints_b.get(k) == fp}